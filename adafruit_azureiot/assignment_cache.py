@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`assignment_cache`
+=====================
+
+Remembers the IoT Hub that the Device Provisioning Service assigned each device to, so later
+connections can go straight to the hub. Registering with DPS means a TLS handshake with DPS and
+waiting for the assignment, which takes several seconds, and the assignment rarely changes.
+
+Assignments are keyed by ID scope and device ID, and can be saved to a file so they survive a
+restart. They are used until they are older than the time to live, or until the hub rejects the
+device, when the device registers with DPS again.
+
+On CircuitPython the filesystem is read-only to code unless ``boot.py`` remounts it, so saving can
+fail. The cache then keeps working in memory.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Dict, Optional
+except ImportError:
+    pass
+
+import json
+import time
+
+
+class AssignmentCache:
+    """The IoT Hub assigned to each device by DPS, optionally saved to a file"""
+
+    def __init__(self, path: str = None, ttl: float = 7 * 24 * 60 * 60):
+        """Creates the cache, loading any saved assignments
+
+        :param str path: The file to save assignments to, such as ``"/dps_cache.json"``, or None
+            to only keep them in memory
+        :param float ttl: How long an assignment is used for before registering again, in
+            seconds, defaults to 7 days
+        """
+        self.path = path
+        self.ttl = ttl
+        self._assignments: Dict[str, dict] = {}
+        self._load()
+
+    @staticmethod
+    def _key(id_scope: str, device_id: str) -> str:
+        return id_scope + "/" + device_id
+
+    def _load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                assignments = json.load(file)
+        except (OSError, ValueError):
+            # No cache yet, or it is damaged, so start again
+            return
+        if isinstance(assignments, dict):
+            self._assignments = assignments
+
+    def _save(self) -> bool:
+        if self.path is None:
+            return True
+        try:
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump(self._assignments, file)
+        except OSError:
+            # The filesystem may be read-only, so keep the assignments in memory
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._assignments)
+
+    def get(self, id_scope: str, device_id: str, now: float = None) -> Optional[str]:
+        """Gets the hub assigned to a device, if it was assigned within the time to live
+
+        :param str id_scope: The ID scope of the device
+        :param str device_id: The device ID
+        :param float now: The current time from ``time.time()``
+        :returns: The hostname of the hub, or None if the device needs to register
+        :rtype: str
+        """
+        assignment = self._assignments.get(self._key(id_scope, device_id))
+        if assignment is None:
+            return None
+
+        if now is None:
+            now = time.time()
+        age = now - assignment.get("assigned_at", 0)
+        # A negative age means the clock was changed, so the age is not known
+        if age < 0 or age >= self.ttl:
+            return None
+        return assignment.get("hub")
+
+    def put(self, id_scope: str, device_id: str, hub: str, now: float = None) -> bool:
+        """Saves the hub a device was assigned to
+
+        :param str id_scope: The ID scope of the device
+        :param str device_id: The device ID
+        :param str hub: The hostname of the hub
+        :param float now: The current time from ``time.time()``
+        :returns: True if the assignment was saved, False if it could only be kept in memory
+        :rtype: bool
+        """
+        self._assignments[self._key(id_scope, device_id)] = {
+            "hub": hub,
+            "assigned_at": time.time() if now is None else now,
+        }
+        return self._save()
+
+    def invalidate(self, id_scope: str, device_id: str) -> None:
+        """Forgets the hub a device was assigned to, so it registers again
+
+        :param str id_scope: The ID scope of the device
+        :param str device_id: The device ID
+        """
+        if self._assignments.pop(self._key(id_scope, device_id), None) is not None:
+            self._save()
+
+    def clear(self) -> None:
+        """Forgets all the assignments"""
+        self._assignments = {}
+        self._save()
@@ -0,0 +1,212 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`bulk_provisioning`
+=====================
+
+Registers a batch of devices with the Device Provisioning Service, many at a time. Each device
+is registered by a `DeviceRegistration` in a worker thread, with up to the concurrency limit of
+threads, so the time one device spends connecting and waiting for DPS to assign it is used to
+register others. Threads are used rather than stepping the registrations from one loop as
+connecting blocks for the TLS handshake and the MQTT CONNECT, see
+`adafruit_azureiot.device_registration`.
+
+The result for each device is appended to a results file as a line of JSON as soon as it is
+known. Running again with the same file skips the devices that are already assigned, so an
+interrupted batch carries on where it stopped, and failed devices are retried.
+
+This is meant for commissioning devices from a computer running CPython, and needs threads.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Dict, Iterable, Tuple
+except ImportError:
+    pass
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Lock
+except ImportError:
+    ThreadPoolExecutor = None
+
+import json
+import time
+
+import adafruit_logging as logging
+from adafruit_logging import Logger
+
+from .device_registration import DeviceRegistration
+from .keys import compute_derived_symmetric_key
+
+STATUS_ASSIGNED = "assigned"
+"""The device was assigned to a hub"""
+STATUS_FAILED = "failed"
+"""The device could not be registered"""
+
+
+def derive_device_key(group_key: str, device_id: str) -> str:
+    """Derives the key of a device from the key of a group enrollment
+
+    :param str group_key: The primary or secondary key of the enrollment group
+    :param str device_id: The device ID
+    :returns: The key the device registers with
+    :rtype: str
+    """
+    return compute_derived_symmetric_key(group_key, device_id).decode("utf-8")
+
+
+def load_results(path: str) -> Dict[str, dict]:
+    """Reads a results file. When a device appears more than once the last result is used
+
+    :param str path: The results file
+    :returns: The result for each device, by device ID. Empty if the file doesn't exist
+    :rtype: dict
+    """
+    results = {}
+    try:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short when the run was interrupted
+                    continue
+                results[result["device_id"]] = result
+    except OSError:
+        pass
+    return results
+
+
+class BulkProvisioner:
+    """Registers many devices with DPS concurrently, writing the result for each to a file"""
+
+    def __init__(
+        self,
+        socket_pool,
+        ssl_context,
+        id_scope: str,
+        devices: Iterable[Tuple[str, str]],
+        results_path: str,
+        concurrency: int = 32,
+        logger: Logger = None,
+        transport=None,
+        timeout: float = 60,
+        loop_timeout: float = None,
+        token_expires: int = 21600,
+    ):
+        """Creates the provisioner
+
+        :param socket_pool: The socket pool
+        :param ssl_context: The SSL context
+        :param str id_scope: The ID scope of the DPS instance
+        :param devices: The devices to register, as ``(device_id, device_key)`` pairs
+        :param str results_path: The file to write the result for each device to
+        :param int concurrency: The most devices to register at once, each in its own thread,
+            defaults to 32
+        :param Logger logger: The logger
+        :param transport: The MQTT transport to connect with, see `adafruit_azureiot.transport`.
+            Defaults to a MiniMQTT client
+        :param float timeout: How long each registration can take, in seconds
+        :param float loop_timeout: How long each step of a registration waits for a response,
+            in seconds. Defaults to the socket timeout of the registration
+        :param int token_expires: How long the registration tokens are valid for, in seconds
+        :raises RuntimeError: if threads are not available
+        """
+        if ThreadPoolExecutor is None:
+            raise RuntimeError("Threads are not available, register devices one at a time instead")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self._socket_pool = socket_pool
+        self._ssl_context = ssl_context
+        self._id_scope = id_scope
+        self._devices = list(devices)
+        self.results_path = results_path
+        self.concurrency = concurrency
+        if logger is not None:
+            self._logger = logger
+        else:
+            self._logger = logging.getLogger("log")
+            self._logger.addHandler(logging.StreamHandler())
+        self._transport = transport
+        self._timeout = timeout
+        self._loop_timeout = loop_timeout
+        self._token_expires = token_expires
+
+    def _record(self, file, device_id: str, registration, started_at: float, error: str) -> dict:
+        result = {
+            "device_id": device_id,
+            "status": STATUS_FAILED if error is not None else STATUS_ASSIGNED,
+            "hub": registration.hostname if registration is not None else None,
+            "error": error,
+            "seconds": round(time.monotonic() - started_at, 3),
+            "polls": registration.polls if registration is not None else 0,
+            "finished_at": time.time(),
+        }
+        file.write(json.dumps(result) + "\n")
+        # Keep the result even if the run is interrupted
+        file.flush()
+        return result
+
+    def _register(self, file, lock, summary: dict, device_id: str, device_key: str) -> None:
+        registration = DeviceRegistration(
+            self._socket_pool,
+            self._ssl_context,
+            self._id_scope,
+            device_id,
+            device_key,
+            self._logger,
+            transport=self._transport,
+            timeout=self._timeout,
+            loop_timeout=self._loop_timeout,
+        )
+        started_at = time.monotonic()
+        error = None
+        try:
+            registration.register_device(int(time.time() + self._token_expires))
+        except Exception as exception:
+            error = str(exception)
+
+        with lock:
+            self._record(file, device_id, registration, started_at, error)
+            summary["failed" if error is not None else "assigned"] += 1
+
+    def run(self) -> dict:
+        """Registers every device that isn't already assigned in the results file
+
+        :returns: The number of devices ``assigned``, ``failed`` and ``skipped`` because they
+            were already assigned, and how long the run took in ``seconds``
+        :rtype: dict
+        """
+        previous = load_results(self.results_path)
+        pending = [
+            (device_id, device_key)
+            for device_id, device_key in self._devices
+            if previous.get(device_id, {}).get("status") != STATUS_ASSIGNED
+        ]
+        summary = {
+            "assigned": 0,
+            "failed": 0,
+            "skipped": len(self._devices) - len(pending),
+            "seconds": 0.0,
+        }
+        started_at = time.monotonic()
+
+        # The results file and summary are shared by the workers
+        lock = Lock()
+        with open(self.results_path, "a", encoding="utf-8") as file:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                futures = [
+                    pool.submit(self._register, file, lock, summary, device_id, device_key)
+                    for device_id, device_key in pending
+                ]
+            for future in futures:
+                # Raises if a result couldn't be written
+                future.result()
+
+        summary["seconds"] = round(time.monotonic() - started_at, 3)
+        return summary
@@ -0,0 +1,172 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`c2d_properties`
+=====================
+
+The properties of a cloud to device message. IoT Hub sends these URL encoded at the end of the
+topic. They are only parsed and decoded the first time they are used, so messages whose
+properties are never read don't pay for parsing them.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any, Dict, Iterator, Optional
+except ImportError:
+    pass
+
+from .quote import unquote
+
+# System property names, as they appear in the property bag once decoded
+MESSAGE_ID = "$.mid"
+CORRELATION_ID = "$.cid"
+TO = "$.to"
+USER_ID = "$.uid"
+CONTENT_TYPE = "$.ct"
+CONTENT_ENCODING = "$.ce"
+EXPIRY_TIME = "$.exp"
+ACK = "iothub-ack"
+
+
+def _is_system_property(name: str) -> bool:
+    return name.startswith("$.") or name.startswith("iothub-")
+
+
+class C2DProperties:
+    """A read-only mapping of the properties of a cloud to device message, with the system
+    properties also available as attributes. Keys and values are URL decoded, and a value is
+    everything after the first ``=``, so values may contain ``=``.
+    """
+
+    def __init__(self, property_bag: str):
+        """Creates the properties
+
+        :param str property_bag: The URL encoded property bag from the end of the topic
+        """
+        self._property_bag = property_bag
+        self._properties: Optional[Dict[str, str]] = None
+
+    def _parsed(self) -> Dict[str, str]:
+        properties = self._properties
+        if properties is not None:
+            return properties
+
+        properties = {}
+        bag = self._property_bag
+        start = 0
+        length = len(bag)
+        while start < length:
+            end = bag.find("&", start)
+            if end == -1:
+                end = length
+            separator = bag.find("=", start, end)
+            if separator == -1:
+                # A property with no value
+                if end > start:
+                    properties[unquote(bag[start:end])] = ""
+            else:
+                properties[unquote(bag[start:separator])] = unquote(bag[separator + 1 : end])
+            start = end + 1
+
+        self._properties = properties
+        return properties
+
+    @property
+    def raw(self) -> str:
+        """The property bag as it was received, still URL encoded"""
+        return self._property_bag
+
+    @property
+    def message_id(self) -> Optional[str]:
+        """The message id (``$.mid``), or None if the message doesn't have one"""
+        return self._parsed().get(MESSAGE_ID)
+
+    @property
+    def correlation_id(self) -> Optional[str]:
+        """The correlation id (``$.cid``), or None if the message doesn't have one"""
+        return self._parsed().get(CORRELATION_ID)
+
+    @property
+    def to(self) -> Optional[str]:
+        """The destination of the message (``$.to``), or None if it is not set"""
+        return self._parsed().get(TO)
+
+    @property
+    def user_id(self) -> Optional[str]:
+        """The id of the user who sent the message (``$.uid``), or None if it is not set"""
+        return self._parsed().get(USER_ID)
+
+    @property
+    def content_type(self) -> Optional[str]:
+        """The content type of the body (``$.ct``), or None if it is not set"""
+        return self._parsed().get(CONTENT_TYPE)
+
+    @property
+    def content_encoding(self) -> Optional[str]:
+        """The content encoding of the body (``$.ce``), or None if it is not set"""
+        return self._parsed().get(CONTENT_ENCODING)
+
+    @property
+    def expiry_time(self) -> Optional[str]:
+        """When the message expires (``$.exp``) as an ISO 8601 string, or None if it doesn't"""
+        return self._parsed().get(EXPIRY_TIME)
+
+    @property
+    def ack(self) -> str:
+        """The feedback the sender asked for (``iothub-ack``): ``none``, ``positive``,
+        ``negative`` or ``full``. Defaults to ``none``"""
+        return self._parsed().get(ACK, "none")
+
+    @property
+    def application_properties(self) -> Dict[str, str]:
+        """The properties set by the sender, without the system properties"""
+        return {
+            name: value for name, value in self._parsed().items() if not _is_system_property(name)
+        }
+
+    def as_dict(self) -> Dict[str, str]:
+        """Gets all the properties as a dictionary, for example to serialize them to JSON
+
+        :returns: A copy of the decoded properties
+        :rtype: dict
+        """
+        return dict(self._parsed())
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Gets a property
+
+        :param str name: The decoded name of the property
+        :param default: The value to return if the property is not set
+        :returns: The decoded value, or the default
+        """
+        return self._parsed().get(name, default)
+
+    def keys(self):
+        """The names of the properties"""
+        return self._parsed().keys()
+
+    def values(self):
+        """The values of the properties"""
+        return self._parsed().values()
+
+    def items(self):
+        """The names and values of the properties"""
+        return self._parsed().items()
+
+    def __getitem__(self, name: str) -> str:
+        return self._parsed()[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._parsed()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._parsed())
+
+    def __len__(self) -> int:
+        return len(self._parsed())
+
+    def __repr__(self) -> str:
+        return repr(self._parsed())
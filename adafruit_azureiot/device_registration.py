@@ -10,6 +10,18 @@
 Handles registration of IoT Central devices, and gets the hostname to use when connecting
 to IoT Central over MQTT
 
+Registration is a state machine. `DeviceRegistration.start` connects and sends the
+registration request, then each call to `DeviceRegistration.step` handles any responses and
+polls the operation status once the ``retry-after`` time the service asked for has passed, so
+the retry-after wait is never slept through. Many registrations can be stepped from one event
+loop, and `DeviceRegistration.register_device` steps one until it is done.
+
+While a response is awaited a step polls the connection, waiting for the socket timeout, which
+is 10 milliseconds by default, so a round of steps over many registrations stays short. The
+cost is that a registration stepped in a tight loop wakes up every socket timeout rather than
+sleeping until a message arrives. `DeviceRegistration.start` still blocks for the TLS handshake
+and the MQTT CONNECT.
+
 * Author(s): Jim Bennett, Elena Horton
 """
 
@@ -17,12 +29,30 @@ import json
 import time
 
 import adafruit_logging as logging
-import adafruit_minimqtt.adafruit_minimqtt as MQTT
 from adafruit_logging import Logger
 
 from . import constants
 from .keys import compute_derived_symmetric_key
 from .quote import quote
+from .topic_router import ROUTE_DPS_RESPONSE, TopicRouter, topic_parameter
+from .transport import minimqtt_transport
+
+STATE_IDLE = 0
+"""Registration has not started"""
+STATE_REGISTERING = 1
+"""The registration request was sent, and the response hasn't arrived"""
+STATE_WAITING = 2
+"""Waiting for the retry-after time before polling the operation status"""
+STATE_POLLING = 3
+"""The operation status request was sent, and the response hasn't arrived"""
+STATE_ASSIGNED = 4
+"""The device was assigned to a hub"""
+STATE_FAILED = 5
+"""Registration failed, see `DeviceRegistration.error`"""
+
+DEFAULT_RETRY_AFTER = 3
+"""How long to wait before polling the operation status when the service doesn't say, in
+seconds"""
 
 
 class DeviceRegistrationError(Exception):
@@ -49,14 +79,30 @@ class DeviceRegistration:
         device_id: str,
         device_sas_key: str,
         logger: Logger = None,
+        transport=None,
+        keep_alive: int = 120,
+        timeout: float = 60,
+        loop_timeout: float = None,
+        socket_timeout: float = 0.01,
     ):
         """Creates an instance of the device registration service
 
         :param socket: The network socket
         :param str id_scope: The ID scope of the device to register
         :param str device_id: The device ID of the device to register
-        :param str device_sas_key: The primary or secondary key of the device to register
+        :param str device_sas_key: The primary or secondary key of the device to register, or
+            None to authenticate with the X.509 client certificate in ``ssl_context``
         :param adafruit_logging.Logger logger: The logger to use to log messages
+        :param transport: The MQTT transport to connect with, see `adafruit_azureiot.transport`.
+            Defaults to a MiniMQTT client
+        :param int keep_alive: The keep-alive interval in seconds, defaults to 120 seconds
+        :param float timeout: How long registration can take before it fails, in seconds,
+            defaults to 60 seconds
+        :param float loop_timeout: How long each step waits for a response from the service, in
+            seconds. With MiniMQTT a step blocks for this long whenever a response is awaited,
+            and it needs to be at least the socket timeout. Defaults to the socket timeout
+        :param float socket_timeout: How long each read from the connection waits, in seconds,
+            defaults to 10 milliseconds. Connecting waits for at least 1 second
         """
         self._id_scope = id_scope
         self._device_id = device_id
@@ -71,9 +117,22 @@ class DeviceRegistration:
         self._auth_response_received = False
         self._operation_id = None
         self._hostname = None
+        self._router = TopicRouter(device_id)
+        self._timeout = timeout
+        self._socket_timeout = socket_timeout
+        self._loop_timeout = loop_timeout if loop_timeout is not None else socket_timeout
+        self._state = STATE_IDLE
+        self._deadline = 0.0
+        self._next_step_at = 0.0
+        self.error = None
+        """Why registration failed, or None"""
+        self.polls = 0
+        """The number of operation status requests sent"""
 
         self._socket_pool = socket_pool
         self._ssl_context = ssl_context
+        self._transport = transport if transport is not None else minimqtt_transport
+        self._keep_alive = keep_alive
 
     def _on_connect(self, client, userdata, _, rc) -> None:
         self._logger.info(
@@ -82,30 +141,85 @@ class DeviceRegistration:
 
         self._auth_response_received = True
 
+    @property
+    def state(self) -> int:
+        """The state of the registration, one of the ``STATE_`` constants"""
+        return self._state
+
+    @property
+    def done(self) -> bool:
+        """True once the device is assigned or registration has failed"""
+        return self._state in {STATE_ASSIGNED, STATE_FAILED}
+
+    @property
+    def hostname(self) -> str:
+        """The hostname of the hub the device was assigned to, or None"""
+        return self._hostname
+
+    @property
+    def next_step_at(self) -> float:
+        """When `step` next has something to do, from ``time.monotonic()``. While a response is
+        awaited this is now, so an event loop can sleep until this time between steps"""
+        if self._state == STATE_WAITING:
+            return min(self._next_step_at, self._deadline)
+        return time.monotonic()
+
+    def _wait(self, retry_after: str) -> None:
+        waittime = int(retry_after) if retry_after else DEFAULT_RETRY_AFTER
+        self._logger.debug(f"Retrying after {waittime}s")
+        self._next_step_at = time.monotonic() + waittime
+        self._state = STATE_WAITING
+
+    def _finish(self, state: int, error: str = None) -> None:
+        self._state = state
+        self.error = error
+        if error is not None:
+            self._logger.error("ERROR: " + error)
+
+    def _disconnect(self) -> None:
+        try:
+            self._mqtt.disconnect()
+        except Exception:
+            # The connection is no longer needed, so it doesn't matter if it has already gone
+            pass
+
     def _handle_dps_update(self, client, topic: str, msg: str) -> None:
         self._logger.info(f"Received registration results on topic {topic} - {msg}")
-        message = json.loads(msg)
-
-        if topic.startswith("$dps/registrations/res/202"):
-            # Get the retry after and wait for that before responding
-            parts = str.split(topic, "retry-after=")
-            waittime = int(parts[1])
-
-            self._logger.debug(f"Retrying after {waittime}s")
-
-            time.sleep(waittime)
-            self._operation_id = message["operationId"]
-        elif topic.startswith("$dps/registrations/res/200"):
-            self._hostname = message["registrationState"]["assignedHub"]
+        route = self._router.route(topic)
+        if route.kind != ROUTE_DPS_RESPONSE or self.done:
+            return
+
+        retry_after = topic_parameter(route.properties, "retry-after") if route.properties else None
+        if route.status == 202:
+            # Still assigning, so poll the operation status once the retry after has passed
+            self._operation_id = json.loads(msg)["operationId"]
+            self._wait(retry_after)
+        elif route.status == 200:
+            registration_state = json.loads(msg).get("registrationState", {})
+            if registration_state.get("status", "assigned") != "assigned":
+                self._finish(
+                    STATE_FAILED,
+                    "Cannot register device - status " + str(registration_state.get("status")),
+                )
+                return
+            self._hostname = registration_state["assignedHub"]
+            self._finish(STATE_ASSIGNED)
+        elif route.status == 429 or route.status >= 500:
+            # Throttled or busy, so send the same request again later
+            self._wait(retry_after)
+        else:
+            self._finish(STATE_FAILED, f"Cannot register device - status {route.status}: {msg}")
 
     def _connect_to_mqtt(self) -> None:
         self._mqtt.on_connect = self._on_connect
 
-        self._mqtt.connect()
+        # MiniMQTT shares a socket pool between clients and allows one connection to each host,
+        # unless each has its own session ID, so that many devices can register at once
+        self._mqtt.connect(session_id=self._device_id)
 
         self._logger.info(" - device_registration :: connect :: created mqtt client. connecting..")
         while not self._auth_response_received:
-            self._mqtt.loop(2)
+            self._mqtt.loop(self._loop_timeout)
 
         self._logger.info(
             " - device_registration :: connect :: on_connect must be fired. Connected ?"
@@ -115,57 +229,59 @@ class DeviceRegistration:
         if not self._mqtt.is_connected():
             raise DeviceRegistrationError("Cannot connect to MQTT")
 
-    def _start_registration(self) -> None:
-        self._mqtt.add_topic_callback("$dps/registrations/res/#", self._handle_dps_update)
-        self._mqtt.subscribe("$dps/registrations/res/#")
-
-        message = json.dumps({"registrationId": self._device_id})
-
-        self._mqtt.publish(
-            f"$dps/registrations/PUT/iotdps-register/?$rid={self._device_id}", message
-        )
-
-        retry = 0
-
-        while self._operation_id is None and retry < 10:
-            time.sleep(1)
-            retry += 1
-            self._mqtt.loop(2)
-
+    def _send_request(self) -> None:
         if self._operation_id is None:
-            raise DeviceRegistrationError(
-                "Cannot register device - no response from broker for registration result"
+            message = json.dumps({"registrationId": self._device_id})
+            self._mqtt.publish(
+                f"$dps/registrations/PUT/iotdps-register/?$rid={self._device_id}", message
             )
-
-    def _wait_for_operation(self) -> None:
-        message = json.dumps({"operationId": self._operation_id})
-        self._mqtt.publish(
-            "$dps/registrations/GET/iotdps-get-operationstatus/?$rid="
-            f"{self._device_id}&operationId={self._operation_id}",
-            message,
-        )
-
-        retry = 0
-
-        while self._hostname is None and retry < 10:
-            time.sleep(1)
-            retry += 1
-            self._mqtt.loop(2)
-
-        if self._hostname is None:
-            raise DeviceRegistrationError(
-                "Cannot register device - no response from broker for operation status"
+            self._state = STATE_REGISTERING
+        else:
+            message = json.dumps({"operationId": self._operation_id})
+            self._mqtt.publish(
+                "$dps/registrations/GET/iotdps-get-operationstatus/?$rid="
+                f"{self._device_id}&operationId={self._operation_id}",
+                message,
             )
-
-    def register_device(self, expiry: int) -> str:
+            self.polls += 1
+            self._state = STATE_POLLING
+
+    def step(self, now: float = None) -> int:
+        """Moves the registration on. While a response is awaited this polls the connection,
+        waiting for the loop timeout. While waiting for the retry-after time it returns straight
+        away, and once that has passed it polls the operation status
+
+        :param float now: The current time from ``time.monotonic()``
+        :returns: The state of the registration
+        :rtype: int
+        :raises RuntimeError: if the internet connection is not responding
         """
-        Registers the device with the IoT Central device registration service.
-        Returns the hostname of the IoT hub to use over MQTT
+        state = self._state
+        if state in {STATE_IDLE, STATE_ASSIGNED, STATE_FAILED}:
+            return state
+
+        if now is None:
+            now = time.monotonic()
+        if now >= self._deadline:
+            self._finish(STATE_FAILED, "Cannot register device - no response from broker")
+        elif state == STATE_WAITING:
+            if now >= self._next_step_at:
+                self._send_request()
+        else:
+            self._mqtt.loop(self._loop_timeout)
+
+        if self.done:
+            # Not from the message handler, as MiniMQTT carries on using the connection in loop
+            # after the handler returns
+            self._disconnect()
+        return self._state
+
+    def start(self, expiry: int) -> None:
+        """Connects to the device registration service and sends the registration request. Call
+        `step` until `done` is True to finish registering
 
         :param int expiry: The expiry time for the registration
-        :returns: The underlying IoT Hub that this device should connect to
-        :rtype: str
-        :raises DeviceRegistrationError: if the device cannot be registered successfully
+        :raises DeviceRegistrationError: if the connection is rejected
         :raises RuntimeError: if the internet connection is not responding or is unable to connect
         """
 
@@ -174,31 +290,67 @@ class DeviceRegistration:
             + f"{constants.DPS_API_VERSION}"
         )
 
-        sr = self._id_scope + "%2Fregistrations%2F" + self._device_id
-        sig_no_encode = compute_derived_symmetric_key(self._device_sas_key, sr + "\n" + str(expiry))
-        sig_encoded = quote(sig_no_encode, "~()*!.'")
-        auth_string = (
-            f"SharedAccessSignature sr={sr}&sig={sig_encoded}&se={expiry}&skn=registration"
-        )
+        # Empty for X.509 rather than None, as MiniMQTT encodes the password whenever there is a
+        # username
+        auth_string = ""
+        if self._device_sas_key is not None:
+            sr = self._id_scope + "%2Fregistrations%2F" + self._device_id
+            sig_no_encode = compute_derived_symmetric_key(
+                self._device_sas_key, sr + "\n" + str(expiry)
+            )
+            sig_encoded = quote(sig_no_encode, "~()*!.'")
+            auth_string = (
+                f"SharedAccessSignature sr={sr}&sig={sig_encoded}&se={expiry}&skn=registration"
+            )
 
-        self._mqtt = MQTT.MQTT(
+        self._mqtt = self._transport(
             broker=constants.DPS_END_POINT,
             port=8883,
             username=username,
             password=auth_string,
             client_id=self._device_id,
             is_ssl=True,
-            keep_alive=120,
+            keep_alive=self._keep_alive,
             socket_pool=self._socket_pool,
             ssl_context=self._ssl_context,
+            socket_timeout=self._socket_timeout,
         )
 
         self._mqtt.enable_logger(logging, self._logger.getEffectiveLevel())
 
+        self._operation_id = None
+        self._hostname = None
+        self.error = None
+        self._deadline = time.monotonic() + self._timeout
         self._connect_to_mqtt()
-        self._start_registration()
-        self._wait_for_operation()
 
-        self._mqtt.disconnect()
+        self._mqtt.on_message = self._handle_dps_update
+        self._mqtt.subscribe("$dps/registrations/res/#")
+        self._send_request()
 
+    def register_device(self, expiry: int) -> str:
+        """
+        Registers the device with the IoT Central device registration service.
+        Returns the hostname of the IoT hub to use over MQTT
+
+        :param int expiry: The expiry time for the registration
+        :returns: The underlying IoT Hub that this device should connect to
+        :rtype: str
+        :raises DeviceRegistrationError: if the device cannot be registered successfully
+        :raises RuntimeError: if the internet connection is not responding or is unable to connect
+        """
+        try:
+            self.start(expiry)
+            while not self.done:
+                self.step()
+                delay = self.next_step_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            # Also when the connection fails part way, so its socket is given back to the pool
+            if self._mqtt is not None:
+                self._disconnect()
+
+        if self._state == STATE_FAILED:
+            raise DeviceRegistrationError(self.error)
         return str(self._hostname)
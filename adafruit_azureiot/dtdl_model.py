@@ -0,0 +1,225 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`dtdl_model`
+=====================
+
+Device models for IoT Central, loaded from DTDL interfaces. The model is read once, and each
+component gets a precompiled schema with the encoder for every telemetry value and property, and
+the topic properties that mark its telemetry. Sending is then a lookup and an encode, without
+reading the model again.
+
+Telemetry for a component is sent with a ``$.sub`` topic property naming the component, and
+properties of a component are reported inside an object for the component marked with
+``"__t": "c"``.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Union
+except ImportError:
+    pass
+
+import json
+
+from .property_acks import COMPONENT_MARKER
+from .quote import quote
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, bool):
+        raise ValueError("Expected a number, got a boolean")
+    return float(value)
+
+
+def _to_int(value: Any) -> int:
+    if isinstance(value, bool) or (isinstance(value, float) and value != int(value)):
+        raise ValueError("Expected an integer, got " + repr(value))
+    return int(value)
+
+
+def _to_bool(value: Any) -> bool:
+    if not isinstance(value, bool):
+        raise ValueError("Expected a boolean, got " + repr(value))
+    return value
+
+
+def _to_str(value: Any) -> str:
+    return str(value)
+
+
+def _unchanged(value: Any) -> Any:
+    return value
+
+
+_ENCODERS = {
+    "double": _to_float,
+    "float": _to_float,
+    "integer": _to_int,
+    "long": _to_int,
+    "boolean": _to_bool,
+    "string": _to_str,
+}
+
+
+def _encoder(schema: Any) -> Callable:
+    # Complex schemas such as objects, enums and maps, and times, are sent as they are
+    if isinstance(schema, str):
+        return _ENCODERS.get(schema, _unchanged)
+    return _unchanged
+
+
+def _content_types(content: dict) -> List[str]:
+    content_type = content.get("@type", ())
+    if isinstance(content_type, str):
+        return [content_type]
+    return content_type
+
+
+class ComponentSchema:
+    """The precompiled schema of one component, or of the root of the model"""
+
+    def __init__(self, name: Optional[str], interface: dict):
+        """Compiles the schema for a component
+
+        :param str name: The name of the component, or None for the root of the model
+        :param dict interface: The DTDL interface of the component
+        """
+        self.name = name
+        self.interface_id = interface.get("@id")
+        self.telemetry: Dict[str, Callable] = {}
+        """The encoder for each telemetry value, by name"""
+        self.properties: Dict[str, Callable] = {}
+        """The encoder for each property, by name"""
+        self.writable = set()
+        """The names of the writable properties"""
+        self.property_bag = "$.sub=" + quote(name.encode(), "") if name is not None else ""
+        """The topic properties to send telemetry with, already encoded"""
+
+        for content in interface.get("contents", ()):
+            types = _content_types(content)
+            if "Telemetry" in types:
+                self.telemetry[content["name"]] = _encoder(content.get("schema"))
+            elif "Property" in types:
+                self.properties[content["name"]] = _encoder(content.get("schema"))
+                if content.get("writable", False):
+                    self.writable.add(content["name"])
+
+    def encode_telemetry(self, data: dict) -> str:
+        """Encodes telemetry values for this component
+
+        :param dict data: The telemetry values, by name
+        :returns: The message body
+        :rtype: str
+        :raises ValueError: if a value is not in the model, or has the wrong type
+        """
+        telemetry = self.telemetry
+        encoded = {}
+        for name, value in data.items():
+            encoder = telemetry.get(name)
+            if encoder is None:
+                raise ValueError("Telemetry " + name + " is not in the model")
+            encoded[name] = encoder(value)
+        return json.dumps(encoded)
+
+    def property_patch(self, values: dict) -> dict:
+        """Builds the reported properties patch for properties of this component
+
+        :param dict values: The property values, by name. Values of None remove the property
+        :returns: The patch, with the properties inside the component if this is a component
+        :rtype: dict
+        :raises ValueError: if a property is not in the model, or has the wrong type
+        """
+        properties = self.properties
+        encoded = {}
+        for name, value in values.items():
+            encoder = properties.get(name)
+            if encoder is None:
+                raise ValueError("Property " + name + " is not in the model")
+            encoded[name] = None if value is None else encoder(value)
+
+        if self.name is None:
+            return encoded
+        encoded[COMPONENT_MARKER] = "c"
+        return {self.name: encoded}
+
+
+class DeviceModel:
+    """A device model compiled from DTDL interfaces, with a schema for each component"""
+
+    def __init__(self, interfaces: Union[str, dict, list], root_id: str = None):
+        """Loads and compiles a model
+
+        :param interfaces: The DTDL interfaces, as a JSON string, a dictionary for a single
+            interface, or a list of interfaces. The interfaces of components can be inline in
+            their component, or in the list
+        :param str root_id: The ``@id`` of the interface of the device, defaults to the first
+            interface
+        :raises ValueError: if the root interface or the interface of a component is missing
+        """
+        if isinstance(interfaces, str):
+            interfaces = json.loads(interfaces)
+        if isinstance(interfaces, dict):
+            interfaces = [interfaces]
+
+        by_id = {interface.get("@id"): interface for interface in interfaces}
+        if root_id is None:
+            root = interfaces[0] if interfaces else None
+        else:
+            root = by_id.get(root_id)
+        if root is None:
+            raise ValueError("The model has no root interface")
+
+        self.model_id = root.get("@id")
+        """The ``@id`` of the interface of the device"""
+        self._components: Dict[Optional[str], ComponentSchema] = {None: ComponentSchema(None, root)}
+
+        for content in root.get("contents", ()):
+            if "Component" not in _content_types(content):
+                continue
+            schema = content.get("schema")
+            interface = schema if isinstance(schema, dict) else by_id.get(schema)
+            if interface is None:
+                raise ValueError("The interface for component " + content["name"] + " is missing")
+            self._components[content["name"]] = ComponentSchema(content["name"], interface)
+
+    @property
+    def components(self) -> List[str]:
+        """The names of the components in the model"""
+        return [name for name in self._components if name is not None]
+
+    def component(self, name: str = None) -> ComponentSchema:
+        """Gets the schema for a component
+
+        :param str name: The name of the component, or None for the root of the model
+        :returns: The schema
+        :rtype: ComponentSchema
+        :raises ValueError: if the component is not in the model
+        """
+        schema = self._components.get(name)
+        if schema is None:
+            raise ValueError("Component " + str(name) + " is not in the model")
+        return schema
+
+    def encode_telemetry(self, data: dict, component: str = None) -> str:
+        """Encodes telemetry values
+
+        :param dict data: The telemetry values, by name
+        :param str component: The name of the component, or None for the root of the model
+        :returns: The message body
+        :rtype: str
+        """
+        return self.component(component).encode_telemetry(data)
+
+    def property_patch(self, values: dict, component: str = None) -> dict:
+        """Builds the reported properties patch for property values
+
+        :param dict values: The property values, by name
+        :param str component: The name of the component, or None for the root of the model
+        :returns: The patch
+        :rtype: dict
+        """
+        return self.component(component).property_patch(values)
@@ -20,7 +20,7 @@ except ImportError:
     pass
 
 
-def __translate(key: Union[bytes, bytearray], translation: bytes) -> bytes:
+def _translate(key: Union[bytes, bytearray], translation: bytes) -> bytes:
     return bytes(translation[x] for x in key)
 
 
@@ -331,8 +331,8 @@ class HMAC:
             key = self.digest_cons(key).digest()
 
         key += bytes(blocksize - len(key))
-        self.outer.update(__translate(key, TRANS_5C))
-        self.inner.update(__translate(key, TRANS_36))
+        self.outer.update(_translate(key, TRANS_5C))
+        self.inner.update(_translate(key, TRANS_36))
         if msg is not None:
             self.update(msg)
 
@@ -0,0 +1,134 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`inbound_queue`
+=====================
+
+A bounded queue between the MQTT client and the user callbacks. Messages received while
+`IoTMQTT.loop` reads the socket are queued, and the callbacks run once the read has finished, so
+a slow callback doesn't stop the client reading packets and answering the broker.
+
+When the queue is full the policy decides what happens to a new message:
+
+* `DROP_OLDEST` drops the oldest queued message to make room, so the newest data wins
+* `DROP_NEWEST` drops the new message, so messages are handled in the order they were sent
+* `BLOCK` handles the oldest queued message straight away to make room, so nothing is dropped
+  but the socket read waits for the callback
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any
+except ImportError:
+    pass
+
+DROP_OLDEST = 0
+"""Drop the oldest queued message to make room for a new one"""
+DROP_NEWEST = 1
+"""Drop new messages while the queue is full"""
+BLOCK = 2
+"""Handle the oldest queued message to make room for a new one"""
+
+
+class InboundQueue:
+    """A fixed size ring buffer of received messages"""
+
+    def __init__(self, max_size: int = 16, policy: int = DROP_OLDEST):
+        """Creates the queue
+
+        :param int max_size: The most messages to hold
+        :param int policy: What to do with a new message when the queue is full, one of
+            `DROP_OLDEST`, `DROP_NEWEST` or `BLOCK`
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if policy not in {DROP_OLDEST, DROP_NEWEST, BLOCK}:
+            raise ValueError("Unknown queue policy")
+
+        self.max_size = max_size
+        self.policy = policy
+        self._items = [None] * max_size
+        self._head = 0
+        self._size = 0
+        self.max_depth = 0
+        """The most messages that have been queued at once"""
+        self.dropped = 0
+        """The number of messages that have been dropped because the queue was full"""
+
+    @property
+    def depth(self) -> int:
+        """The number of messages in the queue"""
+        return self._size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def is_full(self) -> bool:
+        """Gets if the queue is full
+
+        :returns: True if there is no room for another message
+        :rtype: bool
+        """
+        return self._size == self.max_size
+
+    def put(self, item: Any) -> bool:
+        """Adds a message to the queue. If the queue is full the message is handled by the
+        policy. With `BLOCK` nothing is added, and the caller must make room with `get` then try
+        again
+
+        :param item: The message to add
+        :returns: True if the message was added
+        :rtype: bool
+        """
+        if self._size == self.max_size:
+            if self.policy == BLOCK:
+                return False
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return False
+            # Drop the oldest to make room
+            self._items[self._head] = None
+            self._head = (self._head + 1) % self.max_size
+            self._size -= 1
+
+        self._items[(self._head + self._size) % self.max_size] = item
+        self._size += 1
+        self.max_depth = max(self.max_depth, self._size)
+        return True
+
+    def get(self) -> Any:
+        """Removes the oldest message from the queue
+
+        :returns: The oldest message
+        :raises IndexError: if the queue is empty
+        """
+        if self._size == 0:
+            raise IndexError("get from an empty queue")
+
+        item = self._items[self._head]
+        self._items[self._head] = None
+        self._head = (self._head + 1) % self.max_size
+        self._size -= 1
+        return item
+
+    def clear(self) -> None:
+        """Removes all the messages from the queue"""
+        self._items = [None] * self.max_size
+        self._head = 0
+        self._size = 0
+
+    def as_dict(self) -> dict:
+        """Gets the queue statistics as a dictionary
+
+        :returns: The current and largest depth, the size and the number of dropped messages
+        :rtype: dict
+        """
+        return {
+            "depth": self._size,
+            "max_depth": self.max_depth,
+            "max_size": self.max_size,
+            "dropped": self.dropped,
+        }
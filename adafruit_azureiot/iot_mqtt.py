@@ -12,18 +12,47 @@ An MQTT client for Azure IoT
 * Author(s): Jim Bennett, Elena Horton
 """
 
+try:
+    from typing import Optional
+except ImportError:
+    pass
+
 import gc
 import json
 import time
 
 import adafruit_logging as logging
-import adafruit_minimqtt.adafruit_minimqtt as MQTT
 from adafruit_logging import Logger
+from adafruit_minimqtt.adafruit_minimqtt import MMQTTException
 
 from . import constants
+from .c2d_properties import C2DProperties
+from .inbound_queue import InboundQueue
 from .iot_error import IoTError
-from .keys import compute_derived_symmetric_key
-from .quote import quote
+from .iot_stats import IoTStats
+from .keep_alive import KeepAliveController
+from .method_executor import MethodExecutor
+from .reported_writer import ReportedPropertyWriter
+from .request_correlator import PendingRequest, RequestCorrelator
+from .sas_signer import SasSigner, resource_uri
+from .topic_router import (
+    ROUTE_CLOUD_TO_DEVICE,
+    ROUTE_DIRECT_METHOD,
+    ROUTE_MODULE_INPUT,
+    ROUTE_TWIN_DESIRED,
+    ROUTE_TWIN_RESPONSE,
+    TopicRoute,
+    TopicRouter,
+)
+from .transport import minimqtt_transport
+from .twin_cache import PATCH_GAP, PATCH_STALE, TwinCache
+
+# The MQTT packet type of a ping response
+_MQTT_PINGRESP = 0xD0
+
+# The kinds of requests sent to the hub
+REQUEST_TWIN_GET = "twin_get"
+REQUEST_TWIN_PATCH = "twin_patch"
 
 
 class IoTResponse:
@@ -65,11 +94,22 @@ class IoTMQTTCallback:
         """
         return IoTResponse(200, "")
 
-    def cloud_to_device_message_received(self, body: str, properties: dict) -> None:
+    def cloud_to_device_message_received(self, body: str, properties: C2DProperties) -> None:
         """Called when a cloud to device message is received
 
         :param str body: The body of the message
-        :param dict properties: The propreties sent with the mesage
+        :param C2DProperties properties: The properties sent with the message, URL decoded
+        """
+
+    def module_input_message_received(
+        self, input_name: str, body: str, properties: C2DProperties
+    ) -> None:
+        """Called when a module receives a message on one of its inputs, routed to it by an IoT
+        Edge gateway
+
+        :param str input_name: The name of the input
+        :param str body: The body of the message
+        :param C2DProperties properties: The properties sent with the message, URL decoded
         """
 
     def device_twin_desired_updated(
@@ -82,6 +122,17 @@ class IoTMQTTCallback:
         :param int desired_version: The version of the desired property that was updated
         """
 
+    def device_twin_desired_patched(self, patch: dict, desired_version: int) -> None:
+        """Called once for each update of the device twin desired properties, with the whole
+        patch, or all the desired properties when the full twin is received. By default this
+        calls `device_twin_desired_updated` for each top level property
+
+        :param dict patch: The desired properties that were updated, without the ``$version``
+        :param int desired_version: The version of the desired properties
+        """
+        for property_name, value in patch.items():
+            self.device_twin_desired_updated(property_name, value, desired_version)
+
     def device_twin_reported_updated(
         self,
         reported_property_name: str,
@@ -100,15 +151,8 @@ class IoTMQTT:
     """MQTT client for Azure IoT"""
 
     def _gen_sas_token(self) -> str:
-        token_expiry = int(time.time() + self._token_expires)
-        uri = self._hostname + "%2Fdevices%2F" + self._device_id
-        signed_hmac_sha256 = compute_derived_symmetric_key(
-            self._device_sas_key, uri + "\n" + str(token_expiry)
-        )
-        signature = quote(signed_hmac_sha256, "~()*!.'")
-        if signature.endswith("\n"):  # somewhere along the crypto chain a newline is inserted
-            signature = signature[:-1]
-        return f"SharedAccessSignature sr={uri}&sig={signature}&se={token_expiry}"
+        uri = resource_uri(self._hostname, self._device_id, self._module_id)
+        return self._signer.token(uri, self._device_sas_key, self._token_expires)
 
     def _create_mqtt_client(self) -> None:
         log_text = (
@@ -122,14 +166,14 @@ class IoTMQTT:
             )
         )
 
-        self._mqtts = MQTT.MQTT(
-            broker=self._hostname,
+        self._mqtts = self._transport(
+            broker=self._broker,
             port=8883,
             username=self._username,
             password=self._passwd,
-            client_id=self._device_id,
+            client_id=self._client_id,
             is_ssl=True,
-            keep_alive=120,
+            keep_alive=self._negotiated_keep_alive(),
             socket_pool=self._socket_pool,
             ssl_context=self._ssl_context,
         )
@@ -140,21 +184,31 @@ class IoTMQTT:
         self._mqtts.on_connect = self._on_connect
         self._mqtts.on_publish = self._on_publish
         self._mqtts.on_disconnect = self._on_disconnect
+        self._mqtts.on_message = self._on_message
 
-        # initiate the connection using the adafruit_minimqtt library
-        self._mqtts.connect()
+        # initiate the connection using the adafruit_minimqtt library. MiniMQTT allows one
+        # connection to each host for a socket pool unless they have their own session ID, and
+        # modules of a runtime share the pool and the hub
+        self._mqtts.connect(clean_session=not self._persistent_session, session_id=self._client_id)
 
-    def _on_connect(self, client, userdata, _, rc) -> None:
+    def _on_connect(self, client, userdata, flags, rc) -> None:
         self._logger.info(
             "- iot_mqtt :: _on_connect :: rc = " + str(rc) + ", userdata = " + str(userdata)
         )
 
         self._auth_response_received = True
+
+        # The broker only keeps our subscriptions if it reports that it resumed the session
+        self._session_present = self._persistent_session and bool(flags & 1)
+        if not self._session_present:
+            self._session_subscriptions.clear()
+        self._stats.increment("connects")
         self._callback.connection_status_change(True)
 
     def _on_disconnect(self, client, userdata, rc) -> None:
         self._logger.info("- iot_mqtt :: _on_disconnect :: rc = " + str(rc))
         self._auth_response_received = True
+        self._stats.increment("disconnects")
 
         if rc == 5:
             self._logger.error("on(disconnect) : Not authorized")
@@ -166,13 +220,50 @@ class IoTMQTT:
     def _on_publish(self, client, data, topic, msg_id) -> None:
         self._logger.info("- iot_mqtt :: _on_publish :: " + str(data) + " on topic " + str(topic))
 
-    def _handle_device_twin_update(self, client, topic: str, msg: str) -> None:
-        self._logger.debug("- iot_mqtt :: _echo_desired :: " + topic)
-        twin = None
-        desired = None
+    def _on_message(self, client, topic: str, msg: str) -> None:
+        route = self._router.route(topic)
+
+        stats = self._stats
+        if stats.enabled:
+            stats.increment("messages_received")
+            stats.increment("bytes_received", len(msg))
 
+        if route.kind not in self._route_handlers:
+            self._logger.debug("- iot_mqtt :: _on_message :: unhandled topic " + topic)
+            return
+
+        inbound = self._inbound_queue
+        if inbound is None:
+            self._route_handlers[route.kind](route, msg)
+            return
+
+        dropped = inbound.dropped
+        while not inbound.put((route, msg)):
+            if inbound.dropped != dropped:
+                break
+            # The queue is full and blocks, so handle the oldest message to make room
+            self._dispatch(inbound.get())
+
+        if inbound.dropped != dropped:
+            self._logger.info("- iot_mqtt :: _on_message :: inbound queue full, message dropped")
+            stats.increment("inbound_messages_dropped")
+
+    def _dispatch(self, message) -> None:
+        route, msg = message
+        self._route_handlers[route.kind](route, msg)
+
+    def _dispatch_inbound(self) -> None:
+        inbound = self._inbound_queue
+        if inbound is None:
+            return
+
+        # Only handle what is queued now, in case a callback receives more messages
+        for _ in range(inbound.depth):
+            self._dispatch(inbound.get())
+
+    def _parse_twin(self, msg: str) -> Optional[dict]:
         try:
-            twin = json.loads(msg)
+            return json.loads(msg)
         except json.JSONDecodeError as e:
             self._logger.error(
                 "ERROR: JSON parse for Device Twin message object has failed. => "
@@ -180,54 +271,159 @@ class IoTMQTT:
                 + " => "
                 + str(e)
             )
+            return None
+
+    def _handle_device_twin_update(self, route: TopicRoute, msg: str) -> None:
+        self._logger.debug("- iot_mqtt :: _echo_desired :: " + str(route.version))
+        self._stats.increment("twin_updates_received")
+
+        twin = self._parse_twin(msg)
+        if twin is not None:
+            self._process_twin(twin, msg, False)
+
+    def _handle_twin_response(self, route: TopicRoute, msg: str) -> None:
+        request_id = route.request_id
+        request = self._requests.get(request_id)
+        if request is None:
+            self._logger.debug(
+                "- iot_mqtt :: _handle_twin_response :: no pending request " + str(request_id)
+            )
             return
 
+        status = route.status
+        if not 200 <= status < 300:
+            self._logger.error(
+                "ERROR: Twin request " + request_id + " failed with status " + str(status)
+            )
+            self._stats.increment("twin_request_errors")
+            self._requests.complete(
+                request_id, status, msg or None, route.version, "Failed with status " + str(status)
+            )
+            if request.kind == REQUEST_TWIN_PATCH:
+                self._reported_patch_completed(request)
+            return
+
+        if request.kind != REQUEST_TWIN_GET:
+            self._requests.complete(request_id, status, None, route.version)
+            if request.kind == REQUEST_TWIN_PATCH:
+                self._reported_patch_completed(request)
+            return
+
+        self._stats.increment("twin_updates_received")
+        self._stats.observe("twin_round_trip", time.monotonic() - request.sent_at)
+
+        twin = self._parse_twin(msg)
+        if twin is None:
+            self._requests.complete(request_id, status, None, route.version, "Invalid twin JSON")
+            return
+
+        self._twin_received = True
+        if self._twin_cache is not None:
+            self._twin_cache.load(twin)
+        self._reported_writer.load(twin.get("reported", {}))
+
+        self._process_twin(twin, msg, True)
+        self._requests.complete(request_id, status, twin, route.version)
+
+    def _process_twin(self, twin: dict, msg: str, is_response: bool) -> None:
+        # The twin is not changed, as it may be the result of a request
         if "reported" in twin:
             reported = twin["reported"]
 
             if "$version" in reported:
                 reported_version = reported["$version"]
-                reported.pop("$version")
             else:
                 self._logger.error("ERROR: Unexpected payload for reported twin update => " + msg)
                 return
 
             for property_name, value in reported.items():
-                self._callback.device_twin_reported_updated(property_name, value, reported_version)
+                if property_name != "$version":
+                    self._callback.device_twin_reported_updated(
+                        property_name, value, reported_version
+                    )
 
         is_patch = "desired" not in twin
 
         desired = twin if is_patch else twin["desired"]
         if "$version" in desired:
             desired_version = desired["$version"]
-            desired.pop("$version")
+            desired = {key: value for key, value in desired.items() if key != "$version"}
         else:
             self._logger.error("ERROR: Unexpected payload for desired twin update => " + msg)
             return
 
-        for property_name, value in desired.items():
-            self._callback.device_twin_desired_updated(property_name, value, desired_version)
+        cache = self._twin_cache
+        if cache is not None and not is_response:
+            result = cache.apply_desired_patch(desired, desired_version)
+            if result == PATCH_STALE:
+                self._logger.debug(
+                    "- iot_mqtt :: _echo_desired :: stale version " + str(desired_version)
+                )
+                self._stats.increment("twin_patches_stale")
+                return
+            if result == PATCH_GAP:
+                # Patches were missed, so fetch the full twin once this message is handled
+                self._logger.info("- iot_mqtt :: _echo_desired :: missed desired patches")
+                self._twin_refresh_needed = True
+
+        self._callback.device_twin_desired_patched(desired, desired_version)
+
+    def _handle_direct_method(self, route: TopicRoute, msg: str) -> None:
+        self._stats.increment("direct_methods_invoked")
 
-    def _handle_direct_method(self, client, topic: str, msg: str) -> None:
-        index = topic.find("$rid=")
-        method_id = 1
-        method_name = "None"
-        if index == -1:
+        method_id = route.request_id
+        method_name = route.name
+        if method_id is None:
             self._logger.error("ERROR: C2D doesn't include topic id")
-        else:
-            method_id = topic[index + 5 :]
-            topic_template = "$iothub/methods/POST/"
-            len_temp = len(topic_template)
-            method_name = topic[len_temp : topic.find("/", len_temp + 1)]
+            method_id = "1"
+
+        invoked_at = time.monotonic()
+        self._pending_methods[method_id] = (
+            method_name,
+            invoked_at + self._method_timeout,
+            invoked_at,
+        )
+        self._method_executor.submit(
+            method_id, lambda: self._callback.direct_method_invoked(method_name, msg)
+        )
+        self._service_methods()
+
+    def _service_methods(self) -> None:
+        pending = self._pending_methods
+        if not pending:
+            return
 
-        ret = self._callback.direct_method_invoked(method_name, msg)
+        for method_id, result in self._method_executor.poll():
+            entry = pending.pop(method_id, None)
+            if entry is None:
+                # A timeout response has already been sent
+                self._logger.debug("- iot_mqtt :: _service_methods :: late result " + method_id)
+                continue
+            response = result
+            if isinstance(result, Exception):
+                self._logger.error("ERROR: Direct method " + entry[0] + " raised " + repr(result))
+                response = IoTResponse(500, "Method handler failed")
+            self._send_method_response(method_id, entry[0], response, entry[2])
+
+        now = time.monotonic()
+        for method_id, entry in list(pending.items()):
+            if entry[1] <= now:
+                del pending[method_id]
+                self._method_executor.cancel(method_id)
+                self._stats.increment("direct_method_timeouts")
+                self._send_method_response(
+                    method_id, entry[0], IoTResponse(504, "Method timed out"), entry[2]
+                )
         gc.collect()
 
+    def _send_method_response(
+        self, method_id: str, method_name: str, ret: IoTResponse, invoked_at: float
+    ) -> None:
         ret_code = 200
         ret_message = "{}"
-        if ret.response_code is not None:
+        if ret is not None and ret.response_code is not None:
             ret_code = ret.response_code
-        if ret.response_message is not None:
+        if ret is not None and ret.response_message is not None:
             ret_message = ret.response_message
 
             # ret message must be JSON
@@ -241,15 +437,21 @@ class IoTMQTT:
         )
         self._send_common(next_topic, ret_message)
 
-    def _handle_cloud_to_device_message(self, client, topic: str, msg: str) -> None:
-        parts = topic.split("&")[1:]
+        if self._stats.enabled:
+            self._stats.observe("direct_method_latency", time.monotonic() - invoked_at)
 
-        properties = {}
-        for part in parts:
-            key_value = part.split("=")
-            properties[key_value[0]] = key_value[1]
+    def _handle_cloud_to_device_message(self, route: TopicRoute, msg: str) -> None:
+        self._stats.increment("c2d_messages_received")
 
-        self._callback.cloud_to_device_message_received(msg, properties)
+        # The properties are only parsed if the callback uses them
+        self._callback.cloud_to_device_message_received(msg, C2DProperties(route.properties))
+        gc.collect()
+
+    def _handle_module_input_message(self, route: TopicRoute, msg: str) -> None:
+        self._stats.increment("module_input_messages_received")
+        self._callback.module_input_message_received(
+            route.name, msg, C2DProperties(route.properties)
+        )
         gc.collect()
 
     def _send_common(self, topic: str, data) -> None:
@@ -264,6 +466,8 @@ class IoTMQTT:
         self._logger.debug("Sending message: " + str(data))
 
         retry = 0
+        stats = self._stats
+        started_at = time.monotonic() if stats.enabled else None
 
         while True:
             gc.collect()
@@ -271,6 +475,8 @@ class IoTMQTT:
                 self._logger.debug("Trying to send...")
                 self._mqtts.publish(topic, data)
                 self._logger.debug("Data sent")
+                if self._keep_alive_controller is not None:
+                    self._keep_alive_controller.record_activity()
                 break
             except RuntimeError as runtime_error:
                 self._logger.info(
@@ -278,17 +484,69 @@ class IoTMQTT:
                 )
 
                 retry += 1
+                stats.increment("publish_retries")
                 if retry >= 10:
                     self._logger.error("Failed to send data")
+                    stats.increment("publish_failures")
                     raise
                 time.sleep(0.5)
                 continue
+
+        if started_at is not None:
+            stats.observe("publish_latency", time.monotonic() - started_at)
+            stats.increment("messages_sent")
+            stats.increment("bytes_sent", len(topic) + len(data))
         gc.collect()
 
     def _get_device_settings(self) -> None:
         self._logger.info("- iot_mqtt :: _get_device_settings :: ")
         self.loop()
-        self._send_common("$iothub/twin/GET/?$rid=0", " ")
+        self._request_twin()
+
+    def _request_twin(self) -> PendingRequest:
+        self._twin_refresh_needed = False
+        if not self._is_subscribed_to_twin_responses:
+            self._subscribe_to_twin_responses()
+        request = self._requests.start(REQUEST_TWIN_GET)
+        self._send_common(f"$iothub/twin/GET/?$rid={request.request_id}", " ")
+        return request
+
+    def _expire_requests(self) -> None:
+        for request in self._requests.expire():
+            self._logger.error(
+                "ERROR: No response to " + request.kind + " request " + request.request_id
+            )
+            self._stats.increment("twin_requests_timed_out")
+            if request.kind == REQUEST_TWIN_PATCH:
+                self._reported_patch_completed(request)
+
+    def _reported_patch_completed(self, request: PendingRequest) -> None:
+        writer = self._reported_writer
+        if request.succeeded:
+            self._stats.observe("twin_patch_ack", request.latency)
+            version = request.version
+            if version is not None and (
+                self._reported_version is None or version > self._reported_version
+            ):
+                self._reported_version = version
+                if self._twin_cache is not None:
+                    self._twin_cache.reported_version = version
+            writer.acknowledged(request.context)
+            return
+
+        status = request.status
+        if status is None or status == 429 or status >= 500:
+            # Throttled, failed on the hub, or lost, so send it again after backing off
+            delay = writer.throttled(request.context)
+            if status == 429:
+                self._stats.increment("twin_patches_throttled")
+            self._logger.info(
+                "- iot_mqtt :: _reported_patch_completed :: resending reported properties in "
+                + str(delay)
+                + " seconds"
+            )
+        else:
+            writer.rejected(request.context)
 
     def __init__(
         self,
@@ -300,6 +558,20 @@ class IoTMQTT:
         device_sas_key: str,
         token_expires: int = 21600,
         logger: Logger = None,
+        stats: IoTStats = None,
+        transport=None,
+        persistent_session: bool = False,
+        keep_alive=120,
+        method_executor: MethodExecutor = None,
+        method_timeout: float = 28,
+        inbound_queue: InboundQueue = None,
+        twin_cache: TwinCache = None,
+        request_timeout: float = 10,
+        reported_debounce: float = 0,
+        gateway_hostname: str = None,
+        module_id: str = None,
+        signer: SasSigner = None,
+        loop_timeout: float = 2,
     ):
         """Create the Azure IoT MQTT client
 
@@ -309,9 +581,47 @@ class IoTMQTT:
         :param str hostname: The hostname of the MQTT broker to connect to, get this by registering
             the device
         :param str device_id: The device ID of the device to register
-        :param str device_sas_key: The primary or secondary key of the device to register
+        :param str device_sas_key: The primary or secondary key of the device to register, or
+            None to authenticate with the X.509 client certificate in ``ssl_context``
         :param int token_expires: The number of seconds till the token expires, defaults to 6 hours
         :param Logger logger: The logger
+        :param IoTStats stats: The stats object to record performance metrics in. If this is not
+            set, a disabled stats object is used
+        :param transport: The MQTT transport to connect with, see `adafruit_azureiot.transport`.
+            Defaults to a MiniMQTT client
+        :param bool persistent_session: True to connect with a persistent MQTT session
+            (clean_session=False). Subscriptions are made with QoS 1 so the hub holds them and
+            queues messages while the device is offline. When the broker reports that it resumed
+            the session, subscriptions it still holds are not sent again, and the full twin is not
+            requested again if it was already received in this session.
+        :param keep_alive: The keep-alive interval in seconds, or a `KeepAliveController` to
+            adapt the ping interval to the network. Defaults to 120 seconds
+        :param MethodExecutor method_executor: Where direct method handlers run, see
+            `adafruit_azureiot.method_executor`. Defaults to running them in the thread that calls
+            `loop`
+        :param float method_timeout: How long a direct method handler has to finish, in seconds,
+            before a 504 response is sent for it. Keep this below the response timeout the
+            service invokes the method with, which is 30 seconds by default
+        :param InboundQueue inbound_queue: A queue to hold received messages until the socket
+            read in `loop` has finished, see `adafruit_azureiot.inbound_queue`. By default the
+            callbacks are called while the socket is being read
+        :param TwinCache twin_cache: A cache to keep a local copy of the device twin in, see
+            `adafruit_azureiot.twin_cache`. Stale desired property patches are then ignored, and
+            the full twin is only requested again when patches have been missed
+        :param float request_timeout: How long to wait for the response to a twin request, in
+            seconds
+        :param float reported_debounce: How long to collect reported property updates for before
+            sending them as one patch, in seconds, see `adafruit_azureiot.reported_writer`.
+            Defaults to 0, which sends every update straight away
+        :param str gateway_hostname: The hostname of an IoT Edge gateway to connect through. The
+            connection is made to the gateway, and authenticated for the hub named by
+            ``hostname``. Defaults to connecting straight to the hub
+        :param str module_id: The id of the module to connect as. The client then uses the
+            module's identity and topics. Defaults to connecting as the device
+        :param SasSigner signer: The signer for SAS tokens. Share one between clients to reuse
+            tokens across reconnects, by default each client has its own
+        :param float loop_timeout: How long `loop` waits for a message, in seconds, defaults to 2.
+            This can't be less than the socket timeout of the transport
         """
         self._callback = callback
         self._socket_pool = socket_pool
@@ -319,36 +629,116 @@ class IoTMQTT:
         self._auth_response_received = False
         self._mqtts = None
         self._device_id = device_id
+        self._module_id = module_id
+        self._client_id = device_id if module_id is None else device_id + "/" + module_id
+        # The topics for the device or module identity start with this
+        self._identity_topic = (
+            f"devices/{device_id}/"
+            if module_id is None
+            else f"devices/{device_id}/modules/{module_id}/"
+        )
+        self._signer = signer if signer is not None else SasSigner()
         self._hostname = hostname
+        self._broker = gateway_hostname if gateway_hostname is not None else hostname
+        self._loop_timeout = loop_timeout
         self._device_sas_key = device_sas_key
         self._token_expires = token_expires
-        self._username = f"{self._hostname}/{device_id}/?api-version={constants.IOTC_API_VERSION}"
-        self._passwd = self._gen_sas_token()
+        self._username = (
+            f"{self._hostname}/{self._client_id}/?api-version={constants.IOTC_API_VERSION}"
+        )
+        # With X.509 the TLS handshake authenticates the device, so there is no token to sign.
+        # The password is empty rather than None, as MiniMQTT encodes it whenever there is a
+        # username
+        self._passwd = self._gen_sas_token() if device_sas_key is not None else ""
         if logger is not None:
             self._logger = logger
         else:
             self._logger = logging.getLogger("log")
             self._logger.addHandler(logging.StreamHandler())
         self._is_subscribed_to_twins = False
+        self._is_subscribed_to_twin_responses = False
+        self._stats = stats if stats is not None else IoTStats(enabled=False)
+        self._requests = RequestCorrelator(request_timeout)
+        self._transport = transport if transport is not None else minimqtt_transport
+        self._persistent_session = persistent_session
+        self._session_present = False
+        self._session_subscriptions = set()
+        self._twin_received = False
+        self._router = TopicRouter(device_id, module_id)
+        self._route_handlers = {
+            ROUTE_CLOUD_TO_DEVICE: self._handle_cloud_to_device_message,
+            ROUTE_DIRECT_METHOD: self._handle_direct_method,
+            ROUTE_MODULE_INPUT: self._handle_module_input_message,
+            ROUTE_TWIN_DESIRED: self._handle_device_twin_update,
+            ROUTE_TWIN_RESPONSE: self._handle_twin_response,
+        }
+        if isinstance(keep_alive, KeepAliveController):
+            self._keep_alive_controller = keep_alive
+            self._keep_alive = keep_alive.interval
+        else:
+            self._keep_alive_controller = None
+            self._keep_alive = keep_alive
+        self._method_executor = method_executor if method_executor is not None else MethodExecutor()
+        self._method_timeout = method_timeout
+        self._pending_methods = {}
+        self._inbound_queue = inbound_queue
+        self._twin_cache = twin_cache
+        self._twin_refresh_needed = False
+        self._reported_writer = ReportedPropertyWriter(self.send_twin_patch, reported_debounce)
+        self._reported_version = None
+
+    def _negotiated_keep_alive(self) -> int:
+        if self._keep_alive_controller is not None:
+            return self._keep_alive_controller.negotiated_keep_alive
+        return self._keep_alive
+
+    def _apply_keep_alive(self) -> None:
+        # The broker was given the longest keep-alive when connecting, so the client can ping as
+        # often as the controller chooses without the broker timing out the connection
+        if self._keep_alive_controller is not None and self._mqtts is not None:
+            self._mqtts.keep_alive = self._keep_alive_controller.interval
+
+    def _subscribe(self, topic: str) -> None:
+        if self._session_present and topic in self._session_subscriptions:
+            self._logger.debug("- iot_mqtt :: _subscribe :: held by session :: " + topic)
+            self._stats.increment("subscribes_skipped")
+            return
 
-    def _subscribe_to_core_topics(self):
-        device_bound_topic = f"devices/{self._device_id}/messages/devicebound/#"
-        self._mqtts.add_topic_callback(device_bound_topic, self._handle_cloud_to_device_message)
-        self._mqtts.subscribe(device_bound_topic)
+        if self._persistent_session:
+            self._mqtts.subscribe(topic, 1)
+            self._session_subscriptions.add(topic)
+        else:
+            self._mqtts.subscribe(topic)
 
-        self._mqtts.add_topic_callback("$iothub/methods/#", self._handle_direct_method)
-        self._mqtts.subscribe("$iothub/methods/#")
+    def _subscribe_to_core_topics(self):
+        if self._module_id is None:
+            self._subscribe(f"devices/{self._device_id}/messages/devicebound/#")
+        else:
+            # Modules don't get cloud to device messages, only messages routed to their inputs
+            self._subscribe(self._identity_topic + "inputs/#")
+        self._subscribe("$iothub/methods/#")
 
     def _subscribe_to_twin_topics(self):
-        self._mqtts.add_topic_callback(
-            "$iothub/twin/PATCH/properties/desired/#", self._handle_device_twin_update
-        )
-        self._mqtts.subscribe(
-            "$iothub/twin/PATCH/properties/desired/#"
-        )  # twin desired property changes
+        # twin desired property changes
+        self._subscribe("$iothub/twin/PATCH/properties/desired/#")
+        # twin properties response
+        self._subscribe_to_twin_responses()
+
+    def _subscribe_to_twin_responses(self):
+        # Twin requests and reported property patches need the responses even without the rest
+        # of the twin topics
+        self._subscribe("$iothub/twin/res/#")
+        self._is_subscribed_to_twin_responses = True
+
+    def _request_twin_if_needed(self) -> None:
+        # A resumed session still holds the desired property subscription, so any changes made
+        # while offline are queued by the hub and the twin we already have is still current
+        if self._session_present and self._twin_received:
+            self._logger.debug("- iot_mqtt :: _request_twin_if_needed :: twin still current")
+            self._stats.increment("twin_requests_skipped")
+            return
 
-        self._mqtts.add_topic_callback("$iothub/twin/res/200/#", self._handle_device_twin_update)
-        self._mqtts.subscribe("$iothub/twin/res/200/#")  # twin properties response
+        self._get_device_settings()
 
     def connect(self) -> bool:
         """Connects to the MQTT broker
@@ -356,7 +746,7 @@ class IoTMQTT:
         :returns: True if the connection is successful, otherwise False
         :rtype: bool
         """
-        self._logger.info("- iot_mqtt :: connect :: " + self._hostname)
+        self._logger.info("- iot_mqtt :: connect :: " + self._broker)
 
         self._create_mqtt_client()
 
@@ -372,7 +762,9 @@ class IoTMQTT:
             return False
 
         self._auth_response_received = True
+        self._apply_keep_alive()
 
+        self._is_subscribed_to_twin_responses = False
         self._subscribe_to_core_topics()
 
         return True
@@ -387,7 +779,7 @@ class IoTMQTT:
         # do this separately as this is not supported in B1 hubs
         self._subscribe_to_twin_topics()
 
-        self._get_device_settings()
+        self._request_twin_if_needed()
 
         self._is_subscribed_to_twins = True
 
@@ -397,13 +789,82 @@ class IoTMQTT:
             return
 
         self._logger.info("- iot_mqtt :: disconnect :: ")
+        self.flush_reported_properties()
         self._mqtts.disconnect()
 
     def reconnect(self) -> None:
         """Reconnects to the MQTT broker"""
         self._logger.info("- iot_mqtt :: reconnect :: ")
 
-        self._mqtts.reconnect()
+        self._stats.increment("reconnects")
+
+        # MiniMQTT sends the client ping interval as the keep-alive when reconnecting, so put the
+        # longest one back first
+        self._mqtts.keep_alive = self._negotiated_keep_alive()
+
+        if not self._persistent_session:
+            self._mqtts.reconnect()
+            self._apply_keep_alive()
+            return
+
+        # MiniMQTT always reconnects with a clean session and subscribes to everything again,
+        # so handle persistent sessions here
+        if self._mqtts.is_connected():
+            self._mqtts.disconnect()
+        self._mqtts.connect(clean_session=False, session_id=self._client_id)
+        self._apply_keep_alive()
+
+        self._subscribe_to_core_topics()
+        if self._is_subscribed_to_twins:
+            self._subscribe_to_twin_topics()
+            self._request_twin_if_needed()
+        elif self._is_subscribed_to_twin_responses:
+            self._subscribe_to_twin_responses()
+
+    @property
+    def pending_methods(self) -> int:
+        """The number of direct methods that have not been responded to yet"""
+        return len(self._pending_methods)
+
+    @property
+    def inbound_queue(self) -> InboundQueue:
+        """The queue of received messages waiting for their callbacks, or None if callbacks are
+        called as messages are received"""
+        return self._inbound_queue
+
+    @property
+    def module_id(self) -> Optional[str]:
+        """The id of the module this client connects as, or None for a device"""
+        return self._module_id
+
+    @property
+    def broker(self) -> str:
+        """The hostname connected to, which is the gateway when connecting through one"""
+        return self._broker
+
+    @property
+    def reported_version(self) -> Optional[int]:
+        """The reported properties version from the last patch the hub acknowledged, or None if
+        no patch has been acknowledged"""
+        return self._reported_version
+
+    @property
+    def reported_writer(self) -> ReportedPropertyWriter:
+        """The writer that coalesces reported property updates and backs off when the hub
+        throttles them"""
+        return self._reported_writer
+
+    @property
+    def stats(self) -> IoTStats:
+        """The performance metrics for this connection"""
+        return self._stats
+
+    @property
+    def keep_alive(self) -> int:
+        """The interval between keep-alive pings, in seconds"""
+        if self._keep_alive_controller is not None:
+            return self._keep_alive_controller.interval
+        return self._keep_alive
 
     def is_connected(self) -> bool:
         """Gets if there is an open connection to the MQTT broker
@@ -418,19 +879,47 @@ class IoTMQTT:
         if not self.is_connected():
             return
 
-        self._mqtts.loop(2)
+        controller = self._keep_alive_controller
+        if controller is None:
+            self._mqtts.loop(self._loop_timeout)
+        else:
+            try:
+                packet_types = self._mqtts.loop(self._loop_timeout)
+            except (OSError, MMQTTException):
+                # Only transport failures, as callbacks run in loop and can raise too
+                controller.link_lost()
+                self._logger.info(
+                    "- iot_mqtt :: loop :: link lost, ping interval now " + str(controller.interval)
+                )
+                raise
+
+            if packet_types and _MQTT_PINGRESP in packet_types:
+                controller.ping_succeeded()
+                self._apply_keep_alive()
+
+        self._dispatch_inbound()
+        self._service_methods()
+        self._poll_reported_writer()
+        self._expire_requests()
+        if self._twin_refresh_needed:
+            self._stats.increment("twin_refreshes")
+            self._request_twin()
         gc.collect()
 
-    def send_device_to_cloud_message(self, message, system_properties: dict = None) -> None:
+    def send_device_to_cloud_message(
+        self, message, system_properties: dict = None, property_bag: str = None
+    ) -> None:
         """Send a device to cloud message from this device to Azure IoT Hub
 
         :param message: The message data as a JSON string or a dictionary
         :param system_properties: System properties to send with the message
+        :param str property_bag: Properties to send with the message that are already encoded,
+            such as ``"$.sub=thermostat1"``, for callers that build them once
         :raises: ValueError if the message is not a string or dictionary
         :raises RuntimeError: if the internet connection is not responding or is unable to connect
         """
-        self._logger.info("- iot_mqtt :: send_device_to_cloud_message :: " + message)
-        topic = f"devices/{self._device_id}/messages/events/"
+        self._logger.info("- iot_mqtt :: send_device_to_cloud_message :: " + str(message))
+        topic = self._identity_topic + "messages/events/"
 
         if system_properties is not None:
             firstProp = True
@@ -441,6 +930,11 @@ class IoTMQTT:
                     firstProp = False
                 topic += prop + "=" + str(value)
 
+        if property_bag:
+            if system_properties:
+                topic += "&"
+            topic += property_bag
+
         # Convert message to a string
         if isinstance(message, dict):
             message = json.dumps(message)
@@ -451,13 +945,94 @@ class IoTMQTT:
         self._send_common(topic, message)
         self._callback.message_sent(message)
 
-    def send_twin_patch(self, patch) -> None:
-        """Send a patch for the reported properties of the device twin
+    def request_twin(self) -> PendingRequest:
+        """Requests the full device twin without waiting for it. The twin is also passed to the
+        twin callbacks when it arrives
+
+        :returns: The pending request. Once it is done, ``result`` is the twin, or ``status`` and
+            ``error`` show why the request failed
+        :rtype: PendingRequest
+        """
+        self._logger.info("- iot_mqtt :: request_twin :: ")
+        return self._request_twin()
+
+    def get_twin(self, timeout: float = 10) -> dict:
+        """Requests the full device twin, calling `loop` until it arrives
+
+        :param float timeout: How long to wait for the twin, in seconds
+        :returns: The twin
+        :rtype: dict
+        :raises IoTError: if the request fails or times out
+        """
+        request = self._request_twin()
+        deadline = time.monotonic() + timeout
+        while not request.done:
+            if time.monotonic() >= deadline:
+                self._requests.cancel(request.request_id)
+                raise IoTError("Timed out waiting for the device twin")
+            self.loop()
+
+        if not request.succeeded:
+            raise IoTError("Device twin request failed: " + str(request.error))
+        return request.result
+
+    def send_twin_patch(self, patch) -> PendingRequest:
+        """Send a patch for the reported properties of the device twin straight away
 
         :param patch: The patch as a JSON string or a dictionary
+        :returns: The pending request, which is done when the hub acknowledges the patch
+        :rtype: PendingRequest
         :raises: IoTError if the data is not a string or dictionary
         :raises RuntimeError: if the internet connection is not responding or is unable to connect
         """
         self._logger.info("- iot_mqtt :: sendProperty :: " + str(patch))
-        topic = f"$iothub/twin/PATCH/properties/reported/?$rid={int(time.time())}"
-        self._send_common(topic, patch)
+        if not self._is_subscribed_to_twin_responses:
+            self._subscribe_to_twin_responses()
+
+        request = self._requests.start(REQUEST_TWIN_PATCH)
+        # Keep the patch, so it can be sent again if the hub throttles it
+        request.context = patch if isinstance(patch, dict) else json.loads(patch)
+        topic = f"$iothub/twin/PATCH/properties/reported/?$rid={request.request_id}"
+        try:
+            self._send_common(topic, patch)
+        except Exception:
+            self._requests.cancel(request.request_id)
+            raise
+        self._stats.increment("twin_patches_sent")
+
+        if self._twin_cache is not None:
+            self._twin_cache.apply_reported_patch(request.context)
+        return request
+
+    def update_reported_properties(self, patch) -> None:
+        """Updates the reported properties of the device twin. If a debounce window is set the
+        patch is merged with any others made in the window and sent when it ends, otherwise it is
+        sent straight away. Only the values that differ from the acknowledged reported properties
+        are sent, and patches that change nothing are not sent at all
+
+        :param patch: The patch as a JSON string or a dictionary
+        """
+        writer = self._reported_writer
+        suppressed = writer.suppressed
+        if writer.update(patch):
+            self._stats.increment("twin_patches_coalesced")
+        if writer.debounce <= 0:
+            # Send straight away, unless the hub is throttling
+            writer.poll()
+        self._count_suppressed_writes(suppressed)
+
+    def flush_reported_properties(self) -> None:
+        """Sends any reported property updates that are waiting for the debounce window to end"""
+        suppressed = self._reported_writer.suppressed
+        self._reported_writer.flush()
+        self._count_suppressed_writes(suppressed)
+
+    def _poll_reported_writer(self) -> None:
+        suppressed = self._reported_writer.suppressed
+        self._reported_writer.poll()
+        self._count_suppressed_writes(suppressed)
+
+    def _count_suppressed_writes(self, before: int) -> None:
+        suppressed = self._reported_writer.suppressed - before
+        if suppressed:
+            self._stats.increment("twin_writes_suppressed", suppressed)
@@ -0,0 +1,218 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`iot_stats`
+=====================
+
+Low overhead performance counters and latency histograms for an Azure IoT connection
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Dict, Optional, Tuple
+except ImportError:
+    pass
+
+# The upper bounds of the latency histogram buckets, in seconds. Anything slower than the last
+# bucket is counted in an implicit +Inf bucket
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Counters that are always present in the exported statistics, even if they are still zero
+COUNTERS = (
+    "connects",
+    "reconnects",
+    "disconnects",
+    "messages_sent",
+    "bytes_sent",
+    "publish_retries",
+    "publish_failures",
+    "messages_received",
+    "bytes_received",
+    "c2d_messages_received",
+    "direct_methods_invoked",
+    "twin_updates_received",
+    "twin_patches_sent",
+)
+
+# Histograms that are always present in the exported statistics
+HISTOGRAMS = (
+    "publish_latency",
+    "direct_method_latency",
+    "twin_round_trip",
+)
+
+
+class LatencyHistogram:
+    """A histogram with fixed bucket boundaries, used to record latencies in seconds"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        """Creates a histogram
+
+        :param tuple buckets: The sorted upper bounds of the buckets, in seconds
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Records a value in the histogram
+
+        :param float value: The value to record, in seconds
+        """
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimates a quantile from the buckets, returning the upper bound of the bucket the
+        quantile falls in, or the largest value seen if it falls in the +Inf bucket
+
+        :param float q: The quantile to estimate, between 0 and 1
+        :returns: The estimated quantile in seconds, or None if nothing has been recorded
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank and bucket_count > 0:
+                return self.buckets[index] if index < len(self.buckets) else self.maximum
+        return self.maximum
+
+    def reset(self) -> None:
+        """Clears all recorded values"""
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def as_dict(self) -> dict:
+        """Gets the histogram as a dictionary
+
+        :returns: The bucket counts keyed by upper bound, along with the count, sum and maximum
+        :rtype: dict
+        """
+        buckets = {}
+        for index, bound in enumerate(self.buckets):
+            buckets[str(bound)] = self.counts[index]
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.maximum,
+            "buckets": buckets,
+        }
+
+
+class IoTStats:
+    """Performance counters and latency histograms for an Azure IoT connection.
+
+    All recording methods return immediately when ``enabled`` is False, so a disabled stats
+    object costs a single attribute check per event.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        """Creates the stats object
+
+        :param bool enabled: True to record statistics, False to ignore all events
+        :param tuple buckets: The upper bounds of the latency histogram buckets, in seconds
+        """
+        self.enabled = enabled
+        self._buckets = buckets
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.reset()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Increments a counter
+
+        :param str name: The name of the counter
+        :param int value: The amount to add to the counter, defaults to 1
+        """
+        if not self.enabled:
+            return
+
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Records a latency in a histogram
+
+        :param str name: The name of the histogram
+        :param float seconds: The latency to record, in seconds
+        """
+        if not self.enabled:
+            return
+
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = LatencyHistogram(self._buckets)
+            self.histograms[name] = histogram
+        histogram.observe(seconds)
+
+    def reset(self) -> None:
+        """Resets all counters and histograms to zero"""
+        self.counters = {name: 0 for name in COUNTERS}
+        self.histograms = {name: LatencyHistogram(self._buckets) for name in HISTOGRAMS}
+
+    def as_dict(self) -> dict:
+        """Gets all the statistics as a dictionary, suitable for sending as telemetry
+
+        :returns: A dictionary with a ``counters`` and a ``histograms`` entry
+        :rtype: dict
+        """
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: hist.as_dict() for name, hist in self.histograms.items()},
+        }
+
+    def to_prometheus(self, prefix: str = "azureiot", labels: dict = None) -> str:
+        """Gets all the statistics in the Prometheus text exposition format
+
+        :param str prefix: The prefix to add to all the metric names
+        :param dict labels: Labels to add to every sample, for example ``{"device": device_id}``
+        :returns: The statistics as Prometheus text
+        :rtype: str
+        """
+        label_text = ""
+        if labels:
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+        lines = []
+        for name, value in self.counters.items():
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+
+        separator = "," if label_text else ""
+        for name, histogram in self.histograms.items():
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for index, bound in enumerate(histogram.buckets):
+                cumulative += histogram.counts[index]
+                lines.append(f'{metric}_bucket{{{label_text}{separator}le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label_text}{separator}le="+Inf"}} {histogram.count}')
+            braces = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{metric}_sum{braces} {histogram.total}")
+            lines.append(f"{metric}_count{braces} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
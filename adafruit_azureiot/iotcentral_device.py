@@ -12,15 +12,41 @@ Connectivity to Azure IoT Central
 * Author(s): Jim Bennett, Elena Horton
 """
 
+try:
+    from typing import Union
+except ImportError:
+    pass
+
 import json
 import time
 
 import adafruit_logging as logging
 from adafruit_logging import Logger
+from adafruit_minimqtt.adafruit_minimqtt import (
+    CONNACK_ERROR_INCORECT_USERNAME_PASSWORD,
+    CONNACK_ERROR_UNAUTHORIZED,
+    MMQTTException,
+)
 
+from .assignment_cache import AssignmentCache
 from .device_registration import DeviceRegistration
+from .dtdl_model import DeviceModel
+from .inbound_queue import InboundQueue
 from .iot_error import IoTError
 from .iot_mqtt import IoTMQTT, IoTMQTTCallback, IoTResponse
+from .iot_stats import IoTStats
+from .keep_alive import KeepAliveController
+from .method_executor import MethodExecutor
+from .method_registry import MethodRegistry
+from .property_acks import COMPONENT_MARKER, PropertyAckBatcher, is_component
+from .request_correlator import PendingRequest
+from .tls_session import TLSSessionCache
+from .twin_cache import TwinCache
+from .twin_paths import TwinPathIndex
+from .x509 import load_client_certificate
+
+# The connection errors that mean the hub doesn't accept the device
+_AUTH_FAILURES = (CONNACK_ERROR_INCORECT_USERNAME_PASSWORD, CONNACK_ERROR_UNAUTHORIZED)
 
 
 class IoTCentralDevice(IoTMQTTCallback):
@@ -34,7 +60,7 @@ class IoTCentralDevice(IoTMQTTCallback):
         if self.on_connection_status_changed is not None:
             self.on_connection_status_changed(connected)
 
-    def direct_method_called(self, method_name: str, payload: str) -> IoTResponse:
+    def direct_method_invoked(self, method_name: str, payload: str) -> IoTResponse:
         """Called when a direct method is invoked
 
         :param str method_name: The name of the method that was invoked
@@ -42,25 +68,39 @@ class IoTCentralDevice(IoTMQTTCallback):
         :returns: A response with a code and status to show if the method was correctly handled
         :rtype: IoTResponse
         """
+        response = self._commands.dispatch(method_name, payload)
+        if response is not None:
+            return response
+
         if self.on_command_executed is not None:
             return self.on_command_executed(method_name, payload)
 
         raise IoTError("on_command_executed not set")
 
-    def device_twin_desired_updated(
-        self, desired_property_name: str, desired_property_value, desired_version: int
-    ) -> None:
-        """Called when the device twin desired properties are updated
+    def device_twin_desired_patched(self, patch: dict, desired_version: int) -> None:
+        """Called once for each update of the device twin desired properties
 
-        :param str desired_property_name: The name of the desired property that was updated
-        :param desired_property_value: The value of the desired property that was updated
-        :param int desired_version: The version of the desired property that was updated
+        :param dict patch: The desired properties that were updated, without the ``$version``
+        :param int desired_version: The version of the desired properties
         """
-        if self.on_property_changed is not None:
-            self.on_property_changed(desired_property_name, desired_property_value, desired_version)
+        if self.on_properties_changed is not None:
+            self.on_properties_changed(patch, desired_version)
 
-        # when a desired property changes, update the reported to match to keep them in sync
-        self.send_property(desired_property_name, desired_property_value)
+        self._desired_paths.dispatch(patch, desired_version)
+
+        acks = PropertyAckBatcher(desired_version)
+        for property_name, value in patch.items():
+            response = None
+            if self.on_property_changed is not None:
+                response = self.on_property_changed(property_name, value, desired_version)
+            if isinstance(response, IoTResponse) and not is_component(value):
+                acks.ack(property_name, value, response.response_code, response.response_message)
+            else:
+                acks.ack_patch({property_name: value})
+
+        # acknowledge all the properties in one patch, rather than one per property
+        if len(acks) > 0 and self._mqtt is not None:
+            self._mqtt.update_reported_properties(acks.build())
 
     def device_twin_reported_updated(
         self,
@@ -88,6 +128,20 @@ class IoTCentralDevice(IoTMQTTCallback):
         device_sas_key: str,
         token_expires: int = 21600,
         logger: Logger = None,
+        enable_stats: bool = False,
+        transport=None,
+        persistent_session: bool = False,
+        tls_session_cache: TLSSessionCache = None,
+        keep_alive: Union[int, KeepAliveController] = 120,
+        method_executor: MethodExecutor = None,
+        method_timeout: float = 28,
+        inbound_queue: InboundQueue = None,
+        twin_cache: TwinCache = None,
+        reported_debounce: float = 0,
+        model: DeviceModel = None,
+        assignment_cache: AssignmentCache = None,
+        client_certificate: str = None,
+        client_key: str = None,
     ):
         """Create the Azure IoT Central device client
 
@@ -95,9 +149,42 @@ class IoTCentralDevice(IoTMQTTCallback):
         :param iface: The network interface
         :param str id_scope: The ID Scope of the device in IoT Central
         :param str device_id: The device ID of the device in IoT Central
-        :param str device_sas_key: The primary or secondary key of the device in IoT Central
+        :param str device_sas_key: The primary or secondary key of the device in IoT Central, or
+            None to authenticate with an X.509 certificate
         :param int token_expires: The number of seconds till the token expires, defaults to 6 hours
         :param Logger logger: The logger
+        :param bool enable_stats: True to record performance metrics in `stats`, defaults to False
+        :param transport: The MQTT transport to connect with, see `adafruit_azureiot.transport`.
+            Defaults to a MiniMQTT client
+        :param bool persistent_session: True to use a persistent MQTT session, so reconnecting
+            skips subscriptions and twin requests the hub still holds, defaults to False
+        :param TLSSessionCache tls_session_cache: The cache of TLS sessions to resume when
+            reconnecting. Pass the same cache to several devices to share it, by default each
+            device has its own
+        :param keep_alive: The keep-alive interval in seconds, or a `KeepAliveController` to
+            learn the longest safe ping interval for each network. Defaults to 120 seconds
+        :param MethodExecutor method_executor: Where method handlers run. Use a
+            `ThreadPoolMethodExecutor` so slow handlers don't block `loop`, defaults to running
+            them in `loop`, where handlers that return generators run as cooperative tasks
+        :param float method_timeout: How long a method handler has to finish before a 504
+            response is sent, in seconds, defaults to 28
+        :param InboundQueue inbound_queue: A bounded queue that holds received messages until
+            the socket read in `loop` has finished, so slow callbacks don't delay it. By default
+            callbacks run while the socket is read
+        :param TwinCache twin_cache: A cache to keep a local copy of the device twin in, so it
+            can be read without a round trip to the hub. By default the twin is not kept
+        :param float reported_debounce: How long to collect property updates for before sending
+            them as one twin patch, in seconds. Defaults to 0, which sends each one straight away
+        :param DeviceModel model: The DTDL model of the device. With a model, telemetry and
+            properties are checked and encoded with the precompiled schema of their component
+        :param AssignmentCache assignment_cache: A cache of the hub DPS assigned the device to,
+            so connecting can skip registering with DPS. By default the device registers every
+            time it connects
+        :param str client_certificate: The path of the PEM file with the X.509 certificate of the
+            device, loaded into the SSL context in ``iface``, used when ``device_sas_key`` is
+            None. On boards that set the certificate on a network co-processor, leave this out
+        :param str client_key: The path of the PEM file with the private key of the certificate,
+            if it is not in the certificate file
         """
         self._socket = socket
         self._iface = iface
@@ -105,6 +192,8 @@ class IoTCentralDevice(IoTMQTTCallback):
         self._device_id = device_id
         self._device_sas_key = device_sas_key
         self._token_expires = token_expires
+        if client_certificate is not None:
+            load_client_certificate(iface, client_certificate, client_key)
         if logger is not None:
             self._logger = logger
         else:
@@ -112,6 +201,21 @@ class IoTCentralDevice(IoTMQTTCallback):
             self._logger.addHandler(logging.StreamHandler())
         self._device_registration = None
         self._mqtt = None
+        self._stats = IoTStats(enabled=enable_stats)
+        self._transport = transport
+        self._persistent_session = persistent_session
+        self._tls_sessions = (
+            tls_session_cache if tls_session_cache is not None else TLSSessionCache(self._stats)
+        )
+        self._keep_alive = keep_alive
+        self._method_executor = method_executor
+        self._method_timeout = method_timeout
+        self._inbound_queue = inbound_queue
+        self._twin_cache = twin_cache
+        self._reported_debounce = reported_debounce
+        self._model = model
+        self._assignment_cache = assignment_cache
+        self._commands = MethodRegistry()
 
         self.on_connection_status_changed = None
         """A callback method that is called when the connection status is changed.
@@ -136,43 +240,188 @@ class IoTCentralDevice(IoTMQTTCallback):
         """A callback method that is called when property values are updated.
         This method should have the following signature:
         def property_changed(_property_name: str, property_value, version: int) -> None
+
+        Writable properties are acknowledged to IoT Central as applied with a status of 200. To
+        report a different result, return an IoTResponse with the status code and description:
+
+        return IoTResponse(400, "Value out of range")
         """
 
-    def connect(self) -> None:
-        """Connects to Azure IoT Central
+        self.on_properties_changed = None
+        """A callback method that is called once for each update of the writable properties,
+        with all the properties that changed. This method should have the following signature:
+        def properties_changed(properties: dict, version: int) -> None
+        """
 
-        :raises DeviceRegistrationError: if the device cannot be registered successfully
-        :raises RuntimeError: if the internet connection is not responding or is unable to connect
+        self._desired_paths = TwinPathIndex()
+
+    @property
+    def model(self) -> DeviceModel:
+        """The DTDL model of the device, or None if the device was not created with one"""
+        return self._model
+
+    @property
+    def commands(self) -> MethodRegistry:
+        """The handlers for commands, looked up by command name. Commands without a registered
+        handler are passed to the registry's default handler if it has one, then to
+        `on_command_executed`::
+
+            device.commands.register("setInterval", set_interval, decode_json=True)
         """
+        return self._commands
+
+    @property
+    def desired_paths(self) -> TwinPathIndex:
+        """Callbacks for paths in the writable properties, called only when an update changes
+        their path::
+
+            device.desired_paths.subscribe("config.sampling.rate", sampling_rate_changed)
+        """
+        return self._desired_paths
+
+    @property
+    def twin_cache(self) -> TwinCache:
+        """The local copy of the device twin, or None if the device was not created with one"""
+        return self._twin_cache
+
+    @property
+    def reported_version(self) -> int:
+        """The reported properties version from the last patch the hub acknowledged, or None if
+        no patch has been acknowledged since connecting"""
+        if self._mqtt is None:
+            return None
+        return self._mqtt.reported_version
+
+    @property
+    def stats(self) -> IoTStats:
+        """The performance metrics for this device. These are kept across connections, and can
+        be exported with `IoTStats.as_dict` or `IoTStats.to_prometheus`. Set ``stats.enabled``
+        to turn recording on or off at any time.
+        """
+        return self._stats
+
+    @property
+    def tls_sessions(self) -> TLSSessionCache:
+        """The TLS session cache used by this device, showing how often sessions are resumed and
+        how much handshake time that saves
+        """
+        return self._tls_sessions
+
+    @property
+    def keep_alive(self) -> int:
+        """The interval between keep-alive pings currently in use, in seconds. When a
+        `KeepAliveController` is used this is the interval it has chosen for the current network
+        """
+        if isinstance(self._keep_alive, KeepAliveController):
+            return self._keep_alive.interval
+        return self._keep_alive
+
+    def _register(self, ssl_context) -> str:
         self._device_registration = DeviceRegistration(
             self._socket,
-            self._iface,
+            ssl_context,
             self._id_scope,
             self._device_id,
             self._device_sas_key,
             self._logger,
+            transport=self._transport,
+            keep_alive=self.keep_alive,
         )
 
         token_expiry = int(time.time() + self._token_expires)
         hostname = self._device_registration.register_device(token_expiry)
+        self._stats.increment("dps_registrations")
+        if self._assignment_cache is not None:
+            self._assignment_cache.put(self._id_scope, self._device_id, hostname)
+        return hostname
+
+    def _connect_to_hub(self, ssl_context, hostname: str) -> None:
         self._mqtt = IoTMQTT(
             self,
             self._socket,
-            self._iface,
+            ssl_context,
             hostname,
             self._device_id,
             self._device_sas_key,
             self._token_expires,
             self._logger,
+            stats=self._stats,
+            transport=self._transport,
+            persistent_session=self._persistent_session,
+            keep_alive=self._keep_alive,
+            method_executor=self._method_executor,
+            method_timeout=self._method_timeout,
+            inbound_queue=self._inbound_queue,
+            twin_cache=self._twin_cache,
+            reported_debounce=self._reported_debounce,
         )
 
         self._logger.debug("Hostname: " + hostname)
         self._logger.debug("Device Id: " + self._device_id)
-        self._logger.debug("Shared Access Key: " + self._device_sas_key)
+        if self._device_sas_key is not None:
+            self._logger.debug("Shared Access Key: " + self._device_sas_key)
 
         self._mqtt.connect()
+
+    def connect(self) -> None:
+        """Connects to Azure IoT Central. With an assignment cache the device connects straight
+        to the hub it was last assigned to, and only registers with DPS when the assignment has
+        expired or the hub rejects the device
+
+        :raises DeviceRegistrationError: if the device cannot be registered successfully
+        :raises RuntimeError: if the internet connection is not responding or is unable to connect
+        """
+        ssl_context = self._tls_sessions.wrap_context(self._iface)
+
+        hostname = None
+        if self._assignment_cache is not None:
+            hostname = self._assignment_cache.get(self._id_scope, self._device_id)
+            self._stats.increment("dps_cache_hits" if hostname else "dps_cache_misses")
+
+        if hostname is None:
+            self._connect_to_hub(ssl_context, self._register(ssl_context))
+        else:
+            try:
+                self._connect_to_hub(ssl_context, hostname)
+            except MMQTTException as error:
+                if error.code not in _AUTH_FAILURES:
+                    raise
+                # The device may have been moved to another hub, so ask DPS again
+                self._logger.info(
+                    "- iotcentral_device :: connect :: cached hub rejected the device, registering"
+                )
+                self._stats.increment("dps_cache_rejected")
+                self._assignment_cache.invalidate(self._id_scope, self._device_id)
+                self._connect_to_hub(ssl_context, self._register(ssl_context))
+
         self._mqtt.subscribe_to_twins()
 
+    def request_twin(self) -> PendingRequest:
+        """Requests the full device twin without waiting for it. Call `loop` until the request
+        is done, then read the twin from its ``result``
+
+        :returns: The pending request
+        :rtype: PendingRequest
+        :raises IoTError: if there is no open connection to the MQTT broker
+        """
+        if self._mqtt is None:
+            raise IoTError("You are not connected to IoT Central")
+
+        return self._mqtt.request_twin()
+
+    def get_twin(self, timeout: float = 10) -> dict:
+        """Requests the full device twin and waits for it
+
+        :param float timeout: How long to wait for the twin, in seconds
+        :returns: The twin, with ``desired`` and ``reported`` properties
+        :rtype: dict
+        :raises IoTError: if there is no open connection, or the request fails or times out
+        """
+        if self._mqtt is None:
+            raise IoTError("You are not connected to IoT Central")
+
+        return self._mqtt.get_twin(timeout)
+
     def disconnect(self) -> None:
         """Disconnects from the MQTT broker
 
@@ -208,30 +457,72 @@ class IoTCentralDevice(IoTMQTTCallback):
 
         self._mqtt.loop()
 
-    def send_property(self, property_name: str, value) -> None:
-        """Updates the value of a writable property
+    def send_property(self, property_name: str, value, component: str = None) -> None:
+        """Updates the value of a writable property. The property is not sent again if it already
+        has this value
 
         :param str property_name: The name of the property to write to
         :param value: The value to set on the property
+        :param str component: The name of the component the property is in, or None
         :raises IoTError: if there is no open connection to the MQTT broker
+        :raises ValueError: if there is a model and the property is not in it
+        """
+        self.send_properties({property_name: value}, component)
+
+    def send_properties(self, properties: dict, component: str = None) -> None:
+        """Updates the values of several properties in one twin write
+
+        :param dict properties: The values of the properties, by name
+        :param str component: The name of the component the properties are in, or None
+        :raises IoTError: if there is no open connection to the MQTT broker
+        :raises ValueError: if there is a model and a property is not in it
         """
         if self._mqtt is None:
             raise IoTError("You are not connected to IoT Central")
 
-        patch_json = {property_name: value}
-        patch = json.dumps(patch_json)
-        self._mqtt.send_twin_patch(patch)
+        if self._model is not None:
+            patch = self._model.component(component).property_patch(properties)
+        elif component is not None:
+            patch = {component: dict(properties)}
+            patch[component][COMPONENT_MARKER] = "c"
+        else:
+            patch = properties
+        self._mqtt.update_reported_properties(patch)
+
+    def flush_properties(self) -> None:
+        """Sends any property updates that are waiting for the debounce window to end
 
-    def send_telemetry(self, data) -> None:
+        :raises IoTError: if there is no open connection to the MQTT broker
+        """
+        if self._mqtt is None:
+            raise IoTError("You are not connected to IoT Central")
+
+        self._mqtt.flush_reported_properties()
+
+    def send_telemetry(self, data, component: str = None) -> None:
         """Sends telemetry to the IoT Central app
 
         :param data: The telemetry data to send
+        :param str component: The name of the component the telemetry is from, or None
         :raises IoTError: if there is no open connection to the MQTT broker
+        :raises ValueError: if there is a model and a value is not in it
         """
         if self._mqtt is None:
             raise IoTError("You are not connected to IoT Central")
 
+        if self._model is not None:
+            schema = self._model.component(component)
+            if isinstance(data, str):
+                data = json.loads(data)
+            self._mqtt.send_device_to_cloud_message(
+                schema.encode_telemetry(data), property_bag=schema.property_bag
+            )
+            return
+
         if isinstance(data, dict):
             data = json.dumps(data)
 
-        self._mqtt.send_device_to_cloud_message(data)
+        if component is not None:
+            self._mqtt.send_device_to_cloud_message(data, {"$.sub": component})
+        else:
+            self._mqtt.send_device_to_cloud_message(data)
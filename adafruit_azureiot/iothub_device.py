@@ -17,23 +17,46 @@ try:
 except ImportError:
     pass
 
-import json
+try:
+    import ssl
+except ImportError:
+    # Boards that use a network co-processor for TLS have no ssl module
+    ssl = None
 
 import adafruit_logging as logging
 from adafruit_logging import Logger
-
+from adafruit_minimqtt.adafruit_minimqtt import (
+    CONNACK_ERROR_SERVER_UNAVAILABLE,
+    CONNACK_ERRORS,
+    MMQTTException,
+)
+
+from .c2d_properties import C2DProperties
+from .inbound_queue import InboundQueue
 from .iot_error import IoTError
 from .iot_mqtt import IoTMQTT, IoTMQTTCallback, IoTResponse
-
-
-def _validate_keys(connection_string_parts: Mapping) -> None:
+from .iot_stats import IoTStats
+from .keep_alive import KeepAliveController
+from .method_executor import MethodExecutor
+from .method_registry import MethodRegistry
+from .quote import quote
+from .request_correlator import PendingRequest
+from .sas_signer import SasSigner
+from .tls_session import TLSSessionCache
+from .twin_cache import TwinCache
+from .twin_paths import TwinPathIndex
+from .x509 import load_client_certificate
+
+
+def _validate_keys(connection_string_parts: Mapping, x509: bool = False) -> None:
     """Raise ValueError if incorrect combination of keys"""
     host_name = connection_string_parts.get(HOST_NAME)
     shared_access_key_name = connection_string_parts.get(SHARED_ACCESS_KEY_NAME)
     shared_access_key = connection_string_parts.get(SHARED_ACCESS_KEY)
     device_id = connection_string_parts.get(DEVICE_ID)
+    x509 = x509 or connection_string_parts.get(X509, "").lower() == "true"
 
-    if host_name and device_id and shared_access_key:
+    if host_name and device_id and (shared_access_key or x509):
         pass
     elif host_name and shared_access_key and shared_access_key_name:
         pass
@@ -41,6 +64,22 @@ def _validate_keys(connection_string_parts: Mapping) -> None:
         raise ValueError("Invalid Connection String - Incomplete")
 
 
+def _is_refused(error: Exception) -> bool:
+    """Gets if a connection failed because the broker refused it in the CONNACK, rather than
+    because it couldn't be reached. MiniMQTT retries some refusals, and raises a repeated
+    connect failures error caused by the refusal. A broker that is unavailable counts as not
+    reached"""
+    while error is not None:
+        if (
+            isinstance(error, MMQTTException)
+            and error.code in CONNACK_ERRORS
+            and error.code != CONNACK_ERROR_SERVER_UNAVAILABLE
+        ):
+            return True
+        error = getattr(error, "__cause__", None)
+    return False
+
+
 DELIMITER = ";"
 VALUE_SEPARATOR = "="
 
@@ -51,6 +90,7 @@ SHARED_ACCESS_SIGNATURE = "SharedAccessSignature"
 DEVICE_ID = "DeviceId"
 MODULE_ID = "ModuleId"
 GATEWAY_HOST_NAME = "GatewayHostName"
+X509 = "x509"
 
 VALID_KEYS = [
     HOST_NAME,
@@ -60,6 +100,7 @@ VALID_KEYS = [
     DEVICE_ID,
     MODULE_ID,
     GATEWAY_HOST_NAME,
+    X509,
 ]
 
 
@@ -82,20 +123,36 @@ class IoTHubDevice(IoTMQTTCallback):
         :returns: A response with a code and status to show if the method was correctly handled
         :rtype: IoTResponse
         """
+        response = self._methods.dispatch(method_name, payload)
+        if response is not None:
+            return response
+
         if self._on_direct_method_invoked is not None:
             return self._on_direct_method_invoked(method_name, payload)
 
         raise IoTError("on_direct_method_invoked not set")
 
-    def cloud_to_device_message_received(self, body: str, properties: dict) -> None:
+    def cloud_to_device_message_received(self, body: str, properties: C2DProperties) -> None:
         """Called when a cloud to device message is received
 
         :param str body: The body of the message
-        :param dict properties: The propreties sent with the mesage
+        :param C2DProperties properties: The properties sent with the message, URL decoded
         """
         if self._on_cloud_to_device_message_received is not None:
             self._on_cloud_to_device_message_received(body, properties)
 
+    def module_input_message_received(
+        self, input_name: str, body: str, properties: C2DProperties
+    ) -> None:
+        """Called when a message is received on an input of a module
+
+        :param str input_name: The name of the input the message was routed to
+        :param str body: The body of the message
+        :param C2DProperties properties: The properties sent with the message, URL decoded
+        """
+        if self._on_module_input_message_received is not None:
+            self._on_module_input_message_received(input_name, body, properties)
+
     def device_twin_desired_updated(
         self,
         desired_property_name: str,
@@ -113,6 +170,21 @@ class IoTHubDevice(IoTMQTTCallback):
                 desired_property_name, desired_property_value, desired_version
             )
 
+    def device_twin_desired_patched(self, patch: dict, desired_version: int) -> None:
+        """Called once for each update of the device twin desired properties
+
+        :param dict patch: The desired properties that were updated, without the ``$version``
+        :param int desired_version: The version of the desired properties
+        """
+        if self._on_device_twin_desired_patched is not None:
+            self._on_device_twin_desired_patched(patch, desired_version)
+
+        self._desired_paths.dispatch(patch, desired_version)
+
+        if self._on_device_twin_desired_updated is not None:
+            for property_name, value in patch.items():
+                self.device_twin_desired_updated(property_name, value, desired_version)
+
     def device_twin_reported_updated(
         self,
         reported_property_name: str,
@@ -137,6 +209,22 @@ class IoTHubDevice(IoTMQTTCallback):
         device_connection_string: str,
         token_expires: int = 21600,
         logger: Logger = None,
+        enable_stats: bool = False,
+        transport=None,
+        persistent_session: bool = False,
+        tls_session_cache: TLSSessionCache = None,
+        keep_alive: Union[int, KeepAliveController] = 120,
+        method_executor: MethodExecutor = None,
+        method_timeout: float = 28,
+        inbound_queue: InboundQueue = None,
+        twin_cache: TwinCache = None,
+        reported_debounce: float = 0,
+        gateway_trust_anchor: str = None,
+        gateway_ssl_context=None,
+        signer: SasSigner = None,
+        loop_timeout: float = 2,
+        client_certificate: str = None,
+        client_key: str = None,
     ):
         """Create the Azure IoT Central device client
 
@@ -145,6 +233,43 @@ class IoTHubDevice(IoTMQTTCallback):
         :param str device_connection_string: The Iot Hub device connection string
         :param int token_expires: The number of seconds till the token expires, defaults to 6 hours
         :param Logger logger: The logger
+        :param bool enable_stats: True to record performance metrics in `stats`, defaults to False
+        :param transport: The MQTT transport to connect with, see `adafruit_azureiot.transport`.
+            Defaults to a MiniMQTT client
+        :param bool persistent_session: True to use a persistent MQTT session, so reconnecting
+            skips subscriptions and twin requests the hub still holds, defaults to False
+        :param TLSSessionCache tls_session_cache: The cache of TLS sessions to resume when
+            reconnecting. Pass the same cache to several devices to share it, by default each
+            device has its own
+        :param keep_alive: The keep-alive interval in seconds, or a `KeepAliveController` to
+            learn the longest safe ping interval for each network. Defaults to 120 seconds
+        :param MethodExecutor method_executor: Where method handlers run. Use a
+            `ThreadPoolMethodExecutor` so slow handlers don't block `loop`, defaults to running
+            them in `loop`, where handlers that return generators run as cooperative tasks
+        :param float method_timeout: How long a method handler has to finish before a 504
+            response is sent, in seconds, defaults to 28
+        :param InboundQueue inbound_queue: A bounded queue that holds received messages until
+            the socket read in `loop` has finished, so slow callbacks don't delay it. By default
+            callbacks run while the socket is read
+        :param TwinCache twin_cache: A cache to keep a local copy of the device twin in, so it
+            can be read without a round trip to the hub. By default the twin is not kept
+        :param float reported_debounce: How long to collect property updates for before sending
+            them as one twin patch, in seconds. Defaults to 0, which sends each one straight away
+        :param str gateway_trust_anchor: The root CA certificate of the IoT Edge gateway set by
+            ``GatewayHostName`` in the connection string, as PEM text or the path of a PEM file.
+            It is loaded into a new SSL context used only for the gateway
+        :param gateway_ssl_context: The SSL context to connect to the gateway with, instead of
+            building one from ``gateway_trust_anchor``. Defaults to the context in ``iface``
+        :param SasSigner signer: The signer that makes the SAS tokens, which caches tokens so
+            reconnecting doesn't sign a new one. Pass the same signer to several clients to
+            share it, by default each client has its own
+        :param float loop_timeout: How long `loop` waits for a message, in seconds, defaults to 2
+        :param str client_certificate: The path of the PEM file with the X.509 certificate of the
+            device, loaded into the SSL context in ``iface``. The device then authenticates with
+            the certificate instead of a SAS token. If the certificate is already in the SSL
+            context, put ``x509=true`` in the connection string instead
+        :param str client_key: The path of the PEM file with the private key of the certificate,
+            if it is not in the certificate file
         """
         self._socket = socket
         self._iface = iface
@@ -168,23 +293,136 @@ class IoTHubDevice(IoTMQTTCallback):
         if len(cs_args) != len(connection_string_values):
             raise ValueError("Invalid Connection String - Unable to parse")
 
-        _validate_keys(connection_string_values)
+        _validate_keys(connection_string_values, client_certificate is not None)
 
         self._hostname = connection_string_values[HOST_NAME]
         self._device_id = connection_string_values[DEVICE_ID]
-        self._shared_access_key = connection_string_values[SHARED_ACCESS_KEY]
+        self._module_id = connection_string_values.get(MODULE_ID)
+        self._shared_access_key = connection_string_values.get(SHARED_ACCESS_KEY)
+        self._x509 = (
+            connection_string_values.get(X509, "").lower() == "true"
+            or client_certificate is not None
+        )
+        self._client_certificate = client_certificate
+        self._client_key = client_key
+        if client_certificate is not None:
+            load_client_certificate(self._iface, client_certificate, client_key)
+        self._gateway_hostname = connection_string_values.get(GATEWAY_HOST_NAME)
+        self._gateway_trust_anchor = gateway_trust_anchor
+        self._gateway_ssl_context = gateway_ssl_context
+        self._connected_via_gateway = False
 
         self._logger.debug("Hostname: " + self._hostname)
         self._logger.debug("Device Id: " + self._device_id)
-        self._logger.debug("Shared Access Key: " + self._shared_access_key)
+        if self._module_id is not None:
+            self._logger.debug("Module Id: " + self._module_id)
+        if self._x509:
+            self._logger.debug("Authenticating with an X.509 certificate")
+        else:
+            self._logger.debug("Shared Access Key: " + self._shared_access_key)
 
         self._on_connection_status_changed = None
         self._on_direct_method_invoked = None
         self._on_cloud_to_device_message_received = None
+        self._on_module_input_message_received = None
         self._on_device_twin_desired_updated = None
+        self._on_device_twin_desired_patched = None
         self._on_device_twin_reported_updated = None
+        self._desired_paths = TwinPathIndex()
+        self._methods = MethodRegistry()
 
         self._mqtt = None
+        self._stats = IoTStats(enabled=enable_stats)
+        self._transport = transport
+        self._persistent_session = persistent_session
+        self._tls_sessions = (
+            tls_session_cache if tls_session_cache is not None else TLSSessionCache(self._stats)
+        )
+        self._keep_alive = keep_alive
+        self._method_executor = method_executor
+        self._method_timeout = method_timeout
+        self._inbound_queue = inbound_queue
+        self._twin_cache = twin_cache
+        self._reported_debounce = reported_debounce
+        self._signer = signer if signer is not None else SasSigner()
+        self._loop_timeout = loop_timeout
+
+    @property
+    def methods(self) -> MethodRegistry:
+        """The handlers for direct methods, looked up by method name. Methods without a
+        registered handler are passed to the registry's default handler if it has one, then to
+        `on_direct_method_invoked`::
+
+            device.methods.register("reboot", reboot, keyword_arguments=True)
+        """
+        return self._methods
+
+    @property
+    def device_id(self) -> str:
+        """The device ID from the connection string"""
+        return self._device_id
+
+    @property
+    def module_id(self) -> str:
+        """The module ID from the connection string, or None if this client is a device"""
+        return self._module_id
+
+    @property
+    def signer(self) -> SasSigner:
+        """The signer that makes the SAS tokens"""
+        return self._signer
+
+    @property
+    def gateway_hostname(self) -> str:
+        """The IoT Edge gateway from the connection string, or None if there isn't one"""
+        return self._gateway_hostname
+
+    @property
+    def x509(self) -> bool:
+        """True if the device authenticates with an X.509 certificate rather than a SAS token"""
+        return self._x509
+
+    @property
+    def connected_via_gateway(self) -> bool:
+        """True if the device is connected through the gateway rather than straight to the hub"""
+        return self._mqtt is not None and self._connected_via_gateway
+
+    @property
+    def twin_cache(self) -> TwinCache:
+        """The local copy of the device twin, or None if the device was not created with one"""
+        return self._twin_cache
+
+    @property
+    def reported_version(self) -> int:
+        """The reported properties version from the last patch the hub acknowledged, or None if
+        no patch has been acknowledged since connecting"""
+        if self._mqtt is None:
+            return None
+        return self._mqtt.reported_version
+
+    @property
+    def stats(self) -> IoTStats:
+        """The performance metrics for this device. These are kept across connections, and can
+        be exported with `IoTStats.as_dict` or `IoTStats.to_prometheus`. Set ``stats.enabled``
+        to turn recording on or off at any time.
+        """
+        return self._stats
+
+    @property
+    def tls_sessions(self) -> TLSSessionCache:
+        """The TLS session cache used by this device, showing how often sessions are resumed and
+        how much handshake time that saves
+        """
+        return self._tls_sessions
+
+    @property
+    def keep_alive(self) -> int:
+        """The interval between keep-alive pings currently in use, in seconds. When a
+        `KeepAliveController` is used this is the interval it has chosen for the current network
+        """
+        if isinstance(self._keep_alive, KeepAliveController):
+            return self._keep_alive.interval
+        return self._keep_alive
 
     @property
     def on_connection_status_changed(self) -> Callable:
@@ -236,7 +474,7 @@ class IoTHubDevice(IoTMQTTCallback):
     def on_cloud_to_device_message_received(self) -> Callable:
         """A callback method that is called when a cloud to device message is received.
         This method should have the following signature:
-        def cloud_to_device_message_received(body: str, properties: dict) -> None:
+        def cloud_to_device_message_received(body: str, properties: C2DProperties) -> None:
         """
         return self._on_cloud_to_device_message_received
 
@@ -246,10 +484,30 @@ class IoTHubDevice(IoTMQTTCallback):
     ) -> None:
         """A callback method that is called when a cloud to device message is received.
         This method should have the following signature:
-        def cloud_to_device_message_received(body: str, properties: dict) -> None:
+        def cloud_to_device_message_received(body: str, properties: C2DProperties) -> None:
         """
         self._on_cloud_to_device_message_received = new_on_cloud_to_device_message_received
 
+    @property
+    def on_module_input_message_received(self) -> Callable:
+        """A callback method that is called when a message is routed to an input of this
+        module. This method should have the following signature:
+        def module_input_message_received(input_name: str, body: str,
+                                          properties: C2DProperties) -> None:
+        """
+        return self._on_module_input_message_received
+
+    @on_module_input_message_received.setter
+    def on_module_input_message_received(
+        self, new_on_module_input_message_received: Callable
+    ) -> None:
+        """A callback method that is called when a message is routed to an input of this
+        module. This method should have the following signature:
+        def module_input_message_received(input_name: str, body: str,
+                                          properties: C2DProperties) -> None:
+        """
+        self._on_module_input_message_received = new_on_module_input_message_received
+
     @property
     def on_device_twin_desired_updated(self) -> Callable:
         """A callback method that is called when the desired properties of the devices device twin
@@ -271,6 +529,36 @@ class IoTHubDevice(IoTMQTTCallback):
         if self._mqtt is not None:
             self._mqtt.subscribe_to_twins()
 
+    @property
+    def on_device_twin_desired_patched(self) -> Callable:
+        """A callback method that is called once for each update of the desired properties of the
+        devices device twin, with the whole patch. This method should have the following
+        signature:
+        def device_twin_desired_patched(patch: dict, desired_version: int) -> None:
+        """
+        return self._on_device_twin_desired_patched
+
+    @on_device_twin_desired_patched.setter
+    def on_device_twin_desired_patched(self, new_on_device_twin_desired_patched: Callable) -> None:
+        """A callback method that is called once for each update of the desired properties of the
+        devices device twin, with the whole patch. This method should have the following
+        signature:
+        def device_twin_desired_patched(patch: dict, desired_version: int) -> None:
+        """
+        self._on_device_twin_desired_patched = new_on_device_twin_desired_patched
+
+        if self._mqtt is not None:
+            self._mqtt.subscribe_to_twins()
+
+    @property
+    def desired_paths(self) -> TwinPathIndex:
+        """Callbacks for paths in the desired properties, called only when a patch changes their
+        path. Subscribe before connecting, so the device subscribes to twin updates::
+
+            device.desired_paths.subscribe("config.sampling.rate", sampling_rate_changed)
+        """
+        return self._desired_paths
+
     @property
     def on_device_twin_reported_updated(self) -> Callable:
         """A callback method that is called when the reported properties of the devices device twin
@@ -294,26 +582,97 @@ class IoTHubDevice(IoTMQTTCallback):
         if self._mqtt is not None:
             self._mqtt.subscribe_to_twins()
 
-    def connect(self) -> None:
-        """Connects to Azure IoT Hub
-
-        :raises RuntimeError: if the internet connection is not responding or is unable to connect
-        """
-        self._mqtt = IoTMQTT(
+    def _gateway_context(self):
+        if self._gateway_ssl_context is None:
+            if self._gateway_trust_anchor is None:
+                self._gateway_ssl_context = self._iface
+            else:
+                if ssl is None:
+                    raise IoTError("A gateway trust anchor needs the ssl module")
+                trust_anchor = self._gateway_trust_anchor
+                if not trust_anchor.startswith("-----BEGIN"):
+                    with open(trust_anchor, encoding="utf-8") as file:
+                        trust_anchor = file.read()
+                context = ssl.create_default_context()
+                context.load_verify_locations(cadata=trust_anchor)
+                if self._client_certificate is not None:
+                    load_client_certificate(context, self._client_certificate, self._client_key)
+                self._gateway_ssl_context = context
+        return self._gateway_ssl_context
+
+    def _create_mqtt(self, ssl_context, gateway_hostname: str = None) -> IoTMQTT:
+        return IoTMQTT(
             self,
             self._socket,
-            self._iface,
+            self._tls_sessions.wrap_context(ssl_context),
             self._hostname,
             self._device_id,
-            self._shared_access_key,
+            None if self._x509 else self._shared_access_key,
             self._token_expires,
             self._logger,
+            stats=self._stats,
+            transport=self._transport,
+            persistent_session=self._persistent_session,
+            keep_alive=self._keep_alive,
+            method_executor=self._method_executor,
+            method_timeout=self._method_timeout,
+            inbound_queue=self._inbound_queue,
+            twin_cache=self._twin_cache,
+            reported_debounce=self._reported_debounce,
+            gateway_hostname=gateway_hostname,
+            module_id=self._module_id,
+            signer=self._signer,
+            loop_timeout=self._loop_timeout,
+        )
+
+    def _connect_to_gateway(self) -> bool:
+        # A bad trust anchor is a mistake to fix rather than a reason to fail over
+        ssl_context = self._gateway_context()
+        try:
+            self._mqtt = self._create_mqtt(ssl_context, self._gateway_hostname)
+            if self._mqtt.connect():
+                self._stats.increment("gateway_connects")
+                return True
+            error = "not connected"
+        except (OSError, RuntimeError, MMQTTException) as exception:
+            # The gateway was reached and refused the connection, such as for bad credentials,
+            # and the hub would refuse it too
+            if _is_refused(exception):
+                raise
+            error = str(exception)
+
+        self._logger.info(
+            "- iothub_device :: connect :: gateway "
+            + self._gateway_hostname
+            + " unreachable ("
+            + error
+            + "), connecting to the hub"
+        )
+        self._stats.increment("gateway_failovers")
+        return False
+
+    def connect(self) -> None:
+        """Connects to Azure IoT Hub. If the connection string has a ``GatewayHostName`` the
+        device connects through that IoT Edge gateway, and straight to the hub if the gateway
+        can't be reached
+
+        :raises RuntimeError: if the internet connection is not responding or is unable to connect
+        :raises MMQTTException: if the gateway or the hub refuses the connection, such as for bad
+            credentials
+        """
+        self._connected_via_gateway = (
+            self._gateway_hostname is not None and self._connect_to_gateway()
         )
-        self._mqtt.connect()
+        if not self._connected_via_gateway:
+            self._mqtt = self._create_mqtt(self._iface)
+            self._mqtt.connect()
 
         if (
             self._on_device_twin_desired_updated is not None
+            or self._on_device_twin_desired_patched is not None
             or self._on_device_twin_reported_updated is not None
+            or len(self._desired_paths) > 0
+            or self._twin_cache is not None
         ):
             self._mqtt.subscribe_to_twins()
 
@@ -327,6 +686,32 @@ class IoTHubDevice(IoTMQTTCallback):
 
         self._mqtt.loop()
 
+    def request_twin(self) -> PendingRequest:
+        """Requests the full device twin without waiting for it. Call `loop` until the request
+        is done, then read the twin from its ``result``
+
+        :returns: The pending request
+        :rtype: PendingRequest
+        :raises IoTError: if there is no open connection to the MQTT broker
+        """
+        if self._mqtt is None:
+            raise IoTError("You are not connected to IoT Hub")
+
+        return self._mqtt.request_twin()
+
+    def get_twin(self, timeout: float = 10) -> dict:
+        """Requests the full device twin and waits for it
+
+        :param float timeout: How long to wait for the twin, in seconds
+        :returns: The twin, with ``desired`` and ``reported`` properties
+        :rtype: dict
+        :raises IoTError: if there is no open connection, or the request fails or times out
+        """
+        if self._mqtt is None:
+            raise IoTError("You are not connected to IoT Hub")
+
+        return self._mqtt.get_twin(timeout)
+
     def disconnect(self) -> None:
         """Disconnects from the MQTT broker
 
@@ -367,15 +752,43 @@ class IoTHubDevice(IoTMQTTCallback):
 
         self._mqtt.send_device_to_cloud_message(message, system_properties)
 
+    def send_output_message(
+        self, output_name: str, message: Union[str, dict], system_properties: dict = None
+    ) -> None:
+        """Send a message from an output of this module, for the hub or edge runtime to route
+
+        :param str output_name: The name of the output
+        :param message: The message data as a JSON string or a dictionary
+        :param system_properties: System properties to send with the message
+        :raises: ValueError if the message is not a string or dictionary
+        :raises IoTError: if this client is not a module, or is not connected
+        """
+        if self._module_id is None:
+            raise IoTError("Only modules have outputs")
+        if self._mqtt is None:
+            raise IoTError("You are not connected to IoT Central")
+
+        self._mqtt.send_device_to_cloud_message(
+            message, system_properties, property_bag="$.on=" + quote(output_name.encode(), "")
+        )
+
     def update_twin(self, patch: Union[str, dict]) -> None:
-        """Updates the reported properties in the devices device twin
+        """Updates the reported properties in the devices device twin. Values that are already
+        reported are not sent again
 
         :param patch: The JSON patch to apply to the device twin reported properties
         """
         if self._mqtt is None:
             raise IoTError("You are not connected to IoT Central")
 
-        if isinstance(patch, dict):
-            patch = json.dumps(patch)
+        self._mqtt.update_reported_properties(patch)
+
+    def flush_twin(self) -> None:
+        """Sends any reported property updates that are waiting for the debounce window to end
+
+        :raises IoTError: if there is no open connection to the MQTT broker
+        """
+        if self._mqtt is None:
+            raise IoTError("You are not connected to IoT Hub")
 
-        self._mqtt.send_twin_patch(patch)
+        self._mqtt.flush_reported_properties()
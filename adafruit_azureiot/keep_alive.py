@@ -0,0 +1,194 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`keep_alive`
+=====================
+
+Adaptive MQTT keep-alive. The controller learns, per network, the longest interval between
+pings that keeps the link alive: long enough to save radio energy on cellular links, short
+enough to stop NAT gateways silently dropping the connection.
+
+The keep-alive sent to the broker in CONNECT is always the maximum, so the broker never times
+out a healthy connection. The controller only changes how often the client pings. Pings are only
+sent when nothing else has been sent for a whole interval, so regular telemetry keeps the link
+alive without any extra PINGREQ packets.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Dict, Optional
+except ImportError:
+    pass
+
+import time
+
+# The longest keep-alive IoT Hub accepts, in seconds
+IOT_HUB_MAX_KEEP_ALIVE = 1767
+
+
+class _NetworkState:
+    """What has been learned about one network"""
+
+    def __init__(self, interval: int):
+        self.interval = interval
+        self.safe = 0
+        self.unsafe = None
+        self.successes = 0
+
+
+class KeepAliveController:
+    """Learns the longest safe ping interval for each network the device uses"""
+
+    def __init__(
+        self,
+        initial: int = 120,
+        minimum: int = 30,
+        maximum: int = IOT_HUB_MAX_KEEP_ALIVE,
+        growth: float = 1.5,
+        stable_pings: int = 3,
+    ):
+        """Creates the controller
+
+        :param int initial: The ping interval to start with on a new network, in seconds
+        :param int minimum: The shortest ping interval to use, in seconds
+        :param int maximum: The longest ping interval to use, in seconds. This is also the
+            keep-alive sent to the broker
+        :param float growth: How much to grow the interval by when probing for a longer one
+        :param int stable_pings: How many successful pings are needed at an interval before a
+            longer one is tried
+        """
+        if not minimum <= initial <= maximum:
+            raise ValueError("initial must be between minimum and maximum")
+
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.growth = growth
+        self.stable_pings = stable_pings
+        self._networks: Dict[str, _NetworkState] = {}
+        self._network = None
+        self._state = None
+        self._last_activity = time.monotonic()
+        self.select_network("default")
+
+    def select_network(self, network_id: str) -> None:
+        """Selects the network the device is connected to, such as the WiFi SSID or the cellular
+        operator. Each network has its own learned interval
+
+        :param str network_id: An identifier for the network
+        """
+        state = self._networks.get(network_id)
+        if state is None:
+            state = _NetworkState(self.initial)
+            self._networks[network_id] = state
+        self._network = network_id
+        self._state = state
+
+    @property
+    def network(self) -> str:
+        """The identifier of the current network"""
+        return self._network
+
+    @property
+    def interval(self) -> int:
+        """The ping interval chosen for the current network, in seconds"""
+        return self._state.interval
+
+    @property
+    def negotiated_keep_alive(self) -> int:
+        """The keep-alive to send to the broker when connecting, in seconds"""
+        return self.maximum
+
+    @property
+    def converged(self) -> bool:
+        """True if probing has found the longest safe interval for the current network"""
+        state = self._state
+        return state.interval >= self.maximum or (
+            state.unsafe is not None and self._next_interval(state) <= state.interval
+        )
+
+    def _next_interval(self, state: _NetworkState) -> int:
+        interval = min(int(state.interval * self.growth), self.maximum)
+        if state.unsafe is not None:
+            # Stay clear of the interval that is known to drop the link
+            interval = min(interval, int(state.unsafe * 0.9))
+        return interval
+
+    def record_activity(self) -> None:
+        """Records that a packet was sent, so the link does not need a ping for a while"""
+        self._last_activity = time.monotonic()
+
+    @property
+    def idle_time(self) -> float:
+        """How long it has been since a packet was sent, in seconds"""
+        return time.monotonic() - self._last_activity
+
+    def ping_succeeded(self) -> None:
+        """Records a successful ping after an idle interval. After enough of these the
+        controller tries a longer interval"""
+        self.record_activity()
+        state = self._state
+        state.safe = max(state.safe, state.interval)
+        state.successes += 1
+        if state.successes < self.stable_pings:
+            return
+
+        state.successes = 0
+        next_interval = self._next_interval(state)
+        state.interval = max(state.interval, next_interval)
+
+    def link_lost(self, idle_time: Optional[float] = None) -> None:
+        """Records that the connection dropped. If the link had been idle for about the ping
+        interval, the interval is assumed to be too long for this network and is reduced to the
+        longest one that is known to work
+
+        :param float idle_time: How long the link had been idle, in seconds. Defaults to the
+            time since the last recorded activity
+        """
+        if idle_time is None:
+            idle_time = self.idle_time
+
+        state = self._state
+        state.successes = 0
+        if idle_time < state.interval * 0.9:
+            # The link was busy, so the drop was not caused by the keep-alive interval
+            return
+
+        failed = state.interval
+        state.unsafe = failed if state.unsafe is None else min(state.unsafe, failed)
+        if state.safe >= failed:
+            state.safe = int(failed / self.growth)
+        state.interval = max(self.minimum, state.safe or int(failed / self.growth))
+
+    def as_dict(self) -> dict:
+        """Gets what has been learned about each network, for example to save it
+
+        :returns: The interval, longest known safe and shortest known unsafe intervals for each
+            network
+        :rtype: dict
+        """
+        return {
+            network_id: {
+                "interval": state.interval,
+                "safe": state.safe,
+                "unsafe": state.unsafe,
+            }
+            for network_id, state in self._networks.items()
+        }
+
+    def load(self, learned: dict) -> None:
+        """Loads what was previously learned, as returned by `as_dict`
+
+        :param dict learned: The learned intervals for each network
+        """
+        for network_id, values in learned.items():
+            state = _NetworkState(
+                max(self.minimum, min(self.maximum, values.get("interval", self.initial)))
+            )
+            state.safe = values.get("safe", 0)
+            state.unsafe = values.get("unsafe")
+            self._networks[network_id] = state
+        self.select_network(self._network)
@@ -0,0 +1,675 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`loopback`
+=====================
+
+An in-process MQTT broker that emulates the Azure IoT Hub and Device Provisioning Service
+topics, so the library can be driven, load tested and profiled without a network or an Azure
+subscription.
+
+Pass `LoopbackBroker.transport` as the ``transport`` of a device, then use the broker methods
+to act as the cloud side:
+
+.. code-block:: python
+
+    broker = LoopbackBroker()
+    device = IoTHubDevice(None, None, connection_string, transport=broker.transport)
+    device.connect()
+
+    broker.invoke_direct_method(device_id, "reboot", "{}")
+    device.loop()
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+except ImportError:
+    pass
+
+import json
+
+from adafruit_minimqtt.adafruit_minimqtt import (
+    CONNACK_ERROR_UNAUTHORIZED,
+    MQTT_PUBLISH,
+    MMQTTException,
+    MMQTTStateError,
+)
+from adafruit_minimqtt.matcher import MQTTMatcher
+
+from . import constants
+from .quote import quote
+from .topic_router import topic_parameter
+from .twin_cache import merge_patch
+
+
+class LoopbackMQTT:
+    """An MQTT client connected to a `LoopbackBroker`. This supports the same API as the
+    MiniMQTT client that is used by this library, but messages never leave the process.
+    Inbound messages are queued and dispatched by `loop`, which never blocks.
+    """
+
+    def __init__(
+        self,
+        loopback_broker: "LoopbackBroker",
+        *,
+        broker: str,
+        port: int = None,
+        username: str = None,
+        password: str = None,
+        client_id: str = None,
+        is_ssl: bool = None,
+        keep_alive: int = 60,
+        socket_pool=None,
+        ssl_context=None,
+        **kwargs,
+    ):
+        """Creates the client. Use `LoopbackBroker.transport` rather than calling this directly
+
+        :param LoopbackBroker loopback_broker: The broker to connect to
+        :param str broker: The hostname this client thinks it is connecting to
+        :param int port: The port this client thinks it is connecting to
+        :param str username: The MQTT username
+        :param str password: The MQTT password
+        :param str client_id: The MQTT client id
+        :param bool is_ssl: Ignored
+        :param int keep_alive: The keep alive interval, in seconds
+        :param socket_pool: Ignored
+        :param ssl_context: Ignored
+        """
+        self._loopback = loopback_broker
+        self.broker = broker
+        self.port = port
+        self._username = username
+        self._password = password
+        self.client_id = client_id
+        self.keep_alive = keep_alive
+        self.user_data = None
+        self.logger = None
+        self._is_connected = False
+        self._persistent = False
+        self._inbox: List[Tuple[str, str]] = []
+        self._subscribed_topics: List[str] = []
+        self._subscription_filters = MQTTMatcher()
+        self._on_message_filtered = MQTTMatcher()
+        self.on_message = None
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_publish = None
+        self.on_subscribe = None
+
+    def enable_logger(self, log_pkg, log_level: int = 20, logger_name: str = "log"):
+        """Enables logging, for compatibility with the MiniMQTT client
+
+        :param log_pkg: The logging package
+        :param int log_level: The level to log at
+        :param str logger_name: The name of the logger
+        """
+        self.logger = log_pkg.getLogger(logger_name)
+        self.logger.setLevel(log_level)
+
+    def _connected(self) -> None:
+        if not self._is_connected:
+            raise MMQTTStateError("MiniMQTT is not connected")
+
+    def is_connected(self) -> bool:
+        """Gets if the client is connected to the broker
+
+        :returns: True if connected, otherwise False
+        :rtype: bool
+        """
+        return self._is_connected
+
+    def connect(
+        self,
+        clean_session: bool = True,
+        host: str = None,
+        port: int = None,
+        keep_alive: int = None,
+        session_id: str = None,
+    ) -> int:
+        """Connects to the broker
+
+        :param bool clean_session: False to resume a persistent session
+        :param str host: The hostname to connect to
+        :param int port: The port to connect to
+        :param int keep_alive: The keep alive interval, in seconds
+        :param str session_id: Ignored
+        :returns: 1 if the broker resumed an existing session, otherwise 0
+        :rtype: int
+        :raises MMQTTException: if the broker rejects the credentials
+        """
+        if host:
+            self.broker = host
+        if port:
+            self.port = port
+        if keep_alive:
+            self.keep_alive = keep_alive
+
+        self._persistent = not clean_session
+        session_present = self._loopback._connect(self, clean_session)
+        self._is_connected = True
+        if self.on_connect is not None:
+            self.on_connect(self, self.user_data, session_present, 0)
+        return session_present
+
+    def disconnect(self) -> None:
+        """Disconnects from the broker"""
+        self._connected()
+        self._loopback._disconnect(self)
+        self._is_connected = False
+        self._subscribed_topics = []
+        if self.on_disconnect is not None:
+            self.on_disconnect(self, self.user_data, 0)
+
+    def reconnect(self, resub_topics: bool = True) -> int:
+        """Disconnects if needed, then connects again
+
+        :param bool resub_topics: True to subscribe to the previously subscribed topics again
+        :returns: The value returned by `connect`
+        :rtype: int
+        """
+        subscribed_topics = []
+        if self._is_connected:
+            if resub_topics:
+                subscribed_topics = self._subscribed_topics.copy()
+            self.disconnect()
+
+        ret = self.connect()
+        for topic in subscribed_topics:
+            self.subscribe(topic)
+        return ret
+
+    def ping(self) -> list:
+        """Pings the broker
+
+        :returns: The packet types received while waiting for the ping response
+        :rtype: list
+        """
+        self._connected()
+        return []
+
+    def subscribe(self, topic: str, qos: int = 0) -> None:
+        """Subscribes to a topic
+
+        :param str topic: The topic filter to subscribe to
+        :param int qos: The quality of service
+        """
+        self._connected()
+        if topic not in self._subscribed_topics:
+            self._subscribed_topics.append(topic)
+        self._loopback._subscribe(self, topic, qos)
+        if self.on_subscribe is not None:
+            self.on_subscribe(self, self.user_data, topic, qos)
+
+    def unsubscribe(self, topic: str) -> None:
+        """Unsubscribes from a topic
+
+        :param str topic: The topic filter to unsubscribe from
+        """
+        self._connected()
+        if topic in self._subscribed_topics:
+            self._subscribed_topics.remove(topic)
+        self._loopback._unsubscribe(self, topic)
+
+    def publish(self, topic: str, msg, retain: bool = False, qos: int = 0) -> None:
+        """Publishes a message to the broker
+
+        :param str topic: The topic to publish to
+        :param msg: The message to publish
+        :param bool retain: Ignored
+        :param int qos: Ignored, all messages are delivered
+        """
+        self._connected()
+        if msg is None:
+            raise ValueError("Message can not be None.")
+        if isinstance(msg, (int, float)):
+            msg = str(msg)
+        elif isinstance(msg, (bytes, bytearray)):
+            msg = str(msg, "utf-8")
+
+        self._loopback._publish(self, topic, msg)
+        if self.on_publish is not None:
+            self.on_publish(self, self.user_data, topic, 0)
+
+    def loop(self, timeout: float = 0) -> Optional[list]:
+        """Dispatches any queued inbound messages. This never blocks
+
+        :param float timeout: Ignored
+        :returns: The packet types that were processed, or None if there were none
+        """
+        self._connected()
+        if not self._inbox:
+            return None
+
+        inbox = self._inbox
+        self._inbox = []
+        for topic, msg in inbox:
+            self._handle_on_message(topic, msg)
+        return [MQTT_PUBLISH] * len(inbox)
+
+    def add_topic_callback(self, mqtt_topic: str, callback_method) -> None:
+        """Registers a callback for a topic filter
+
+        :param str mqtt_topic: The topic filter
+        :param callback_method: The callback, called with ``(client, topic, message)``
+        """
+        if mqtt_topic is None or callback_method is None:
+            raise ValueError("MQTT topic and callback method must both be defined.")
+        self._on_message_filtered[mqtt_topic] = callback_method
+
+    def remove_topic_callback(self, mqtt_topic: str) -> None:
+        """Removes a callback for a topic filter
+
+        :param str mqtt_topic: The topic filter
+        """
+        del self._on_message_filtered[mqtt_topic]
+
+    def _handle_on_message(self, topic: str, message: str) -> None:
+        matched = False
+        for callback in self._on_message_filtered.iter_match(topic):
+            callback(self, topic, message)
+            matched = True
+
+        if not matched and self.on_message:
+            self.on_message(self, topic, message)
+
+    def _is_subscribed(self, topic: str) -> bool:
+        for _ in self._subscription_filters.iter_match(topic):
+            return True
+        return False
+
+    def _deliver(self, topic: str, msg: str) -> bool:
+        if not self._is_connected or not self._is_subscribed(topic):
+            return False
+        self._inbox.append((topic, msg))
+        return True
+
+
+class LoopbackBroker:
+    """An in-process broker that emulates Azure IoT Hub and the Device Provisioning Service.
+
+    Devices connect through the `transport` method. Clients whose username is a DPS registration
+    are served the DPS registration flow (202 with retry-after, then 200 with the assigned hub),
+    all others are treated as IoT Hub devices with telemetry, cloud to device messages, direct
+    methods and a device twin.
+    """
+
+    def __init__(
+        self,
+        hostname: str = "loopback.azure-devices.net",
+        retry_after: int = 0,
+        authenticate: Callable[[str, str], bool] = None,
+    ):
+        """Creates the broker
+
+        :param str hostname: The IoT Hub hostname that DPS registration assigns devices to
+        :param int retry_after: The retry-after value in seconds returned by DPS registration
+        :param authenticate: An optional function called with the username and password of each
+            connection, return False to reject the connection as unauthorized
+        """
+        self.hostname = hostname
+        self.retry_after = retry_after
+        self.authenticate = authenticate
+
+        self.record_telemetry = True
+        """Set to False to count telemetry without keeping the messages, for load tests"""
+        self.telemetry: List[Tuple[str, str, str]] = []
+        """The device to cloud messages received, as ``(device_id, topic, body)``"""
+        self.telemetry_count = 0
+        self.on_telemetry = None
+        """An optional function called with ``(device_id, topic, body)`` for each device to cloud
+        message"""
+
+        self.method_responses: Dict[str, Tuple[int, str]] = {}
+        """The direct method responses, as ``(status, payload)`` keyed by request id"""
+        self.on_method_response = None
+        """An optional function called with ``(request_id, status, payload)`` for each direct
+        method response"""
+
+        self.on_twin_response = None
+        """An optional function called with ``(device_id, topic, payload)`` for each twin response
+        sent to a device"""
+
+        self.registrations: Dict[str, str] = {}
+        """The hub assigned to each device by DPS registration, keyed by device id"""
+
+        self.unreachable_hosts = set()
+        """Hostnames that connections fail to, to test failing over, such as a gateway that is
+        down"""
+
+        self.throttle_reported_patches = 0
+        """The number of reported property patches to reject with a 429 status, to test
+        throttling. Counts down as patches are rejected"""
+
+        self.subscribe_count = 0
+        """The number of SUBSCRIBE requests received"""
+        self.twin_get_count = 0
+        """The number of full twin requests received"""
+
+        self.unhandled_messages = 0
+        self._sessions: Dict[str, Tuple[MQTTMatcher, List[Tuple[str, str]]]] = {}
+        self._hub_clients: Dict[str, LoopbackMQTT] = {}
+        self._dps_clients: Dict[str, LoopbackMQTT] = {}
+        self._twins: Dict[str, Dict[str, Any]] = {}
+        self._c2d_pending: Dict[str, List[Tuple[str, str]]] = {}
+        self._operations: Dict[str, str] = {}
+        self._request_id = 0
+
+    def transport(self, **kwargs) -> LoopbackMQTT:
+        """Creates a client connected to this broker. Pass this method as the ``transport`` of a
+        device or registration
+
+        :returns: The client
+        :rtype: LoopbackMQTT
+        """
+        return LoopbackMQTT(self, **kwargs)
+
+    def _next_request_id(self) -> str:
+        self._request_id += 1
+        return str(self._request_id)
+
+    @staticmethod
+    def _identity_topic(client_id: str) -> str:
+        # Modules connect with a client id of device_id/module_id
+        if "/" in client_id:
+            device_id, module_id = client_id.split("/", 1)
+            return f"devices/{device_id}/modules/{module_id}/"
+        return f"devices/{client_id}/"
+
+    @staticmethod
+    def _is_dps_client(client: LoopbackMQTT) -> bool:
+        return client.broker == constants.DPS_END_POINT or "/registrations/" in (
+            client._username or ""
+        )
+
+    def _connect(self, client: LoopbackMQTT, clean_session: bool) -> int:
+        if client.broker in self.unreachable_hosts:
+            raise OSError("Host " + client.broker + " is unreachable")
+
+        if self.authenticate is not None and not self.authenticate(
+            client._username, client._password
+        ):
+            raise MMQTTException(
+                "Connection Refused - Unauthorized", code=CONNACK_ERROR_UNAUTHORIZED
+            )
+
+        if self._is_dps_client(client):
+            self._dps_clients[client.client_id] = client
+            client._subscription_filters = MQTTMatcher()
+            return 0
+
+        self._hub_clients[client.client_id] = client
+        self._twin(client.client_id)
+
+        session = self._sessions.pop(client.client_id, None)
+        if clean_session or session is None:
+            client._subscription_filters = MQTTMatcher()
+            return 0
+
+        # Resume the persistent session, delivering anything queued while offline
+        client._subscription_filters, queued = session
+        client._is_connected = True
+        for topic, msg in queued:
+            client._deliver(topic, msg)
+        return 1
+
+    def _disconnect(self, client: LoopbackMQTT) -> None:
+        clients = self._dps_clients if self._is_dps_client(client) else self._hub_clients
+        if clients.get(client.client_id) is client:
+            del clients[client.client_id]
+            if client._persistent:
+                self._sessions[client.client_id] = (client._subscription_filters, [])
+
+    def _queue_for_session(self, device_id: str, topic: str, msg: str) -> None:
+        session = self._sessions.get(device_id)
+        if session is None:
+            return
+        for qos in session[0].iter_match(topic):
+            if qos > 0:
+                session[1].append((topic, msg))
+                return
+
+    def _subscribe(self, client: LoopbackMQTT, topic: str, qos: int) -> None:
+        self.subscribe_count += 1
+        client._subscription_filters[topic] = qos
+
+        pending = self._c2d_pending.get(client.client_id)
+        if pending:
+            still_pending = [message for message in pending if not client._deliver(*message)]
+            self._c2d_pending[client.client_id] = still_pending
+
+    def _unsubscribe(self, client: LoopbackMQTT, topic: str) -> None:
+        try:
+            del client._subscription_filters[topic]
+        except KeyError:
+            pass
+
+    def _publish(self, client: LoopbackMQTT, topic: str, msg: str) -> None:
+        if self._is_dps_client(client):
+            self._handle_dps_publish(client, topic, msg)
+            return
+
+        device_id = client.client_id
+        if topic.startswith("$iothub/twin/GET/"):
+            self.twin_get_count += 1
+            self._send_twin_response(
+                client, f"$iothub/twin/res/200/?$rid={topic_parameter(topic, '$rid')}"
+            )
+        elif topic.startswith("$iothub/twin/PATCH/properties/reported/"):
+            self._handle_reported_patch(client, topic, msg)
+        elif topic.startswith("$iothub/methods/res/"):
+            status_end = topic.find("/", 20)
+            status = int(topic[20:status_end])
+            request_id = topic_parameter(topic, "$rid")
+            self.method_responses[request_id] = (status, msg)
+            if self.on_method_response is not None:
+                self.on_method_response(request_id, status, msg)
+        elif topic.startswith(self._identity_topic(device_id) + "messages/events/"):
+            self.telemetry_count += 1
+            if self.record_telemetry:
+                self.telemetry.append((device_id, topic, msg))
+            if self.on_telemetry is not None:
+                self.on_telemetry(device_id, topic, msg)
+        else:
+            self.unhandled_messages += 1
+
+    def _twin(self, device_id: str) -> dict:
+        twin = self._twins.get(device_id)
+        if twin is None:
+            twin = {"desired": {"$version": 1}, "reported": {"$version": 1}}
+            self._twins[device_id] = twin
+        return twin
+
+    def _send_twin_response(self, client: LoopbackMQTT, topic: str, payload: str = None) -> None:
+        if payload is None:
+            payload = json.dumps(self._twin(client.client_id))
+        client._deliver(topic, payload)
+        if self.on_twin_response is not None:
+            self.on_twin_response(client.client_id, topic, payload)
+
+    def _handle_reported_patch(self, client: LoopbackMQTT, topic: str, msg: str) -> None:
+        request_id = topic_parameter(topic, "$rid")
+        try:
+            patch = json.loads(msg)
+        except ValueError:
+            self._send_twin_response(client, f"$iothub/twin/res/400/?$rid={request_id}", "{}")
+            return
+
+        if self.throttle_reported_patches > 0:
+            self.throttle_reported_patches -= 1
+            self._send_twin_response(client, f"$iothub/twin/res/429/?$rid={request_id}", "{}")
+            return
+
+        reported = self._twin(client.client_id)["reported"]
+        merge_patch(reported, patch)
+        reported["$version"] += 1
+        self._send_twin_response(
+            client,
+            f"$iothub/twin/res/204/?$rid={request_id}&$version={reported['$version']}",
+            "",
+        )
+
+    def _handle_dps_publish(self, client: LoopbackMQTT, topic: str, msg: str) -> None:
+        request_id = topic_parameter(topic, "$rid")
+        if topic.startswith("$dps/registrations/PUT/iotdps-register/"):
+            operation_id = f"{client.client_id}.{self._next_request_id()}"
+            self._operations[operation_id] = client.client_id
+            client._deliver(
+                f"$dps/registrations/res/202/?$rid={request_id}&retry-after={self.retry_after}",
+                json.dumps({"operationId": operation_id, "status": "assigning"}),
+            )
+        elif topic.startswith("$dps/registrations/GET/iotdps-get-operationstatus/"):
+            operation_id = topic_parameter(topic, "operationId")
+            device_id = self._operations.get(operation_id)
+            if device_id is None:
+                client._deliver(
+                    f"$dps/registrations/res/404/?$rid={request_id}",
+                    json.dumps({"errorCode": 404, "message": "Operation not found"}),
+                )
+                return
+
+            self.registrations[device_id] = self.hostname
+            client._deliver(
+                f"$dps/registrations/res/200/?$rid={request_id}",
+                json.dumps(
+                    {
+                        "operationId": operation_id,
+                        "status": "assigned",
+                        "registrationState": {
+                            "registrationId": device_id,
+                            "assignedHub": self.hostname,
+                            "deviceId": device_id,
+                            "status": "assigned",
+                            "substatus": "initialAssignment",
+                        },
+                    }
+                ),
+            )
+        else:
+            self.unhandled_messages += 1
+
+    def is_connected(self, device_id: str) -> bool:
+        """Gets if a device is connected to the emulated hub
+
+        :param str device_id: The device id
+        :returns: True if the device is connected, otherwise False
+        :rtype: bool
+        """
+        return device_id in self._hub_clients
+
+    def invoke_direct_method(self, device_id: str, method_name: str, payload: str = "{}") -> str:
+        """Invokes a direct method on a device. The response is stored in `method_responses`
+        once the device has handled the method
+
+        :param str device_id: The device id
+        :param str method_name: The name of the method to invoke
+        :param str payload: The method payload
+        :returns: The request id of the invocation
+        :rtype: str
+        :raises IndexError: if the device is not connected
+        """
+        client = self._hub_clients.get(device_id)
+        if client is None:
+            raise IndexError(f"Device {device_id} is not connected")
+
+        request_id = self._next_request_id()
+        client._deliver(f"$iothub/methods/POST/{method_name}/?$rid={request_id}", payload)
+        return request_id
+
+    def send_cloud_to_device_message(
+        self, device_id: str, body: str, properties: dict = None
+    ) -> str:
+        """Sends a cloud to device message. Messages for devices that are not subscribed are
+        queued until they subscribe
+
+        :param str device_id: The device id
+        :param str body: The message body
+        :param dict properties: The application properties of the message
+        :returns: The message id
+        :rtype: str
+        """
+        message_id = self._next_request_id()
+        property_bag = {
+            "$.mid": message_id,
+            "$.to": f"/devices/{device_id}/messages/devicebound",
+        }
+        if properties:
+            property_bag.update(properties)
+
+        encoded = "&".join(
+            quote(str(key).encode("utf-8"), "") + "=" + quote(str(value).encode("utf-8"), "")
+            for key, value in property_bag.items()
+        )
+        topic = f"devices/{device_id}/messages/devicebound/{encoded}"
+
+        client = self._hub_clients.get(device_id)
+        if client is None or not client._deliver(topic, body):
+            self._c2d_pending.setdefault(device_id, []).append((topic, body))
+        return message_id
+
+    def send_module_input_message(
+        self, device_id: str, module_id: str, input_name: str, body: str, properties: dict = None
+    ) -> str:
+        """Routes a message to an input of a module. Messages for modules that are not
+        subscribed are queued until they subscribe
+
+        :param str device_id: The device id
+        :param str module_id: The module id
+        :param str input_name: The name of the input
+        :param str body: The message body
+        :param dict properties: The application properties of the message
+        :returns: The message id
+        :rtype: str
+        """
+        message_id = self._next_request_id()
+        property_bag = {"$.mid": message_id}
+        if properties:
+            property_bag.update(properties)
+
+        encoded = "&".join(
+            quote(str(key).encode("utf-8"), "") + "=" + quote(str(value).encode("utf-8"), "")
+            for key, value in property_bag.items()
+        )
+        client_id = device_id + "/" + module_id
+        topic = f"devices/{device_id}/modules/{module_id}/inputs/{input_name}/{encoded}"
+
+        client = self._hub_clients.get(client_id)
+        if client is None or not client._deliver(topic, body):
+            self._c2d_pending.setdefault(client_id, []).append((topic, body))
+        return message_id
+
+    def update_desired_properties(self, device_id: str, patch: dict) -> int:
+        """Updates the desired properties of a device twin, notifying the device if it is
+        connected
+
+        :param str device_id: The device id
+        :param dict patch: The JSON merge patch to apply to the desired properties
+        :returns: The new desired properties version
+        :rtype: int
+        """
+        desired = self._twin(device_id)["desired"]
+        merge_patch(desired, patch)
+        desired["$version"] += 1
+
+        notification = dict(patch)
+        notification["$version"] = desired["$version"]
+        topic = f"$iothub/twin/PATCH/properties/desired/?$version={desired['$version']}"
+        client = self._hub_clients.get(device_id)
+        if client is not None:
+            client._deliver(topic, json.dumps(notification))
+        else:
+            self._queue_for_session(device_id, topic, json.dumps(notification))
+        return desired["$version"]
+
+    def get_twin(self, device_id: str) -> dict:
+        """Gets the device twin as stored by the emulated hub
+
+        :param str device_id: The device id
+        :returns: The twin, with ``desired`` and ``reported`` sections
+        :rtype: dict
+        """
+        return json.loads(json.dumps(self._twin(device_id)))
@@ -0,0 +1,185 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`method_executor`
+=====================
+
+Executors that decide where direct method handlers run, so that a slow handler does not stop
+`IoTMQTT.loop` from servicing keep-alives, cloud to device messages and other methods.
+
+`MethodExecutor` runs handlers in the thread that calls ``loop``. A handler that returns a
+generator runs as a cooperative task: the generator is advanced one step each time ``loop`` is
+called, and the value it returns is the response. This works on CircuitPython::
+
+    def calibrate(payload):
+        for step in range(20):
+            do_calibration_step(step)
+            yield
+        return IoTResponse(200, "Calibrated")
+
+`ThreadPoolMethodExecutor` runs handlers in a pool of worker threads, for CPython.
+
+Responses are always published from the thread that calls ``loop``, as MiniMQTT is not thread
+safe.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any, Callable, Dict, List, Tuple
+except ImportError:
+    pass
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+
+def _is_task(result: Any) -> bool:
+    # Generators are resumed with send, responses don't have it
+    return hasattr(result, "send") and hasattr(result, "close")
+
+
+class MethodExecutor:
+    """Runs direct method handlers in the thread that calls ``loop``, stepping handlers that
+    return generators as cooperative tasks"""
+
+    def __init__(self):
+        self._tasks: Dict[str, Any] = {}
+        self._completed: List[Tuple[str, Any]] = []
+
+    def submit(self, request_id: str, handler: Callable) -> None:
+        """Starts running a handler
+
+        :param str request_id: The request id of the method call
+        :param handler: A function with no arguments that handles the method call and returns
+            the response, or a generator that returns the response
+        """
+        try:
+            result = handler()
+        except Exception as error:
+            # Collected by poll like any other result, so a 500 response is sent
+            self._completed.append((request_id, error))
+            return
+        self._start(request_id, result)
+
+    def _start(self, request_id: str, result: Any) -> None:
+        if _is_task(result):
+            self._tasks[request_id] = result
+        else:
+            self._completed.append((request_id, result))
+
+    def poll(self) -> List[Tuple[str, Any]]:
+        """Advances the cooperative tasks one step and collects the handlers that have finished
+
+        :returns: The request id and result of each finished handler. The result is the response
+            returned by the handler, or the exception it raised
+        :rtype: list
+        """
+        if self._tasks:
+            for request_id, task in list(self._tasks.items()):
+                try:
+                    next(task)
+                except StopIteration as stop:
+                    del self._tasks[request_id]
+                    self._completed.append((request_id, stop.value))
+                except Exception as error:
+                    del self._tasks[request_id]
+                    self._completed.append((request_id, error))
+
+        completed = self._completed
+        self._completed = []
+        return completed
+
+    def cancel(self, request_id: str) -> None:
+        """Stops waiting for a handler, for example because it timed out. A cooperative task is
+        closed, and the result of any other handler is discarded when it finishes
+
+        :param str request_id: The request id of the method call
+        """
+        task = self._tasks.pop(request_id, None)
+        if task is not None:
+            task.close()
+
+    @property
+    def pending(self) -> int:
+        """The number of handlers that have not finished"""
+        return len(self._tasks)
+
+    def shutdown(self) -> None:
+        """Closes all the cooperative tasks"""
+        for request_id in list(self._tasks):
+            self.cancel(request_id)
+        self._completed = []
+
+
+class ThreadPoolMethodExecutor(MethodExecutor):
+    """Runs direct method handlers in a pool of worker threads. This needs CPython. Handlers that
+    return generators are stepped in the thread that calls ``loop``"""
+
+    def __init__(self, max_workers: int = 4):
+        """Creates the executor
+
+        :param int max_workers: The most handlers to run at the same time
+        """
+        if ThreadPoolExecutor is None:
+            raise RuntimeError("Threads are not available, use MethodExecutor instead")
+
+        super().__init__()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="azureiot-method"
+        )
+        self._futures: Dict[str, Any] = {}
+
+    def submit(self, request_id: str, handler: Callable) -> None:
+        """Queues a handler to run on a worker thread
+
+        :param str request_id: The request id of the method call
+        :param handler: A function with no arguments that handles the method call and returns
+            the response
+        """
+        self._futures[request_id] = self._pool.submit(handler)
+
+    def poll(self) -> List[Tuple[str, Any]]:
+        """Collects the handlers that have finished
+
+        :returns: The request id and result of each finished handler. The result is the response
+            returned by the handler, or the exception it raised
+        :rtype: list
+        """
+        for request_id, future in list(self._futures.items()):
+            if future.done():
+                del self._futures[request_id]
+                error = future.exception()
+                if error is not None:
+                    self._completed.append((request_id, error))
+                else:
+                    self._start(request_id, future.result())
+        return super().poll()
+
+    def cancel(self, request_id: str) -> None:
+        """Stops waiting for a handler. A handler that has not started is not run, and the result
+        of one that is running is discarded when it finishes
+
+        :param str request_id: The request id of the method call
+        """
+        future = self._futures.pop(request_id, None)
+        if future is not None:
+            future.cancel()
+        super().cancel(request_id)
+
+    @property
+    def pending(self) -> int:
+        """The number of handlers that have not finished"""
+        return len(self._futures) + super().pending
+
+    def shutdown(self) -> None:
+        """Stops the worker threads once the running handlers finish, without waiting for them"""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+        self._pool.shutdown(wait=False)
+        super().shutdown()
@@ -0,0 +1,109 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`method_registry`
+=====================
+
+A registry of direct method or command handlers keyed by name, so a device with many methods
+dispatches each call with one dictionary lookup instead of a chain of ``if``/``elif`` checks on
+the method name.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Callable, Dict, Optional, Tuple
+except ImportError:
+    pass
+
+import json
+
+from .iot_mqtt import IoTResponse
+
+
+class MethodRegistry:
+    """Handlers for direct methods or commands, looked up by name"""
+
+    def __init__(self, default: Callable = None):
+        """Creates the registry
+
+        :param default: An optional handler for methods that have not been registered, with the
+            signature ``default(method_name: str, payload: str) -> IoTResponse``
+        """
+        self.default = default
+        """The handler for methods that have not been registered, or None. This should have the
+        signature ``default(method_name: str, payload: str) -> IoTResponse``"""
+        self._handlers: Dict[str, Tuple[Callable, bool, bool]] = {}
+
+    def register(
+        self,
+        method_name: str,
+        handler: Callable,
+        decode_json: bool = False,
+        keyword_arguments: bool = False,
+    ) -> None:
+        """Registers the handler for a method, replacing any existing handler for it.
+
+        By default the handler is called with the payload string. With ``decode_json`` the
+        payload is decoded once before the handler is called, and a payload that is not valid
+        JSON gets a 400 response without calling the handler. With ``keyword_arguments`` a JSON
+        object payload is passed as keyword arguments, so ``{"delay": 5}`` calls
+        ``handler(delay=5)``.
+
+        The handler returns an `IoTResponse`. If it returns None the method gets a 200 response.
+
+        :param str method_name: The name of the method or command
+        :param handler: The handler for the method
+        :param bool decode_json: True to decode the payload as JSON before calling the handler
+        :param bool keyword_arguments: True to pass a JSON object payload as keyword arguments.
+            This implies ``decode_json``
+        """
+        self._handlers[method_name] = (handler, decode_json or keyword_arguments, keyword_arguments)
+
+    def unregister(self, method_name: str) -> None:
+        """Removes the handler for a method, if there is one
+
+        :param str method_name: The name of the method or command
+        """
+        self._handlers.pop(method_name, None)
+
+    def __contains__(self, method_name: str) -> bool:
+        return method_name in self._handlers
+
+    def __len__(self) -> int:
+        return len(self._handlers)
+
+    def dispatch(self, method_name: str, payload: str) -> Optional[IoTResponse]:
+        """Calls the handler for a method
+
+        :param str method_name: The name of the method that was invoked
+        :param str payload: The payload sent with the method
+        :returns: The response from the handler, or None if there is no handler for the method
+            and no default handler
+        :rtype: IoTResponse
+        """
+        entry = self._handlers.get(method_name)
+        if entry is None:
+            if self.default is None:
+                return None
+            return self.default(method_name, payload)
+
+        handler, decode_json, keyword_arguments = entry
+        if decode_json:
+            try:
+                payload = json.loads(payload) if payload else None
+            except ValueError:
+                return IoTResponse(400, "Invalid JSON payload")
+
+        if keyword_arguments and isinstance(payload, dict):
+            response = handler(**payload)
+        elif keyword_arguments and payload is None:
+            response = handler()
+        else:
+            response = handler(payload)
+
+        if response is None:
+            return IoTResponse(200, "OK")
+        return response
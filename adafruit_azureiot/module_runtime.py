@@ -0,0 +1,184 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`module_runtime`
+=====================
+
+Runs several IoT Hub module identities in one process. Each module has its own MQTT connection,
+and the modules share the socket pool, the SSL context, the cache of TLS sessions, the SAS token
+signer and the logger, and are serviced by one `ModuleRuntime.loop`. Adding a module then costs
+a connection rather than a full client stack.
+
+.. code-block:: python
+
+    runtime = ModuleRuntime(pool, ssl_context)
+    sensor = runtime.add_module(sensor_connection_string)
+    averager = runtime.add_module(averager_connection_string)
+    averager.on_module_input_message_received = average_reading
+    runtime.connect()
+
+    while True:
+        runtime.loop()
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Dict, List
+except ImportError:
+    pass
+
+import adafruit_logging as logging
+from adafruit_logging import Logger
+
+from .iothub_device import IoTHubDevice
+from .sas_signer import SasSigner
+from .tls_session import TLSSessionCache
+
+
+class ModuleRuntime:
+    """Module clients that share one network stack and are serviced by one loop"""
+
+    def __init__(
+        self,
+        socket,
+        iface,
+        logger: Logger = None,
+        transport=None,
+        token_expires: int = 21600,
+        tls_session_cache: TLSSessionCache = None,
+        signer: SasSigner = None,
+        loop_timeout: float = 1,
+    ):
+        """Creates the runtime
+
+        :param socket: The network socket, shared by every module
+        :param iface: The network interface, shared by every module
+        :param Logger logger: The logger, shared by every module
+        :param transport: The MQTT transport to connect with, see `adafruit_azureiot.transport`.
+            Defaults to a MiniMQTT client
+        :param int token_expires: The number of seconds till the tokens expire, defaults to 6 hours
+        :param TLSSessionCache tls_session_cache: The cache of TLS sessions shared by every
+            module. Defaults to a new cache
+        :param SasSigner signer: The SAS token signer shared by every module. Defaults to a new
+            signer
+        :param float loop_timeout: How long `loop` waits for a message on each module, in
+            seconds, defaults to 1
+        """
+        self._socket = socket
+        self._iface = iface
+        if logger is not None:
+            self._logger = logger
+        else:
+            self._logger = logging.getLogger("log")
+            self._logger.addHandler(logging.StreamHandler())
+        self._transport = transport
+        self._token_expires = token_expires
+        self._tls_sessions = (
+            tls_session_cache if tls_session_cache is not None else TLSSessionCache()
+        )
+        self._signer = signer if signer is not None else SasSigner()
+        self._loop_timeout = loop_timeout
+        self._modules: Dict[str, IoTHubDevice] = {}
+
+    @property
+    def tls_sessions(self) -> TLSSessionCache:
+        """The cache of TLS sessions shared by the modules"""
+        return self._tls_sessions
+
+    @property
+    def signer(self) -> SasSigner:
+        """The SAS token signer shared by the modules"""
+        return self._signer
+
+    @property
+    def modules(self) -> List[IoTHubDevice]:
+        """The modules, in the order they were added"""
+        return list(self._modules.values())
+
+    def module(self, module_id: str, device_id: str = None) -> IoTHubDevice:
+        """Gets a module
+
+        :param str module_id: The module ID
+        :param str device_id: The device ID, only needed if modules of several devices have the
+            same module ID
+        :returns: The module
+        :rtype: IoTHubDevice
+        :raises KeyError: if there is no such module
+        """
+        for client in self._modules.values():
+            if client.module_id == module_id and device_id in {None, client.device_id}:
+                return client
+        raise KeyError(module_id)
+
+    def add_module(self, connection_string: str, **kwargs) -> IoTHubDevice:
+        """Adds a module. It is connected by the next call to `connect`
+
+        :param str connection_string: The connection string of the module, with a ``ModuleId``
+        :param kwargs: Other arguments for the `IoTHubDevice` of the module, such as
+            ``twin_cache`` or ``enable_stats``
+        :returns: The client for the module, to set callbacks on and send messages with
+        :rtype: IoTHubDevice
+        :raises ValueError: if the connection string has no ``ModuleId``, or the module has
+            already been added
+        """
+        client = IoTHubDevice(
+            self._socket,
+            self._iface,
+            connection_string,
+            token_expires=self._token_expires,
+            logger=self._logger,
+            transport=self._transport,
+            tls_session_cache=self._tls_sessions,
+            signer=self._signer,
+            loop_timeout=self._loop_timeout,
+            **kwargs,
+        )
+        if client.module_id is None:
+            raise ValueError("The connection string has no ModuleId")
+
+        key = client.device_id + "/" + client.module_id
+        if key in self._modules:
+            raise ValueError("Module " + key + " has already been added")
+        self._modules[key] = client
+        return client
+
+    def remove_module(self, client: IoTHubDevice) -> None:
+        """Disconnects a module and removes it from the runtime
+
+        :param IoTHubDevice client: The client for the module
+        """
+        key = client.device_id + "/" + client.module_id
+        if self._modules.pop(key, None) is not None and client.is_connected():
+            client.disconnect()
+
+    def connect(self) -> None:
+        """Connects every module that isn't connected
+
+        :raises RuntimeError: if the internet connection is not responding or is unable to connect
+        """
+        for client in self._modules.values():
+            if not client.is_connected():
+                client.connect()
+
+    def loop(self) -> None:
+        """Listens for MQTT messages on every connected module. A module that fails is logged
+        and skipped, so it doesn't stop the others being serviced
+        """
+        for key, client in self._modules.items():
+            if not client.is_connected():
+                continue
+            try:
+                client.loop()
+            except Exception as error:
+                self._logger.error(
+                    "- module_runtime :: loop :: module " + key + " failed: " + str(error)
+                )
+
+    def disconnect(self) -> None:
+        """Disconnects every connected module"""
+        for client in self._modules.values():
+            if client.is_connected():
+                client.disconnect()
@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`property_acks`
+=====================
+
+Acknowledgements for IoT Central writable properties. IoT Central shows a write as applied when
+the device reports the property wrapped in an acknowledgement that has the value, a status code
+(``ac``), the desired properties version it applies to (``av``) and a description (``ad``).
+
+The acknowledgements for every property in a desired patch are collected into one reported
+patch, so a patch that writes many properties needs one twin write rather than one per property.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any
+except ImportError:
+    pass
+
+COMPONENT_MARKER = "__t"
+"""The key IoT Central adds to the properties of a component, with a value of ``"c"``"""
+
+
+def ack_property(
+    value: Any, version: int, status: int = 200, description: str = "completed"
+) -> dict:
+    """Wraps a property value in a writable property acknowledgement
+
+    :param value: The value of the property
+    :param int version: The desired properties version the value came from
+    :param int status: The HTTP style status code, 200 if the write was applied
+    :param str description: A description of the result
+    :returns: The acknowledgement to report for the property
+    :rtype: dict
+    """
+    return {"value": value, "ac": status, "av": version, "ad": description}
+
+
+def is_component(value: Any) -> bool:
+    """Gets if a desired property value is a component rather than a property
+
+    :param value: The value from the desired properties
+    :returns: True if the value holds the properties of a component
+    :rtype: bool
+    """
+    return isinstance(value, dict) and value.get(COMPONENT_MARKER) == "c"
+
+
+class PropertyAckBatcher:
+    """Collects the acknowledgements for one desired property patch into one reported patch"""
+
+    def __init__(self, version: int):
+        """Creates the batcher
+
+        :param int version: The version of the desired properties being acknowledged
+        """
+        self.version = version
+        self._patch = {}
+
+    def __len__(self) -> int:
+        return len(self._patch)
+
+    def ack(
+        self,
+        name: str,
+        value: Any,
+        status: int = 200,
+        description: str = "completed",
+        component: str = None,
+    ) -> None:
+        """Adds the acknowledgement for a property
+
+        :param str name: The name of the property
+        :param value: The value of the property. None removes the reported property rather than
+            acknowledging it
+        :param int status: The HTTP style status code, 200 if the write was applied
+        :param str description: A description of the result
+        :param str component: The name of the component the property is in, or None
+        """
+        target = self._patch
+        if component is not None:
+            target = target.get(component)
+            if target is None:
+                target = {COMPONENT_MARKER: "c"}
+                self._patch[component] = target
+
+        if value is None:
+            target[name] = None
+        else:
+            target[name] = ack_property(value, self.version, status, description)
+
+    def ack_patch(self, patch: dict) -> None:
+        """Acknowledges every property in a desired patch as applied, including the properties
+        of components
+
+        :param dict patch: The desired patch, without the ``$version``
+        """
+        for name, value in patch.items():
+            if is_component(value):
+                for property_name, property_value in value.items():
+                    if property_name != COMPONENT_MARKER:
+                        self.ack(property_name, property_value, component=name)
+            else:
+                self.ack(name, value)
+
+    def build(self) -> dict:
+        """Gets the reported patch with all the acknowledgements
+
+        :returns: The patch, which is empty if nothing was acknowledged
+        :rtype: dict
+        """
+        return self._patch
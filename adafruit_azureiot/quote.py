@@ -8,7 +8,7 @@
 
 The quote function %-escapes all characters that are neither in the
 unreserved chars ("always safe") nor the additional chars set via the
-safe arg.
+safe arg. The unquote function reverses this.
 
 """
 
@@ -19,6 +19,7 @@ except ImportError:
 
 _ALWAYS_SAFE = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_.-~")
 _ALWAYS_SAFE_BYTES = bytes(_ALWAYS_SAFE)
+_HEX_DIGITS = "0123456789abcdefABCDEF"
 SAFE_QUOTERS = {}
 
 
@@ -45,6 +46,31 @@ def quote(bytes_val: bytes, safe: Union[str, bytes, bytearray] = "/") -> str:
     return "".join([quoter(char) for char in bytes_val])
 
 
+def unquote(string: str) -> str:
+    """The unquote function replaces %xx escapes with the bytes they represent,
+    and decodes the result as UTF-8. Invalid escapes are left unchanged.
+    """
+    index = string.find("%")
+    if index == -1:
+        return string
+
+    result = bytearray()
+    start = 0
+    length = len(string)
+    while index != -1:
+        result.extend(string[start:index].encode("utf-8"))
+        escape = string[index + 1 : index + 3]
+        if len(escape) == 2 and escape[0] in _HEX_DIGITS and escape[1] in _HEX_DIGITS:
+            result.append(int(escape, 16))
+            start = index + 3
+        else:
+            result.extend(b"%")
+            start = index + 1
+        index = string.find("%", start) if start < length else -1
+    result.extend(string[start:].encode("utf-8"))
+    return str(result, "utf-8")
+
+
 class defaultdict:
     """
     Default Dict Implementation.
@@ -0,0 +1,228 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`reported_writer`
+=====================
+
+Coalesces reported property updates. Patches made within the debounce window are merged into
+one document, which is sent as a single twin write when the window ends. Devices that update many
+properties at once then use one twin operation instead of one per property.
+
+Before a patch is sent it is compared with the reported properties the hub has acknowledged,
+and only the values that change are sent. Writes that change nothing are dropped, as twin writes
+have a much lower quota than telemetry.
+
+When the hub throttles a patch, the patch is merged back into the pending update and the writer
+backs off exponentially before sending again.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any, Callable, List, Optional, Union
+except ImportError:
+    pass
+
+import json
+import time
+
+from .twin_cache import _copy, combine_patches, merge_patch, minimal_patch
+
+
+class ReportedPropertyWriter:
+    """Merges reported property patches over a debounce window and sends them as one patch"""
+
+    def __init__(
+        self,
+        send: Callable,
+        debounce: float = 1.0,
+        min_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """Creates the writer
+
+        :param send: The function that sends a patch, called with the merged patch as a
+            dictionary
+        :param float debounce: How long to collect patches for after the first one, in seconds.
+            The window starts at the first patch, so frequent updates can't hold a patch back
+            forever. With 0 each patch can be sent as soon as `poll` is called
+        :param float min_backoff: How long to wait after the first throttled patch, in seconds
+        :param float max_backoff: The longest wait after repeated throttling, in seconds
+        """
+        self._send = send
+        self.debounce = debounce
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._pending: Optional[dict] = None
+        self._first_update_at = 0.0
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._acknowledged = {}
+        self._complete = False
+        self._in_flight: List[dict] = []
+        self.throttled_count = 0
+        """The number of patches the hub throttled"""
+        self.suppressed = 0
+        """The number of updates and patches that were dropped because they changed nothing"""
+        self.updates = 0
+        """The number of patches passed to `update`"""
+        self.patches_sent = 0
+        """The number of merged patches sent"""
+
+    @property
+    def backoff(self) -> float:
+        """The current wait after throttling, in seconds, or 0 if the hub is not throttling"""
+        return self._backoff
+
+    @property
+    def pending(self) -> Optional[dict]:
+        """The merged patch waiting to be sent, or None if there isn't one"""
+        return self._pending
+
+    @property
+    def acknowledged_state(self) -> dict:
+        """The reported properties as the hub has acknowledged them. Unless the full twin has
+        been loaded this only has the properties that were written. Don't change it"""
+        return self._acknowledged
+
+    def load(self, reported: dict) -> None:
+        """Sets the acknowledged state from the reported properties of the full twin
+
+        :param dict reported: The reported properties, with or without the ``$version``
+        """
+        acknowledged = _copy(reported)
+        acknowledged.pop("$version", None)
+        self._acknowledged = acknowledged
+        self._complete = True
+
+    def _expected_state(self) -> dict:
+        # What the reported properties will be once the patches that were sent are applied
+        if not self._in_flight:
+            return self._acknowledged
+        state = _copy(self._acknowledged)
+        for patch in self._in_flight:
+            merge_patch(state, patch)
+        return state
+
+    def _forget(self, patch: dict) -> None:
+        # Compare by identity, as equal patches may have been sent more than once
+        for index, sent in enumerate(self._in_flight):
+            if sent is patch:
+                del self._in_flight[index]
+                return
+
+    def update(self, patch: Union[str, dict]) -> bool:
+        """Adds a patch to the pending update. A patch that changes nothing is dropped
+
+        :param patch: The patch, as a dictionary or a JSON string
+        :returns: True if the patch was merged into an update that was already pending
+        :rtype: bool
+        """
+        if isinstance(patch, str):
+            patch = json.loads(patch)
+
+        self.updates += 1
+        if self._pending is None:
+            patch = minimal_patch(self._expected_state(), patch, self._complete)
+            if not patch:
+                self.suppressed += 1
+                return False
+            self._pending = {}
+            self._first_update_at = time.monotonic()
+            combine_patches(self._pending, patch)
+            return False
+
+        combine_patches(self._pending, patch)
+        return True
+
+    def poll(self, now: Optional[float] = None) -> Any:
+        """Sends the pending update if its debounce window has ended
+
+        :param float now: The current time from ``time.monotonic()``
+        :returns: The result of the send function, or None if nothing was sent
+        """
+        if self._pending is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        if now < self._retry_at or now - self._first_update_at < self.debounce:
+            return None
+        return self.flush()
+
+    def flush(self) -> Any:
+        """Sends the pending update straight away, without the values that are already set
+
+        :returns: The result of the send function, or None if nothing was sent
+        """
+        patch = self._pending
+        if patch is None:
+            return None
+
+        self._pending = None
+        # Later updates may have put values back the way they were
+        patch = minimal_patch(self._expected_state(), patch, self._complete)
+        if not patch:
+            self.suppressed += 1
+            return None
+
+        self._in_flight.append(patch)
+        try:
+            result = self._send(patch)
+        except Exception:
+            # Keep the update so it is sent next time
+            self._forget(patch)
+            self._requeue(patch)
+            raise
+        self.patches_sent += 1
+        return result
+
+    def _requeue(self, patch: dict) -> None:
+        if self._pending is not None:
+            # Later updates win over the patch being put back
+            combine_patches(patch, self._pending)
+        else:
+            self._first_update_at = time.monotonic() - self.debounce
+        self._pending = patch
+
+    def throttled(self, patch: Optional[dict] = None) -> float:
+        """Tells the writer that a patch was throttled or failed and should be sent again. The
+        patch is merged back into the pending update, and the writer waits before sending it
+
+        :param dict patch: The patch that was not applied, or None if it should not be resent
+        :returns: How long the writer will wait before sending again, in seconds
+        :rtype: float
+        """
+        self.throttled_count += 1
+        if patch is not None:
+            self._forget(patch)
+            self._requeue(patch)
+        backoff = self._backoff * 2 if self._backoff else self.min_backoff
+        self._backoff = min(self.max_backoff, backoff)
+        self._retry_at = time.monotonic() + self._backoff
+        return self._backoff
+
+    def acknowledged(self, patch: Optional[dict] = None) -> None:
+        """Tells the writer that a patch was applied, so it stops backing off and later patches
+        are compared with the new state
+
+        :param dict patch: The patch that was applied
+        """
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        if patch is not None:
+            self._forget(patch)
+            merge_patch(self._acknowledged, patch)
+
+    def rejected(self, patch: dict) -> None:
+        """Tells the writer that the hub rejected a patch, so it was not applied and should not
+        be sent again
+
+        :param dict patch: The patch that was rejected
+        """
+        self._forget(patch)
+
+    def clear(self) -> None:
+        """Drops the pending update without sending it"""
+        self._pending = None
@@ -0,0 +1,183 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`request_correlator`
+=====================
+
+Matches responses from IoT Hub to the requests that caused them. Every request gets a unique,
+increasing request id (``$rid``), and the response carries the same id, so concurrent requests
+can be told apart, and requests that get no response time out.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any, Callable, Dict, List, Optional
+except ImportError:
+    pass
+
+import time
+
+
+class PendingRequest:
+    """A request that has been sent to IoT Hub, which completes when its response arrives. This
+    acts as a future: check `done`, or add a callback to be called when it completes"""
+
+    def __init__(self, request_id: str, kind: str, timeout: float):
+        """Creates a pending request
+
+        :param str request_id: The request id sent with the request
+        :param str kind: What the request is for, such as ``"twin_get"``
+        :param float timeout: How long to wait for the response, in seconds
+        """
+        self.request_id = request_id
+        self.kind = kind
+        self.sent_at = time.monotonic()
+        self.deadline = self.sent_at + timeout
+        self.completed_at: Optional[float] = None
+        self.status: Optional[int] = None
+        """The status code of the response, or None if there was no response"""
+        self.result: Any = None
+        """The body of the response"""
+        self.version: Optional[int] = None
+        """The twin version sent with the response, if there was one"""
+        self.error: Optional[str] = None
+        """Why the request failed, or None if it succeeded"""
+        self.context: Any = None
+        """Anything the sender wants to keep with the request"""
+        self._callbacks: List[Callable] = []
+
+    @property
+    def done(self) -> bool:
+        """True once a response has arrived or the request has timed out"""
+        return self.completed_at is not None
+
+    @property
+    def succeeded(self) -> bool:
+        """True if a response with a 2xx status arrived"""
+        return self.status is not None and 200 <= self.status < 300
+
+    @property
+    def latency(self) -> Optional[float]:
+        """How long the response took, in seconds, or None if the request is not done"""
+        if self.completed_at is None:
+            return None
+        return self.completed_at - self.sent_at
+
+    def add_done_callback(self, callback: Callable) -> None:
+        """Calls a callback with this request when it completes, straight away if it already
+        has
+
+        :param callback: A function that takes the request
+        """
+        if self.done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _complete(
+        self,
+        status: Optional[int],
+        result: Any = None,
+        version: Optional[int] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        self.completed_at = time.monotonic()
+        self.status = status
+        self.result = result
+        self.version = version
+        self.error = error
+        callbacks = self._callbacks
+        self._callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+
+class RequestCorrelator:
+    """A table of pending requests keyed by request id"""
+
+    def __init__(self, timeout: float = 10):
+        """Creates the correlator
+
+        :param float timeout: The default time to wait for a response, in seconds
+        """
+        self.timeout = timeout
+        self._next_id = 1
+        self._pending: Dict[str, PendingRequest] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self, kind: str, timeout: Optional[float] = None) -> PendingRequest:
+        """Creates a request with the next request id and starts waiting for its response
+
+        :param str kind: What the request is for, such as ``"twin_get"``
+        :param float timeout: How long to wait for the response, in seconds, defaults to the
+            correlator's timeout
+        :returns: The pending request
+        :rtype: PendingRequest
+        """
+        request_id = str(self._next_id)
+        self._next_id += 1
+        request = PendingRequest(request_id, kind, self.timeout if timeout is None else timeout)
+        self._pending[request_id] = request
+        return request
+
+    def get(self, request_id: str) -> Optional[PendingRequest]:
+        """Gets a pending request
+
+        :param str request_id: The request id
+        :returns: The request, or None if it is not pending
+        :rtype: PendingRequest
+        """
+        return self._pending.get(request_id)
+
+    def complete(
+        self,
+        request_id: str,
+        status: Optional[int],
+        result: Any = None,
+        version: Optional[int] = None,
+        error: Optional[str] = None,
+    ) -> Optional[PendingRequest]:
+        """Completes a pending request when its response arrives
+
+        :param str request_id: The request id from the response
+        :param int status: The status code of the response
+        :param result: The body of the response
+        :param int version: The twin version sent with the response
+        :param str error: Why the request failed, if it did
+        :returns: The request, or None if no request with this id is pending
+        :rtype: PendingRequest
+        """
+        request = self._pending.pop(request_id, None) if request_id is not None else None
+        if request is not None:
+            request._complete(status, result, version, error)
+        return request
+
+    def cancel(self, request_id: str) -> None:
+        """Stops waiting for a request, without completing it
+
+        :param str request_id: The request id
+        """
+        self._pending.pop(request_id, None)
+
+    def expire(self, now: Optional[float] = None) -> List[PendingRequest]:
+        """Completes the requests whose deadline has passed, with a status of None
+
+        :param float now: The current time from ``time.monotonic()``
+        :returns: The requests that timed out
+        :rtype: list
+        """
+        if not self._pending:
+            return []
+
+        if now is None:
+            now = time.monotonic()
+        expired = [request for request in self._pending.values() if request.deadline <= now]
+        for request in expired:
+            del self._pending[request.request_id]
+            request._complete(None, error="Timed out waiting for a response")
+        return expired
@@ -0,0 +1,193 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`tls_session`
+=====================
+
+Caches TLS sessions per endpoint so that reconnecting to IoT Hub or the Device Provisioning
+Service can resume the previous session instead of doing a full handshake.
+
+Resumption needs an SSL context that supports sessions, such as CPython's ``ssl.SSLContext``.
+Other contexts, such as the CircuitPython ``ssl`` module or the ESP32SPI co-processor, are used
+unchanged, so the cache costs nothing on boards that can't resume sessions.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any, Dict, Optional, Tuple
+except ImportError:
+    pass
+
+import time
+
+from .iot_stats import IoTStats
+
+
+def supports_sessions(ssl_context) -> bool:
+    """Gets if an SSL context supports resuming TLS sessions
+
+    :param ssl_context: The SSL context
+    :returns: True if sessions can be resumed with this context
+    :rtype: bool
+    """
+    # session_stats is only available on SSL contexts that can resume sessions
+    return ssl_context is not None and hasattr(ssl_context, "session_stats")
+
+
+class _ResumingSocket:
+    """Wraps an SSL socket to time the handshake and capture the session for later reuse"""
+
+    def __init__(self, cache: "TLSSessionCache", host: str, sock, offered: bool):
+        self._cache = cache
+        self._host = host
+        self._sock = sock
+        self._offered = offered
+
+    def connect(self, address: Tuple[str, int]) -> None:
+        """Connects the socket, doing the TLS handshake"""
+        started_at = time.monotonic()
+        self._sock.connect(address)
+        elapsed = time.monotonic() - started_at
+        self._cache._record(self._host, self._offered, self._sock.session_reused, elapsed)
+        self._cache._store(self._host, self._sock.session)
+
+    def close(self) -> None:
+        """Closes the socket, keeping the session. With TLS 1.3 the session ticket is sent after
+        the handshake, so it may only be available now"""
+        try:
+            self._cache._store(self._host, self._sock.session)
+        except (AttributeError, OSError, ValueError):
+            pass
+        self._sock.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._sock, name)
+
+
+class _ResumingSSLContext:
+    """Wraps an SSL context to offer cached sessions when sockets are wrapped"""
+
+    def __init__(self, cache: "TLSSessionCache", ssl_context):
+        self._cache = cache
+        self._ssl_context = ssl_context
+
+    def wrap_socket(self, sock, server_hostname: str = None, **kwargs) -> _ResumingSocket:
+        """Wraps a socket, offering the cached session for the host if there is one"""
+        session = self._cache._sessions.get(server_hostname)
+        ssl_sock = self._ssl_context.wrap_socket(
+            sock, server_hostname=server_hostname, session=session, **kwargs
+        )
+        return _ResumingSocket(self._cache, server_hostname, ssl_sock, session is not None)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._ssl_context, name)
+
+
+class TLSSessionCache:
+    """A cache of TLS sessions keyed by host name, with counters showing how often sessions are
+    resumed and how much handshake time that saves.
+
+    One cache can be shared by the DPS registration and the hub connection of a device, and by
+    several devices that share an SSL context.
+    """
+
+    def __init__(self, stats: IoTStats = None):
+        """Creates the cache
+
+        :param IoTStats stats: An optional stats object to record handshake counts and times in
+        """
+        self._stats = stats
+        self._sessions: Dict[str, Any] = {}
+        self._wrapped: Dict[int, Tuple[Any, _ResumingSSLContext]] = {}
+        self.handshakes = 0
+        """The number of TLS handshakes done"""
+        self.resumption_attempts = 0
+        """The number of handshakes where a cached session was offered"""
+        self.resumed = 0
+        """The number of handshakes that resumed a session"""
+        self.full_handshake_time = 0.0
+        """The total time spent on full handshakes, in seconds"""
+        self.resumed_handshake_time = 0.0
+        """The total time spent on resumed handshakes, in seconds"""
+
+    def wrap_context(self, ssl_context):
+        """Wraps an SSL context so that sockets it creates resume cached sessions. Contexts that
+        do not support sessions are returned unchanged
+
+        :param ssl_context: The SSL context to wrap
+        :returns: The wrapped SSL context, or the original if sessions are not supported
+        """
+        if not supports_sessions(ssl_context):
+            return ssl_context
+
+        # Reuse the wrapper so the same context is always seen by the connection manager
+        wrapped = self._wrapped.get(id(ssl_context))
+        if wrapped is None or wrapped[0] is not ssl_context:
+            wrapped = (ssl_context, _ResumingSSLContext(self, ssl_context))
+            self._wrapped[id(ssl_context)] = wrapped
+        return wrapped[1]
+
+    def _store(self, host: str, session) -> None:
+        if host is not None and session is not None:
+            self._sessions[host] = session
+
+    def _record(self, host: str, offered: bool, reused: bool, elapsed: float) -> None:
+        self.handshakes += 1
+        if offered:
+            self.resumption_attempts += 1
+        if reused:
+            self.resumed += 1
+            self.resumed_handshake_time += elapsed
+        else:
+            self.full_handshake_time += elapsed
+            if offered:
+                # The server would not resume the session, so don't offer it again
+                self._sessions.pop(host, None)
+
+        if self._stats is not None:
+            self._stats.increment("tls_handshakes")
+            if reused:
+                self._stats.increment("tls_sessions_resumed")
+            self._stats.observe("tls_handshake", elapsed)
+
+    def clear(self, host: Optional[str] = None) -> None:
+        """Forgets cached sessions
+
+        :param str host: The host to forget the session for, or None to forget all sessions
+        """
+        if host is None:
+            self._sessions.clear()
+        else:
+            self._sessions.pop(host, None)
+
+    @property
+    def time_saved(self) -> float:
+        """The estimated handshake time saved by resuming sessions, in seconds, based on the
+        average full and resumed handshake times"""
+        full_handshakes = self.handshakes - self.resumed
+        if self.resumed == 0 or full_handshakes == 0:
+            return 0.0
+        average_full = self.full_handshake_time / full_handshakes
+        average_resumed = self.resumed_handshake_time / self.resumed
+        return max(0.0, (average_full - average_resumed) * self.resumed)
+
+    def as_dict(self) -> dict:
+        """Gets the resumption statistics as a dictionary
+
+        :returns: The handshake and resumption counts, success rate and estimated time saved
+        :rtype: dict
+        """
+        return {
+            "handshakes": self.handshakes,
+            "resumption_attempts": self.resumption_attempts,
+            "resumed": self.resumed,
+            "resumption_rate": (
+                self.resumed / self.resumption_attempts if self.resumption_attempts else 0.0
+            ),
+            "full_handshake_time": self.full_handshake_time,
+            "resumed_handshake_time": self.resumed_handshake_time,
+            "time_saved": self.time_saved,
+        }
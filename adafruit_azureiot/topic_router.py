@@ -0,0 +1,199 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`topic_router`
+=====================
+
+Classifies inbound Azure IoT topics in a single pass. The known topic prefixes are compiled into
+a radix trie when the router is created, so routing a message is a handful of dictionary lookups
+and ``startswith`` checks, followed by slicing out the method name, request id, status code,
+version and property bag without building any intermediate lists.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Dict, Optional, Tuple
+except ImportError:
+    pass
+
+ROUTE_UNKNOWN = 0
+"""A topic that is not part of the Azure IoT topic grammar"""
+ROUTE_CLOUD_TO_DEVICE = 1
+"""``devices/{device_id}/messages/devicebound/{property_bag}``"""
+ROUTE_DIRECT_METHOD = 2
+"""``$iothub/methods/POST/{method_name}/?$rid={request_id}``"""
+ROUTE_TWIN_RESPONSE = 3
+"""``$iothub/twin/res/{status}/?$rid={request_id}[&$version={version}]``"""
+ROUTE_TWIN_DESIRED = 4
+"""``$iothub/twin/PATCH/properties/desired/?$version={version}``"""
+ROUTE_DPS_RESPONSE = 5
+"""``$dps/registrations/res/{status}/?$rid={request_id}[&retry-after={seconds}]``"""
+ROUTE_MODULE_INPUT = 6
+"""``devices/{device_id}/modules/{module_id}/inputs/{input_name}/{property_bag}``"""
+
+
+def topic_parameter(topic: str, name: str, start: int = 0) -> Optional[str]:
+    """Gets the value of a parameter from the property bag of a topic
+
+    :param str topic: The topic
+    :param str name: The name of the parameter, such as ``$rid``
+    :param int start: The index in the topic to start searching from
+    :returns: The value, or None if the parameter is not in the topic
+    """
+    return _parameter(topic, name + "=", start)
+
+
+def _parameter(topic: str, key: str, start: int) -> Optional[str]:
+    # key includes the "=", so no strings are built to search for it
+    index = topic.find(key, start)
+    if index == -1:
+        return None
+    index += len(key)
+    end = topic.find("&", index)
+    return topic[index:] if end == -1 else topic[index:end]
+
+
+class TopicRoute:
+    """The result of routing a topic"""
+
+    def __init__(
+        self,
+        kind: int,
+        name: str = None,
+        request_id: str = None,
+        status: int = None,
+        version: int = None,
+        properties: str = None,
+    ):
+        """Creates a route
+
+        :param int kind: The kind of topic, one of the ``ROUTE_`` constants
+        :param str name: The direct method name
+        :param str request_id: The request id (``$rid``)
+        :param int status: The status code of a response
+        :param int version: The twin version
+        :param str properties: The property bag at the end of the topic
+        """
+        self.kind = kind
+        self.name = name
+        self.request_id = request_id
+        self.status = status
+        self.version = version
+        self.properties = properties
+
+
+class TopicRouter:
+    """Routes inbound topics for one device or module"""
+
+    def __init__(self, device_id: str, module_id: str = None):
+        """Creates the router, compiling the topic prefixes for the device
+
+        :param str device_id: The id of the device, used in the cloud to device topic
+        :param str module_id: The id of the module, used in the module input topic, or None for
+            a device
+        """
+        self._trie: Dict[str, Tuple[str, int, dict]] = {}
+        prefixes = [
+            ("$iothub/methods/POST/", ROUTE_DIRECT_METHOD),
+            ("$iothub/twin/res/", ROUTE_TWIN_RESPONSE),
+            ("$iothub/twin/PATCH/properties/desired/", ROUTE_TWIN_DESIRED),
+            ("$dps/registrations/res/", ROUTE_DPS_RESPONSE),
+            (f"devices/{device_id}/messages/devicebound/", ROUTE_CLOUD_TO_DEVICE),
+        ]
+        if module_id is not None:
+            prefixes.append(
+                (f"devices/{device_id}/modules/{module_id}/inputs/", ROUTE_MODULE_INPUT)
+            )
+        for prefix, kind in prefixes:
+            self._insert(self._trie, prefix, kind)
+
+    def _insert(self, node: dict, prefix: str, kind: int) -> None:
+        edge = node.get(prefix[0])
+        if edge is None:
+            node[prefix[0]] = (prefix, kind, {})
+            return
+
+        label, edge_kind, children = edge
+        common = 0
+        while common < len(label) and common < len(prefix) and label[common] == prefix[common]:
+            common += 1
+
+        if common < len(label):
+            # Split the edge where the prefixes diverge
+            children = {label[common]: (label[common:], edge_kind, children)}
+            edge_kind = ROUTE_UNKNOWN
+            node[prefix[0]] = (label[:common], edge_kind, children)
+
+        if common == len(prefix):
+            node[prefix[0]] = (label[:common], kind, children)
+        else:
+            self._insert(children, prefix[common:], kind)
+
+    def _match(self, topic: str) -> Tuple[int, int]:
+        node = self._trie
+        position = 0
+        kind = ROUTE_UNKNOWN
+        length = len(topic)
+        while position < length:
+            edge = node.get(topic[position])
+            if edge is None or not topic.startswith(edge[0], position):
+                break
+            position += len(edge[0])
+            if edge[1] != ROUTE_UNKNOWN:
+                return edge[1], position
+            node = edge[2]
+        return kind, position
+
+    def route(self, topic: str) -> TopicRoute:
+        """Routes a topic, extracting the values it carries
+
+        :param str topic: The topic a message was received on
+        :returns: The route, with a kind of ``ROUTE_UNKNOWN`` if the topic is not recognized or
+            its status or version is not a number
+        :rtype: TopicRoute
+        """
+        try:
+            return self._route(topic)
+        except ValueError:
+            return TopicRoute(ROUTE_UNKNOWN)
+
+    def _route(self, topic: str) -> TopicRoute:
+        kind, position = self._match(topic)
+
+        if kind == ROUTE_CLOUD_TO_DEVICE:
+            return TopicRoute(kind, None, None, None, None, topic[position:])
+
+        if kind == ROUTE_TWIN_DESIRED:
+            version = _parameter(topic, "$version=", position)
+            return TopicRoute(kind, None, None, None, None if version is None else int(version))
+
+        # The remaining routes have a name or status segment
+        segment_end = topic.find("/", position)
+        if kind == ROUTE_UNKNOWN or segment_end == -1:
+            return TopicRoute(ROUTE_UNKNOWN)
+        segment = topic[position:segment_end]
+
+        if kind == ROUTE_MODULE_INPUT:
+            # The input name is followed by the property bag rather than a query
+            return TopicRoute(kind, segment, None, None, None, topic[segment_end + 1 :])
+
+        query = topic.find("?", segment_end)
+        request_id = None if query == -1 else _parameter(topic, "$rid=", query)
+
+        if kind == ROUTE_DIRECT_METHOD:
+            return TopicRoute(kind, segment, request_id)
+
+        version = None
+        if kind == ROUTE_TWIN_RESPONSE and query != -1:
+            version = _parameter(topic, "$version=", query)
+        return TopicRoute(
+            kind,
+            None,
+            request_id,
+            int(segment),
+            None if version is None else int(version),
+            None if query == -1 else topic[query + 1 :],
+        )
@@ -0,0 +1,88 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`transport`
+=====================
+
+The MQTT transport used to talk to Azure IoT Hub and the Device Provisioning Service.
+
+A transport is any callable that takes the same keyword arguments as
+``adafruit_minimqtt.adafruit_minimqtt.MQTT`` (``broker``, ``port``, ``username``, ``password``,
+``client_id``, ``is_ssl``, ``keep_alive``, ``socket_pool`` and ``ssl_context``) and returns a
+client object. The client needs to support the subset of the MiniMQTT API used by this library:
+
+* ``connect(clean_session=True, session_id=None)``, ``disconnect()``, ``reconnect()`` and
+  ``is_connected()``
+* ``loop(timeout)``, ``publish(topic, msg, qos=0)`` and ``subscribe(topic, qos=0)``
+* ``add_topic_callback(topic, callback)``, ``on_message`` and ``enable_logger(log_pkg, level)``
+* the ``on_connect``, ``on_disconnect`` and ``on_publish`` callback attributes
+
+The ``flags`` passed to ``on_connect`` must have the session present flag of the CONNACK in
+bit 0, so a resumed persistent session can skip subscribing and requesting the twin again.
+
+The default transport creates a MiniMQTT client. `adafruit_azureiot.loopback` provides an
+in-process transport that emulates Azure IoT without a network.
+
+* Author(s): Adafruit Industries
+"""
+
+import adafruit_minimqtt.adafruit_minimqtt as MQTT
+
+_MIN_CONNECT_TIMEOUT = 1
+"""The least time connecting waits for, in seconds, the same as MiniMQTT's default socket
+timeout"""
+
+
+class _SessionAwareMQTT(MQTT.MQTT):
+    """A MiniMQTT client that reports the session present flag of the CONNACK. MiniMQTT reads
+    it from the remaining length byte instead, so it is always 0.
+
+    MiniMQTT also connects with the socket timeout, so a short one for polling would cut the
+    TLS handshake short. Connecting waits for at least `_MIN_CONNECT_TIMEOUT`, and the socket
+    timeout is used for reads once connected"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._reading_connack = False
+        self._session_present = 0
+
+    def _sock_exact_recv(self, bufsize: int, timeout: float = None) -> bytearray:
+        result = super()._sock_exact_recv(bufsize, timeout=timeout)
+        # The CONNACK is read as its remaining length (2), its flags and its return code
+        if self._reading_connack and bufsize == 3 and result[0] == 0x02:
+            self._reading_connack = False
+            self._session_present = result[1] & 1
+        return result
+
+    def _connect(self, *args, **kwargs) -> int:
+        on_connect = self.on_connect
+        if on_connect is not None:
+            self.on_connect = lambda client, userdata, _, rc: on_connect(
+                client, userdata, self._session_present, rc
+            )
+        self._reading_connack = True
+        self._session_present = 0
+        socket_timeout = self._socket_timeout
+        self._socket_timeout = max(socket_timeout, _MIN_CONNECT_TIMEOUT)
+        try:
+            super()._connect(*args, **kwargs)
+        finally:
+            self._reading_connack = False
+            self.on_connect = on_connect
+            self._socket_timeout = socket_timeout
+        if socket_timeout < _MIN_CONNECT_TIMEOUT:
+            self._sock.settimeout(socket_timeout)
+        return self._session_present
+
+
+def minimqtt_transport(**kwargs) -> MQTT.MQTT:
+    """Creates a MiniMQTT client. This is the default transport. The client reports the session
+    present flag to ``on_connect`` correctly
+
+    :param kwargs: The arguments to pass to the MiniMQTT client
+    :returns: The MiniMQTT client
+    :rtype: MQTT.MQTT
+    """
+    return _SessionAwareMQTT(**kwargs)
@@ -0,0 +1,235 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`twin_cache`
+=====================
+
+A local copy of the device twin. The full twin is loaded once, then desired property patches are
+applied to it as they arrive, so the application can read the twin without a round trip to the
+hub.
+
+The desired properties ``$version`` goes up by one with every update, so the cache can tell when
+a patch is stale, such as one that is redelivered after reconnecting, and when patches have been
+missed. Only a missed patch needs the full twin to be fetched again.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Any, Optional
+except ImportError:
+    pass
+
+from .property_acks import COMPONENT_MARKER
+
+PATCH_APPLIED = 0
+"""The patch was the next version and was applied"""
+PATCH_STALE = 1
+"""The patch was for a version the cache already has, so it was ignored"""
+PATCH_GAP = 2
+"""Patches were missed, or the twin has not been loaded, so the full twin is needed"""
+
+
+def merge_patch(target: dict, patch: dict) -> None:
+    """Applies a JSON merge patch to a dictionary in place. Values of None remove the key, and
+    objects are merged recursively. Objects from the patch are copied, so later changes to the
+    patch don't change the target
+
+    :param dict target: The dictionary to update
+    :param dict patch: The patch to apply
+    """
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            existing = target.get(key)
+            if not isinstance(existing, dict):
+                existing = {}
+                target[key] = existing
+            merge_patch(existing, value)
+        else:
+            target[key] = value
+
+
+def combine_patches(first: dict, second: dict) -> None:
+    """Combines two JSON merge patches in place, so that applying the first patch gives the same
+    result as applying both in turn. Unlike `merge_patch`, values of None are kept, as they
+    remove properties when the combined patch is applied
+
+    :param dict first: The earlier patch, which is updated
+    :param dict second: The later patch
+    """
+    for key, value in second.items():
+        existing = first.get(key)
+        if isinstance(value, dict) and isinstance(existing, dict):
+            combine_patches(existing, value)
+        else:
+            first[key] = _copy(value)
+
+
+def minimal_patch(state: dict, patch: dict, complete: bool = True) -> dict:
+    """Removes the parts of a JSON merge patch that would not change a document, such as values
+    that are already set and objects whose values are all already set. The IoT Central
+    component marker is kept in any object that has changes, as the hub needs it in every
+    patch to the component
+
+    :param dict state: The document the patch will be applied to
+    :param dict patch: The patch
+    :param bool complete: True if the document is known to be complete, so values of None for
+        properties it doesn't have can be dropped. Otherwise they are kept, as the property may
+        exist
+    :returns: The smallest patch with the same effect, which is empty if the patch changes
+        nothing. Values are not copied
+    :rtype: dict
+    """
+    result = {}
+    for key, value in patch.items():
+        if key not in state:
+            if value is not None or not complete:
+                result[key] = value
+            continue
+
+        existing = state[key]
+        if isinstance(value, dict) and isinstance(existing, dict):
+            changes = minimal_patch(existing, value, complete)
+            if changes:
+                if COMPONENT_MARKER in value:
+                    changes[COMPONENT_MARKER] = value[COMPONENT_MARKER]
+                result[key] = changes
+        elif type(value) is not type(existing) or value != existing:
+            # The type is compared so that 1, 1.0 and true are different, as they are in JSON
+            result[key] = value
+    return result
+
+
+def _lookup(document: dict, path: str, default: Any) -> Any:
+    value = document
+    for name in path.split("."):
+        if not isinstance(value, dict) or name not in value:
+            return default
+        value = value[name]
+    return value
+
+
+def _copy(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+class TwinCache:
+    """A versioned local copy of the desired and reported properties of the device twin"""
+
+    def __init__(self):
+        self._desired = {}
+        self._reported = {}
+        self.desired_version: Optional[int] = None
+        """The version of the cached desired properties, or None if the twin isn't loaded"""
+        self.reported_version: Optional[int] = None
+        """The version of the cached reported properties, or None if it is not known"""
+        self.stale_patches = 0
+        """The number of desired property patches that were ignored as stale"""
+        self.gaps = 0
+        """The number of times patches were missed and the full twin was needed"""
+
+    @property
+    def is_loaded(self) -> bool:
+        """True once the full twin has been loaded"""
+        return self.desired_version is not None
+
+    def load(self, twin: dict) -> None:
+        """Replaces the cache with a full twin, as returned by a twin GET request
+
+        :param dict twin: The twin, with ``desired`` and ``reported`` properties that each have
+            a ``$version``
+        """
+        desired = _copy(twin.get("desired", {}))
+        reported = _copy(twin.get("reported", {}))
+        self.desired_version = desired.pop("$version", None)
+        self.reported_version = reported.pop("$version", None)
+        self._desired = desired
+        self._reported = reported
+
+    def clear(self) -> None:
+        """Forgets the cached twin, so the next patch reports a gap"""
+        self._desired = {}
+        self._reported = {}
+        self.desired_version = None
+        self.reported_version = None
+
+    def apply_desired_patch(self, patch: dict, version: int) -> int:
+        """Applies a desired property patch if it is the next version
+
+        :param dict patch: The patch, without the ``$version``
+        :param int version: The version of the desired properties after the patch
+        :returns: `PATCH_APPLIED`, `PATCH_STALE` if the cache already has this version, or
+            `PATCH_GAP` if patches were missed and the full twin should be loaded
+        :rtype: int
+        """
+        if self.desired_version is None:
+            self.gaps += 1
+            return PATCH_GAP
+        if version <= self.desired_version:
+            self.stale_patches += 1
+            return PATCH_STALE
+        if version != self.desired_version + 1:
+            self.gaps += 1
+            return PATCH_GAP
+
+        merge_patch(self._desired, patch)
+        self.desired_version = version
+        return PATCH_APPLIED
+
+    def apply_reported_patch(self, patch: dict, version: Optional[int] = None) -> None:
+        """Applies a patch sent for the reported properties
+
+        :param dict patch: The patch
+        :param int version: The version of the reported properties after the patch, if the hub
+            has acknowledged it
+        """
+        merge_patch(self._reported, patch)
+        if version is not None:
+            self.reported_version = version
+
+    def get_twin(self) -> dict:
+        """Gets a copy of the cached twin
+
+        :returns: The twin, with ``desired`` and ``reported`` properties that each have a
+            ``$version``
+        :rtype: dict
+        """
+        desired = _copy(self._desired)
+        desired["$version"] = self.desired_version
+        reported = _copy(self._reported)
+        reported["$version"] = self.reported_version
+        return {"desired": desired, "reported": reported}
+
+    def get_desired(self, path: str = None, default: Any = None) -> Any:
+        """Gets a desired property from the cache
+
+        :param str path: The path of the property, with the names separated by dots such as
+            ``"config.sampling.rate"``, or None for all the desired properties
+        :param default: The value to return if the property is not set
+        :returns: The value of the property. Objects are returned without copying them, so don't
+            change them
+        """
+        if path is None:
+            return self._desired
+        return _lookup(self._desired, path, default)
+
+    def get_reported(self, path: str = None, default: Any = None) -> Any:
+        """Gets a reported property from the cache
+
+        :param str path: The path of the property, with the names separated by dots, or None for
+            all the reported properties
+        :param default: The value to return if the property is not set
+        :returns: The value of the property. Objects are returned without copying them, so don't
+            change them
+        """
+        if path is None:
+            return self._reported
+        return _lookup(self._reported, path, default)
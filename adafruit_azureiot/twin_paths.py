@@ -0,0 +1,121 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`twin_paths`
+=====================
+
+An index of callbacks for paths in the device twin, such as ``"config.sampling.rate"``. When a
+patch arrives only the subscribers whose paths are in the patch are called, so a large
+configuration push doesn't call every callback.
+
+Patches follow JSON merge patch rules: a path that is set to null, or that is under a path that
+is replaced by a value that is not an object, is reported with a value of None.
+
+* Author(s): Adafruit Industries
+"""
+
+try:
+    from typing import Callable, Dict, List
+except ImportError:
+    pass
+
+
+class _PathNode:
+    """A segment of a path, with the callbacks for the path that ends here"""
+
+    def __init__(self):
+        self.children: Dict[str, _PathNode] = {}
+        self.callbacks: List[Callable] = []
+
+
+class TwinPathIndex:
+    """Callbacks for paths in the device twin, called when a patch changes their path"""
+
+    def __init__(self):
+        self._root = _PathNode()
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def subscribe(self, path: str, callback: Callable) -> None:
+        """Calls a callback when a patch changes a path. The callback should have the signature
+        ``callback(path: str, value, version: int)``. For paths that are objects the value is the
+        part of the patch under the path, not the whole object
+
+        :param str path: The path, with the names separated by dots, such as
+            ``"config.sampling.rate"``
+        :param callback: The callback
+        """
+        node = self._root
+        for name in path.split("."):
+            child = node.children.get(name)
+            if child is None:
+                child = _PathNode()
+                node.children[name] = child
+            node = child
+        node.callbacks.append(callback)
+        self._count += 1
+
+    def unsubscribe(self, path: str, callback: Callable = None) -> None:
+        """Stops calling a callback for a path
+
+        :param str path: The path
+        :param callback: The callback to remove, or None to remove all the callbacks for the path
+        """
+        node = self._root
+        for name in path.split("."):
+            node = node.children.get(name)
+            if node is None:
+                return
+
+        if callback is None:
+            self._count -= len(node.callbacks)
+            node.callbacks = []
+        elif callback in node.callbacks:
+            node.callbacks.remove(callback)
+            self._count -= 1
+
+    def dispatch(self, patch: dict, version: int) -> int:
+        """Calls the callbacks for the paths changed by a patch
+
+        :param dict patch: The patch, without the ``$version``
+        :param int version: The version of the patch
+        :returns: The number of callbacks called
+        :rtype: int
+        """
+        if self._count == 0:
+            return 0
+        return self._dispatch(self._root, patch, "", version)
+
+    def _dispatch(self, node: _PathNode, patch: dict, prefix: str, version: int) -> int:
+        called = 0
+        # Walk the subscribed names rather than the patch, as there are usually fewer
+        for name, child in node.children.items():
+            if name not in patch:
+                continue
+
+            path = prefix + name
+            value = patch[name]
+            for callback in child.callbacks:
+                callback(path, value, version)
+            called += len(child.callbacks)
+
+            if child.children:
+                if isinstance(value, dict):
+                    called += self._dispatch(child, value, path + ".", version)
+                else:
+                    # The object was removed or replaced, so everything under it is gone
+                    called += self._removed(child, path + ".", version)
+        return called
+
+    def _removed(self, node: _PathNode, prefix: str, version: int) -> int:
+        called = 0
+        for name, child in node.children.items():
+            path = prefix + name
+            for callback in child.callbacks:
+                callback(path, None, version)
+            called += len(child.callbacks) + self._removed(child, path + ".", version)
+        return called
@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`x509`
+=====================
+
+X.509 client certificate authentication. The certificate and its private key are loaded into
+the SSL context, so the TLS handshake proves the identity of the device and no SAS token is
+signed. Signing a token runs HMAC-SHA256 in Python, which is slow on a microcontroller, so this
+also makes connecting faster.
+
+For IoT Hub the certificate is registered with the device, for DPS its common name must be the
+registration ID. Boards that do TLS on a network co-processor, such as an ESP32 with ESP32SPI,
+have the certificate set on the co-processor instead, and pass ``x509=true`` in the connection
+string or no device key.
+
+* Author(s): Adafruit Industries
+"""
+
+from .iot_error import IoTError
+
+
+def load_client_certificate(ssl_context, certificate: str, key: str = None) -> None:
+    """Loads a client certificate and its private key into an SSL context
+
+    :param ssl_context: The SSL context to connect with
+    :param str certificate: The path of the PEM file with the certificate, and the private key
+        if it is in the same file
+    :param str key: The path of the PEM file with the private key
+    :raises IoTError: if the SSL context can't load certificates
+    """
+    load_cert_chain = getattr(ssl_context, "load_cert_chain", None)
+    if load_cert_chain is None:
+        raise IoTError(
+            "This SSL context can't load a client certificate, set it on the network "
+            + "co-processor instead"
+        )
+    load_cert_chain(certificate, key)
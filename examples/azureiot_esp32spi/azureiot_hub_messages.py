@@ -101,8 +101,8 @@ device = IoTHubDevice(pool, ssl_context, device_connection_string)
 # Subscribe to cloud to device messages
 # To send a message to the device, select it in the Azure Portal, select Message To Device,
 # fill in the message and any properties you want to add, then select Send Message
-def cloud_to_device_message_received(body: str, properties: dict):
-    print("Received message with body", body, "and properties", json.dumps(properties))
+def cloud_to_device_message_received(body: str, properties):
+    print("Received message with body", body, "and properties", json.dumps(properties.as_dict()))
 
 
 # Subscribe to the cloud to device message received events
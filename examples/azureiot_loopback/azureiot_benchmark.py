@@ -0,0 +1,211 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+# SPDX-License-Identifier: MIT
+
+# This example runs on a computer with CPython rather than on a microcontroller.
+# It benchmarks IoTHubDevice and IoTCentralDevice end to end against the in-process loopback
+# broker, which emulates the Azure topics, so the numbers are the time spent in the library:
+#
+# - device to cloud messages per second
+# - direct method round trip latency, from invoking the method to receiving the response
+# - twin patch latency, from updating a reported property to the hub acknowledging it
+# - reconnect time
+#
+# Latencies are reported as p50, p95 and p99 in milliseconds. The library calls gc.collect after
+# each send to keep the heap small on microcontrollers, and on CPython that is most of the time.
+#
+# Save the results with --save, and pass them to a later run with --baseline to fail when the
+# throughput or a p50 latency is more than --tolerance worse. The tail latencies vary too much
+# between runs to compare:
+#
+#   python azureiot_benchmark.py --save baseline.json
+#   python azureiot_benchmark.py --baseline baseline.json
+
+import argparse
+import json
+import sys
+import time
+
+import adafruit_logging as logging
+
+from adafruit_azureiot import IoTCentralDevice, IoTHubDevice
+from adafruit_azureiot.iot_mqtt import IoTResponse
+from adafruit_azureiot.loopback import LoopbackBroker
+
+DEVICE_ID = "benchmark-device"
+DEVICE_KEY = "bG9vcGJhY2stZGV2aWNlLWtleQ=="
+
+parser = argparse.ArgumentParser(description="Benchmark the Azure IoT clients offline")
+parser.add_argument("--messages", type=int, default=500, help="messages for the throughput run")
+parser.add_argument("--iterations", type=int, default=200, help="samples for each latency")
+parser.add_argument("--save", help="write the results to this JSON file")
+parser.add_argument("--baseline", help="compare the results with this JSON file")
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=1.25,
+    help="how many times worse than the baseline a result can be, defaults to 1.25",
+)
+args = parser.parse_args()
+
+logger = logging.getLogger("benchmark")
+logger.setLevel(logging.WARNING)
+
+
+def percentile(samples, fraction):
+    """The nearest rank percentile of sorted samples"""
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def latency(samples):
+    samples = sorted(seconds * 1000 for seconds in samples)
+    return {
+        "p50": round(percentile(samples, 0.50), 4),
+        "p95": round(percentile(samples, 0.95), 4),
+        "p99": round(percentile(samples, 0.99), 4),
+    }
+
+
+def wait_for(device, done):
+    while not done():
+        device.loop()
+
+
+def measure_throughput(send):
+    started_at = time.perf_counter()
+    for index in range(args.messages):
+        send(index)
+    return round(args.messages / (time.perf_counter() - started_at), 1)
+
+
+def measure_method_round_trip(broker, device):
+    samples = []
+    for _ in range(args.iterations):
+        started_at = time.perf_counter()
+        request_id = broker.invoke_direct_method(DEVICE_ID, "ping", '{"value": 1}')
+        wait_for(device, lambda: request_id in broker.method_responses)
+        samples.append(time.perf_counter() - started_at)
+    broker.method_responses.clear()
+    return latency(samples)
+
+
+def measure_twin_patch(device, update):
+    samples = []
+    for index in range(args.iterations):
+        version = device.reported_version
+        started_at = time.perf_counter()
+        update(index)
+        wait_for(device, lambda: device.reported_version != version)
+        samples.append(time.perf_counter() - started_at)
+    return latency(samples)
+
+
+def measure_reconnect(device):
+    samples = []
+    for _ in range(args.iterations):
+        started_at = time.perf_counter()
+        device.reconnect()
+        wait_for(device, device.is_connected)
+        samples.append(time.perf_counter() - started_at)
+    return latency(samples)
+
+
+def benchmark_hub():
+    broker = LoopbackBroker()
+    broker.record_telemetry = False
+    device = IoTHubDevice(
+        None,
+        None,
+        f"HostName=loopback.azure-devices.net;DeviceId={DEVICE_ID};SharedAccessKey={DEVICE_KEY}",
+        logger=logger,
+        transport=broker.transport,
+    )
+    device.methods.register("ping", lambda value: IoTResponse(200, "OK"), keyword_arguments=True)
+    device.connect()
+
+    results = {
+        "d2c_messages_per_second": measure_throughput(
+            lambda index: device.send_device_to_cloud_message({"index": index})
+        ),
+        "method_round_trip_ms": measure_method_round_trip(broker, device),
+        "twin_patch_ms": measure_twin_patch(
+            device, lambda index: device.update_twin({"index": index})
+        ),
+        "reconnect_ms": measure_reconnect(device),
+    }
+    device.disconnect()
+    return results
+
+
+def benchmark_central():
+    broker = LoopbackBroker()
+    broker.record_telemetry = False
+    device = IoTCentralDevice(
+        None, None, "0ne00000000", DEVICE_ID, DEVICE_KEY, logger=logger, transport=broker.transport
+    )
+    device.commands.register("ping", lambda value: IoTResponse(200, "OK"), keyword_arguments=True)
+    device.connect()
+
+    results = {
+        "d2c_messages_per_second": measure_throughput(
+            lambda index: device.send_telemetry({"index": index})
+        ),
+        "method_round_trip_ms": measure_method_round_trip(broker, device),
+        "twin_patch_ms": measure_twin_patch(
+            device, lambda index: device.send_property("index", index)
+        ),
+        "reconnect_ms": measure_reconnect(device),
+    }
+    device.disconnect()
+    return results
+
+
+def regressions(results, baseline):
+    """Lists the results that are more than the tolerance worse than the baseline"""
+    found = []
+    for client, metrics in baseline.items():
+        for name, expected in metrics.items():
+            actual = results.get(client, {}).get(name)
+            if actual is None:
+                continue
+            if isinstance(expected, dict):
+                if actual["p50"] > expected["p50"] * args.tolerance:
+                    found.append(
+                        f"{client} {name} p50: {actual['p50']}ms, baseline {expected['p50']}ms"
+                    )
+            elif actual < expected / args.tolerance:
+                # Throughput is better when it is higher
+                found.append(f"{client} {name}: {actual}, baseline {expected}")
+    return found
+
+
+results = {"IoTHubDevice": benchmark_hub(), "IoTCentralDevice": benchmark_central()}
+
+for client, metrics in results.items():
+    print(client)
+    print(f"  Device to cloud messages: {metrics['d2c_messages_per_second']} per second")
+    for name, title in (
+        ("method_round_trip_ms", "Direct method round trip"),
+        ("twin_patch_ms", "Twin patch"),
+        ("reconnect_ms", "Reconnect"),
+    ):
+        quantiles = metrics[name]
+        print(
+            f"  {title}: p50 {quantiles['p50']}ms, p95 {quantiles['p95']}ms, "
+            + f"p99 {quantiles['p99']}ms"
+        )
+
+if args.save:
+    with open(args.save, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print("Results saved to", args.save)
+
+if args.baseline:
+    with open(args.baseline, encoding="utf-8") as file:
+        slower = regressions(results, json.load(file))
+    if slower:
+        print("Slower than the baseline:")
+        for regression in slower:
+            print("  " + regression)
+        sys.exit(1)
+    print("No regressions against", args.baseline)
@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+# SPDX-License-Identifier: MIT
+
+# This example runs on a computer with CPython rather than on a microcontroller.
+# It registers a batch of devices from a group enrollment with the Device Provisioning Service,
+# many at a time, writing the result for each device to a file. Run it again with the same file
+# and only the devices that are not assigned yet are registered.
+#
+# It runs against the in-process loopback broker, which stands in for DPS. To provision real
+# devices, pass a socket pool and SSL context, and leave out the transport.
+
+import os
+import tempfile
+
+import adafruit_logging as logging
+
+from adafruit_azureiot.bulk_provisioning import BulkProvisioner, derive_device_key, load_results
+from adafruit_azureiot.loopback import LoopbackBroker
+
+ID_SCOPE = "0ne00000000"
+GROUP_KEY = "bG9vcGJhY2stZ3JvdXAta2V5"
+DEVICE_COUNT = 500
+CONCURRENCY = 100
+
+results_path = os.path.join(tempfile.gettempdir(), "azureiot_bulk_provisioning.jsonl")
+if os.path.exists(results_path):
+    os.remove(results_path)
+
+logger = logging.getLogger("bulk")
+logger.setLevel(logging.WARNING)
+
+# DPS asks each device to check back for its assignment after a second
+broker = LoopbackBroker(retry_after=1)
+
+devices = [
+    (f"device-{index:05}", derive_device_key(GROUP_KEY, f"device-{index:05}"))
+    for index in range(DEVICE_COUNT)
+]
+
+# Register the first half, as though the run was interrupted
+first_run = BulkProvisioner(
+    None,
+    None,
+    ID_SCOPE,
+    devices[: DEVICE_COUNT // 2],
+    results_path,
+    concurrency=CONCURRENCY,
+    logger=logger,
+    transport=broker.transport,
+)
+print("First run:", first_run.run())
+
+# Run again with every device, which skips the devices already assigned
+second_run = BulkProvisioner(
+    None,
+    None,
+    ID_SCOPE,
+    devices,
+    results_path,
+    concurrency=CONCURRENCY,
+    logger=logger,
+    transport=broker.transport,
+)
+print("Second run:", second_run.run())
+
+results = load_results(results_path)
+assigned = [result for result in results.values() if result["status"] == "assigned"]
+seconds = sorted(result["seconds"] for result in assigned)
+print(f"{len(assigned)} of {DEVICE_COUNT} devices assigned, results in {results_path}")
+print(f"Registration time: median {seconds[len(seconds) // 2]}s, slowest {seconds[-1]}s")
+print("Sequential registration would have taken at least", DEVICE_COUNT, "seconds")
@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+# SPDX-License-Identifier: MIT
+
+# This example runs on a computer with CPython rather than on a microcontroller.
+# It drives an IoT Hub device against the in-process loopback broker, which emulates the
+# Azure IoT Hub topics, so no network or Azure subscription is needed.
+
+from adafruit_azureiot import IoTHubDevice
+from adafruit_azureiot.iot_mqtt import IoTResponse
+from adafruit_azureiot.loopback import LoopbackBroker
+
+# The loopback broker plays the part of the hub. The key only needs to be valid base64
+broker = LoopbackBroker()
+device_connection_string = (
+    "HostName=loopback.azure-devices.net;DeviceId=loopback-device;SharedAccessKey=bG9vcGJhY2s="
+)
+
+# Create an IoT Hub device client that uses the loopback broker instead of a network connection
+device = IoTHubDevice(None, None, device_connection_string, transport=broker.transport)
+
+
+def reboot(delay: int = 0) -> IoTResponse:
+    print("Rebooting in", delay, "seconds")
+    return IoTResponse(200, "OK")
+
+
+# Methods without a registered handler go to this callback
+def direct_method_invoked(method_name: str, payload) -> IoTResponse:
+    print("Received direct method", method_name, "with data", str(payload))
+    return IoTResponse(404, "Unknown method")
+
+
+def cloud_to_device_message_received(body: str, properties):
+    print("Received message with body", body, "and properties", properties)
+
+
+def device_twin_desired_updated(desired_property_name: str, desired_property_value, version: int):
+    print("Property", desired_property_name, "updated to", desired_property_value, "v", version)
+
+
+# The JSON payload of the reboot method is passed as keyword arguments
+device.methods.register("reboot", reboot, keyword_arguments=True)
+device.on_direct_method_invoked = direct_method_invoked
+device.on_cloud_to_device_message_received = cloud_to_device_message_received
+device.on_device_twin_desired_updated = device_twin_desired_updated
+
+device.connect()
+
+# Act as the cloud: invoke a method, send a message and update the desired properties
+request_id = broker.invoke_direct_method("loopback-device", "reboot", '{"delay": 5}')
+broker.send_cloud_to_device_message("loopback-device", "Hello", {"priority": "high"})
+broker.update_desired_properties("loopback-device", {"interval": 30})
+
+# Process the messages from the cloud
+device.loop()
+
+print("Method response:", broker.method_responses[request_id])
+
+# Send telemetry and reported properties, then see what the hub received
+device.send_device_to_cloud_message({"Temperature": 21})
+device.update_twin({"interval": 30})
+
+print("Telemetry received by the hub:", broker.telemetry)
+print("Device twin:", broker.get_twin("loopback-device"))
+
+device.disconnect()
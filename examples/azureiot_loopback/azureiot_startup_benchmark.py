@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+# SPDX-License-Identifier: MIT
+
+# This example runs on a computer with CPython rather than on a microcontroller.
+# It compares how long a device takes to start up and connect when it authenticates with a SAS
+# token, which is signed with HMAC-SHA256 in Python, against authenticating with an X.509
+# certificate, which needs no signing. Both IoT Hub and IoT Central, which registers with the
+# Device Provisioning Service first, are measured.
+#
+# It runs against the in-process loopback broker, so there is no TLS handshake and the time is
+# the work the library does. On a microcontroller signing is much slower than on a computer, so
+# the difference is larger.
+
+import time
+
+import adafruit_logging as logging
+
+from adafruit_azureiot import IoTCentralDevice, IoTHubDevice
+from adafruit_azureiot.loopback import LoopbackBroker
+
+ITERATIONS = 50
+DEVICE_KEY = "bG9vcGJhY2stZGV2aWNlLWtleQ=="
+HUB_SAS = f"HostName=loopback.azure-devices.net;DeviceId=benchmark;SharedAccessKey={DEVICE_KEY}"
+HUB_X509 = "HostName=loopback.azure-devices.net;DeviceId=benchmark;x509=true"
+
+logger = logging.getLogger("benchmark")
+logger.setLevel(logging.WARNING)
+broker = LoopbackBroker()
+
+
+def connect_hub(connection_string):
+    device = IoTHubDevice(None, None, connection_string, logger=logger, transport=broker.transport)
+    device.connect()
+    device.disconnect()
+
+
+def connect_central(device_key):
+    device = IoTCentralDevice(
+        None,
+        None,
+        "0ne00000000",
+        "benchmark",
+        device_key,
+        logger=logger,
+        transport=broker.transport,
+    )
+    device.connect()
+    device.disconnect()
+
+
+def benchmark(name, connect, *args):
+    times = []
+    for _ in range(ITERATIONS):
+        started_at = time.monotonic()
+        connect(*args)
+        times.append(time.monotonic() - started_at)
+    times.sort()
+    median = times[len(times) // 2] * 1000
+    print(f"{name}: median {median:.2f}ms, slowest {times[-1] * 1000:.2f}ms")
+    return median
+
+
+hub_sas = benchmark("IoT Hub with a SAS token", connect_hub, HUB_SAS)
+hub_x509 = benchmark("IoT Hub with X.509", connect_hub, HUB_X509)
+print(f"X.509 connects {hub_sas / hub_x509:.1f}x faster to IoT Hub")
+
+central_sas = benchmark("IoT Central with SAS tokens", connect_central, DEVICE_KEY)
+central_x509 = benchmark("IoT Central with X.509", connect_central, None)
+print(f"X.509 connects {central_sas / central_x509:.1f}x faster to IoT Central")
@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+# SPDX-License-Identifier: MIT
+
+# This example runs on a computer with CPython rather than on a microcontroller.
+# It compares routing a mix of inbound Azure IoT topics with the precompiled topic router against
+# matching them with MiniMQTT's wildcard topic callbacks and then scanning each topic for values.
+
+import time
+
+from adafruit_minimqtt.matcher import MQTTMatcher
+
+from adafruit_azureiot.topic_router import TopicRouter
+
+DEVICE_ID = "benchmark-device"
+ITERATIONS = 20000
+
+# A mix of the topics a device receives: direct methods, twin responses, desired property
+# patches and cloud to device messages with a property bag
+TOPICS = [
+    "$iothub/methods/POST/reboot/?$rid=1",
+    "$iothub/methods/POST/setTelemetryInterval/?$rid=42",
+    "$iothub/twin/res/200/?$rid=7&$version=12",
+    "$iothub/twin/res/204/?$rid=8&$version=13",
+    "$iothub/twin/PATCH/properties/desired/?$version=14",
+    f"devices/{DEVICE_ID}/messages/devicebound/%24.mid=1&%24.to=%2Fdevices&priority=high",
+    f"devices/{DEVICE_ID}/messages/devicebound/%24.mid=2&%24.to=%2Fdevices",
+]
+
+
+def scan_direct_method(topic):
+    index = topic.find("$rid=")
+    method_id = topic[index + 5 :]
+    topic_template = "$iothub/methods/POST/"
+    len_temp = len(topic_template)
+    method_name = topic[len_temp : topic.find("/", len_temp + 1)]
+    return method_name, method_id
+
+
+def scan_twin(topic):
+    return topic.startswith("$iothub/twin/res/")
+
+
+def scan_cloud_to_device_message(topic):
+    properties = {}
+    for part in topic.split("&")[1:]:
+        key_value = part.split("=")
+        properties[key_value[0]] = key_value[1]
+    return properties
+
+
+matcher = MQTTMatcher()
+matcher[f"devices/{DEVICE_ID}/messages/devicebound/#"] = scan_cloud_to_device_message
+matcher["$iothub/methods/#"] = scan_direct_method
+matcher["$iothub/twin/PATCH/properties/desired/#"] = scan_twin
+matcher["$iothub/twin/res/#"] = scan_twin
+
+
+def route_with_matcher(topic):
+    for callback in matcher.iter_match(topic):
+        callback(topic)
+
+
+router = TopicRouter(DEVICE_ID)
+
+
+def benchmark(name, route):
+    started_at = time.monotonic()
+    for _ in range(ITERATIONS):
+        for topic in TOPICS:
+            route(topic)
+    elapsed = time.monotonic() - started_at
+    per_topic = elapsed / (ITERATIONS * len(TOPICS)) * 1000000
+    print(f"{name}: {elapsed:.3f}s, {per_topic:.2f}us per topic")
+    return elapsed
+
+
+matcher_time = benchmark("Wildcard matcher and string scans", route_with_matcher)
+router_time = benchmark("Precompiled topic router", router.route)
+print(f"Speedup: {matcher_time / router_time:.1f}x")
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import time
+
+import adafruit_logging as logging
+
+from adafruit_azureiot.bulk_provisioning import BulkProvisioner, load_results
+from adafruit_azureiot.loopback import LoopbackBroker, LoopbackMQTT
+
+LOOP_TIMEOUT = 0.2
+
+
+class BlockingLoopbackMQTT(LoopbackMQTT):
+    """Blocks in loop for the whole timeout, as MiniMQTT does"""
+
+    def loop(self, timeout: float = 0):
+        time.sleep(timeout)
+        return super().loop(timeout)
+
+
+class DroppingLoopbackMQTT(LoopbackMQTT):
+    """Loses the connection while waiting for the registration response"""
+
+    def loop(self, timeout: float = 0):
+        raise OSError("Connection reset")
+
+
+def test_registrations_run_concurrently(tmp_path):
+    broker = LoopbackBroker(retry_after=0)
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    devices = [(f"device-{index}", "bG9vcGJhY2stZGV2aWNlLWtleQ==") for index in range(20)]
+    results_path = str(tmp_path / "results.jsonl")
+
+    summary = BulkProvisioner(
+        None,
+        None,
+        "0ne00000000",
+        devices,
+        results_path,
+        concurrency=len(devices),
+        logger=logger,
+        transport=lambda **kwargs: BlockingLoopbackMQTT(broker, **kwargs),
+        loop_timeout=LOOP_TIMEOUT,
+    ).run()
+
+    assert summary["assigned"] == len(devices)
+    assert summary["failed"] == 0
+    # Each device blocks in two reads, for the registration and the status poll, so registering
+    # them one after another would take 8 seconds
+    assert summary["seconds"] < len(devices) * 2 * LOOP_TIMEOUT / 4
+    results = load_results(results_path)
+    assert sorted(results) == sorted(device_id for device_id, _ in devices)
+    assert all(result["hub"] == broker.hostname for result in results.values())
+
+
+def test_dropped_registrations_are_disconnected(tmp_path):
+    broker = LoopbackBroker()
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    devices = [(f"device-{index}", "bG9vcGJhY2stZGV2aWNlLWtleQ==") for index in range(5)]
+    clients = []
+
+    def transport(**kwargs):
+        clients.append(DroppingLoopbackMQTT(broker, **kwargs))
+        return clients[-1]
+
+    summary = BulkProvisioner(
+        None,
+        None,
+        "0ne00000000",
+        devices,
+        str(tmp_path / "results.jsonl"),
+        logger=logger,
+        transport=transport,
+    ).run()
+
+    assert summary["failed"] == len(devices)
+    assert len(clients) == len(devices)
+    assert not any(client.is_connected() for client in clients)
@@ -0,0 +1,103 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import adafruit_logging as logging
+import pytest
+
+from adafruit_azureiot import IoTHubDevice
+from adafruit_azureiot.c2d_properties import C2DProperties
+from adafruit_azureiot.loopback import LoopbackBroker
+from adafruit_azureiot.quote import quote, unquote
+
+
+@pytest.mark.parametrize(
+    ("encoded", "decoded"),
+    [
+        ("plain", "plain"),
+        ("%41%62", "Ab"),
+        ("a%2Fb%2fc", "a/b/c"),
+        ("%E2%82%AC5", "€5"),
+        ("100%", "100%"),
+        ("%zz%4", "%zz%4"),
+        ("a+b", "a+b"),
+    ],
+)
+def test_unquote(encoded, decoded):
+    assert unquote(encoded) == decoded
+
+
+def test_unquote_reverses_quote():
+    value = "temp=21.5&unit=°C/room 1"
+
+    assert unquote(quote(value.encode("utf-8"), "")) == value
+
+
+def test_properties_are_decoded():
+    properties = C2DProperties(
+        "%24.mid=42&%24.ct=application%2Fjson&iothub-ack=full&room=kitchen%201&flag&expr=a%3Db=c"
+    )
+
+    assert properties.message_id == "42"
+    assert properties.content_type == "application/json"
+    assert properties.ack == "full"
+    assert properties["room"] == "kitchen 1"
+    # Only the first = separates the name from the value
+    assert properties["expr"] == "a=b=c"
+    assert properties.application_properties == {
+        "room": "kitchen 1",
+        "flag": "",
+        "expr": "a=b=c",
+    }
+    assert len(properties) == 6
+
+
+def test_missing_properties_have_defaults():
+    properties = C2DProperties("")
+
+    assert properties.message_id is None
+    assert properties.correlation_id is None
+    assert properties.ack == "none"
+    assert properties.get("room", "hall") == "hall"
+    assert "room" not in properties
+    assert properties.as_dict() == {}
+
+
+def test_properties_are_parsed_once():
+    properties = C2DProperties("a=1")
+
+    assert properties.raw == "a=1"
+    assert properties._properties is None
+    assert properties["a"] == "1"
+    parsed = properties._properties
+    assert properties.get("a") == "1"
+    assert properties._properties is parsed
+
+
+def test_device_receives_decoded_properties():
+    broker = LoopbackBroker()
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    device = IoTHubDevice(
+        None,
+        None,
+        "HostName=loopback.azure-devices.net;DeviceId=device;SharedAccessKey=bG9vcGJhY2s=",
+        logger=logger,
+        transport=broker.transport,
+    )
+    received = []
+    device.on_cloud_to_device_message_received = lambda body, properties: received.append(
+        (body, properties)
+    )
+    device.connect()
+
+    message_id = broker.send_cloud_to_device_message(
+        "device", "hello", {"room": "kitchen 1", "path": "a/b&c=d"}
+    )
+    device.loop()
+
+    body, properties = received[0]
+    assert body == "hello"
+    assert properties.message_id == message_id
+    assert properties.to == "/devices/device/messages/devicebound"
+    assert properties.application_properties == {"room": "kitchen 1", "path": "a/b&c=d"}
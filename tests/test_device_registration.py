@@ -0,0 +1,77 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import time
+
+import adafruit_logging as logging
+
+from adafruit_azureiot.device_registration import (
+    DEFAULT_RETRY_AFTER,
+    STATE_ASSIGNED,
+    STATE_WAITING,
+    DeviceRegistration,
+)
+from adafruit_azureiot.loopback import LoopbackBroker, LoopbackMQTT
+
+DEVICE_KEY = "bG9vcGJhY2stZGV2aWNlLWtleQ=="
+
+
+class BlockingLoopbackMQTT(LoopbackMQTT):
+    """Blocks in loop for the whole timeout, as MiniMQTT does"""
+
+    def __init__(self, loopback_broker, socket_timeout=1, **kwargs):
+        super().__init__(loopback_broker, **kwargs)
+        self.socket_timeout = socket_timeout
+
+    def loop(self, timeout: float = 0):
+        assert timeout >= self.socket_timeout
+        time.sleep(timeout)
+        return super().loop(timeout)
+
+
+def _logger():
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    return logger
+
+
+def _registration(broker, device_id, **kwargs):
+    return DeviceRegistration(
+        None,
+        None,
+        "0ne00000000",
+        device_id,
+        DEVICE_KEY,
+        _logger(),
+        transport=lambda **transport_kwargs: BlockingLoopbackMQTT(broker, **transport_kwargs),
+        **kwargs,
+    )
+
+
+def test_many_registrations_step_from_one_thread():
+    broker = LoopbackBroker(retry_after=0)
+    registrations = [_registration(broker, f"device-{index}", timeout=10) for index in range(100)]
+    expiry = int(time.time() + 3600)
+    for registration in registrations:
+        registration.start(expiry)
+
+    while not all(registration.done for registration in registrations):
+        for registration in registrations:
+            registration.step()
+
+    # With a loop timeout of a second a round of steps would take 100 seconds, and every
+    # registration would fail on its deadline
+    assert all(registration.state == STATE_ASSIGNED for registration in registrations)
+    assert all(registration.hostname == broker.hostname for registration in registrations)
+
+
+def test_response_without_properties_waits_for_default_retry():
+    registration = _registration(LoopbackBroker(), "device")
+    registration.start(int(time.time() + 3600))
+
+    started_at = time.monotonic()
+    registration._handle_dps_update(None, "$dps/registrations/res/202/", '{"operationId": "1"}')
+
+    assert registration.state == STATE_WAITING
+    assert registration.next_step_at >= started_at + DEFAULT_RETRY_AFTER
@@ -0,0 +1,92 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import adafruit_logging as logging
+import pytest
+from adafruit_minimqtt.adafruit_minimqtt import (
+    CONNACK_ERROR_ID_REJECTED,
+    CONNACK_ERROR_SERVER_UNAVAILABLE,
+    CONNACK_ERROR_UNAUTHORIZED,
+    MMQTTException,
+)
+
+from adafruit_azureiot import IoTHubDevice
+from adafruit_azureiot.loopback import LoopbackBroker
+
+CONNECTION_STRING = (
+    "HostName=hub.azure-devices.net;DeviceId=dev1;SharedAccessKey=bG9vcGJhY2s=;"
+    + "GatewayHostName=edge.local"
+)
+
+
+def _device(transport):
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    return IoTHubDevice(
+        None, "ssl", CONNECTION_STRING, transport=transport, logger=logger, enable_stats=True
+    )
+
+
+def _gateway_raising(broker, error):
+    def transport(**kwargs):
+        client = broker.transport(**kwargs)
+        if kwargs["broker"] == "edge.local":
+
+            def connect(*args, **kwargs):
+                raise error
+
+            client.connect = connect
+        return client
+
+    return transport
+
+
+def _failovers(device):
+    return device.stats.as_dict()["counters"].get("gateway_failovers", 0)
+
+
+def test_unreachable_gateway_fails_over():
+    broker = LoopbackBroker()
+    broker.unreachable_hosts.add("edge.local")
+    device = _device(broker.transport)
+
+    device.connect()
+
+    assert not device.connected_via_gateway
+    assert _failovers(device) == 1
+
+
+def test_unauthorized_gateway_is_raised():
+    device = _device(LoopbackBroker(authenticate=lambda username, password: False).transport)
+
+    with pytest.raises(MMQTTException) as raised:
+        device.connect()
+
+    assert raised.value.code == CONNACK_ERROR_UNAUTHORIZED
+    assert _failovers(device) == 0
+
+
+def test_retried_refusal_is_raised():
+    # MiniMQTT retries refusals other than bad credentials, then raises an error caused by them
+    error = MMQTTException("Repeated connect failures")
+    error.__cause__ = MMQTTException("Connection Refused - ID Rejected", CONNACK_ERROR_ID_REJECTED)
+    device = _device(_gateway_raising(LoopbackBroker(), error))
+
+    with pytest.raises(MMQTTException):
+        device.connect()
+
+    assert _failovers(device) == 0
+
+
+def test_unavailable_gateway_fails_over():
+    error = MMQTTException("Repeated connect failures")
+    error.__cause__ = MMQTTException(
+        "Connection Refused - Server unavailable", CONNACK_ERROR_SERVER_UNAVAILABLE
+    )
+    device = _device(_gateway_raising(LoopbackBroker(), error))
+
+    device.connect()
+
+    assert not device.connected_via_gateway
+    assert _failovers(device) == 1
@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import adafruit_logging as logging
+import pytest
+
+from adafruit_azureiot import IoTHubDevice
+from adafruit_azureiot.inbound_queue import BLOCK, DROP_NEWEST, DROP_OLDEST, InboundQueue
+from adafruit_azureiot.loopback import LoopbackBroker
+
+
+def _drain(queue):
+    return [queue.get() for _ in range(len(queue))]
+
+
+def test_messages_come_out_in_order_across_the_wrap():
+    queue = InboundQueue(max_size=3)
+    for item in (1, 2, 3):
+        queue.put(item)
+    assert queue.get() == 1
+    assert queue.get() == 2
+
+    # These wrap round to the start of the buffer
+    queue.put(4)
+    queue.put(5)
+
+    assert queue.is_full()
+    assert _drain(queue) == [3, 4, 5]
+    assert queue.as_dict() == {"depth": 0, "max_depth": 3, "max_size": 3, "dropped": 0}
+
+
+def test_drop_oldest_keeps_the_newest():
+    queue = InboundQueue(max_size=2, policy=DROP_OLDEST)
+
+    assert all(queue.put(item) for item in (1, 2, 3, 4))
+
+    assert _drain(queue) == [3, 4]
+    assert queue.dropped == 2
+
+
+def test_drop_newest_keeps_the_oldest():
+    queue = InboundQueue(max_size=2, policy=DROP_NEWEST)
+
+    assert [queue.put(item) for item in (1, 2, 3)] == [True, True, False]
+
+    assert _drain(queue) == [1, 2]
+    assert queue.dropped == 1
+
+
+def test_block_leaves_room_to_the_caller():
+    queue = InboundQueue(max_size=1, policy=BLOCK)
+    queue.put(1)
+
+    assert not queue.put(2)
+    assert queue.dropped == 0
+    assert queue.get() == 1
+    assert queue.put(2)
+
+
+def test_empty_and_invalid_queues():
+    with pytest.raises(IndexError):
+        InboundQueue().get()
+    with pytest.raises(ValueError):
+        InboundQueue(max_size=0)
+    with pytest.raises(ValueError):
+        InboundQueue(policy=99)
+
+
+def _receive(policy, count):
+    broker = LoopbackBroker()
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    queue = InboundQueue(max_size=2, policy=policy)
+    device = IoTHubDevice(
+        None,
+        None,
+        "HostName=loopback.azure-devices.net;DeviceId=device;SharedAccessKey=bG9vcGJhY2s=",
+        logger=logger,
+        transport=broker.transport,
+        inbound_queue=queue,
+    )
+    received = []
+    device.on_cloud_to_device_message_received = lambda body, properties: received.append(body)
+    device.connect()
+
+    for index in range(count):
+        broker.send_cloud_to_device_message("device", str(index))
+    device.loop()
+    return received, queue
+
+
+def test_device_drops_the_oldest_messages_when_full():
+    received, queue = _receive(DROP_OLDEST, 5)
+
+    assert received == ["3", "4"]
+    assert queue.dropped == 3
+
+
+def test_device_handles_every_message_when_blocking():
+    received, queue = _receive(BLOCK, 5)
+
+    assert received == ["0", "1", "2", "3", "4"]
+    assert queue.dropped == 0
+    assert len(queue) == 0
@@ -0,0 +1,77 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import json
+
+import adafruit_logging as logging
+
+from adafruit_azureiot import IoTCentralDevice
+from adafruit_azureiot.dtdl_model import DeviceModel
+from adafruit_azureiot.loopback import LoopbackBroker
+from adafruit_azureiot.property_acks import COMPONENT_MARKER
+
+MODEL = [
+    {
+        "@id": "dtmi:example:Device;1",
+        "@type": "Interface",
+        "contents": [
+            {"@type": "Component", "name": "thermostat1", "schema": "dtmi:example:Thermostat;1"}
+        ],
+    },
+    {
+        "@id": "dtmi:example:Thermostat;1",
+        "@type": "Interface",
+        "contents": [
+            {"@type": "Property", "name": "targetTemp", "schema": "double", "writable": True}
+        ],
+    },
+]
+
+
+def _connect(model=None):
+    broker = LoopbackBroker()
+    patches = []
+
+    def transport(**kwargs):
+        client = broker.transport(**kwargs)
+        publish = client.publish
+
+        def recording_publish(topic, msg, retain=False, qos=0):
+            if topic.startswith("$iothub/twin/PATCH/properties/reported/"):
+                patches.append(json.loads(msg))
+            publish(topic, msg, retain, qos)
+
+        client.publish = recording_publish
+        return client
+
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    device = IoTCentralDevice(
+        None, None, "0ne00000000", "device", "a2V5", logger=logger, transport=transport, model=model
+    )
+    device.connect()
+    return device, patches
+
+
+def _send_twice(device):
+    for target in (20, 21):
+        device.send_properties({"targetTemp": target}, "thermostat1")
+        device.loop()
+
+
+def test_repeated_component_updates_keep_marker_with_model():
+    device, patches = _connect(DeviceModel(MODEL))
+    _send_twice(device)
+
+    assert patches == [
+        {"thermostat1": {"targetTemp": 20.0, COMPONENT_MARKER: "c"}},
+        {"thermostat1": {"targetTemp": 21.0, COMPONENT_MARKER: "c"}},
+    ]
+
+
+def test_repeated_component_updates_keep_marker_without_model():
+    device, patches = _connect()
+    _send_twice(device)
+
+    assert [patch["thermostat1"][COMPONENT_MARKER] for patch in patches] == ["c", "c"]
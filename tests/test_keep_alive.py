@@ -0,0 +1,75 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import adafruit_logging as logging
+import pytest
+
+from adafruit_azureiot import IoTHubDevice
+from adafruit_azureiot.keep_alive import KeepAliveController
+from adafruit_azureiot.loopback import LoopbackBroker
+
+CONNECTION_STRING = (
+    "HostName=loopback.azure-devices.net;DeviceId=device;SharedAccessKey=bG9vcGJhY2s="
+)
+
+
+class IdleKeepAliveController(KeepAliveController):
+    """A controller whose link has been idle for longer than any interval, so a lost link
+    lowers the interval"""
+
+    idle_time = 3600
+
+
+def _connect(broker, controller):
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    clients = []
+
+    def transport(**kwargs):
+        clients.append(broker.transport(**kwargs))
+        return clients[-1]
+
+    device = IoTHubDevice(
+        None,
+        None,
+        CONNECTION_STRING,
+        keep_alive=controller,
+        logger=logger,
+        transport=transport,
+    )
+    return device, clients
+
+
+def test_raising_callback_is_not_a_lost_link():
+    broker = LoopbackBroker()
+    controller = IdleKeepAliveController(initial=240)
+    device, _ = _connect(broker, controller)
+
+    def message_received(body, properties):
+        raise ValueError("application bug")
+
+    device.on_cloud_to_device_message_received = message_received
+    device.connect()
+    learned = controller.as_dict()
+
+    broker.send_cloud_to_device_message("device", "hello")
+    with pytest.raises(ValueError):
+        device.loop()
+
+    assert controller.as_dict() == learned
+
+
+def test_transport_failure_is_a_lost_link():
+    controller = IdleKeepAliveController(initial=240)
+    device, clients = _connect(LoopbackBroker(), controller)
+    device.connect()
+
+    def loop(timeout=0):
+        raise OSError("Connection reset")
+
+    clients[-1].loop = loop
+    with pytest.raises(OSError):
+        device.loop()
+
+    assert controller.interval < 240
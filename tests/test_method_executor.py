@@ -0,0 +1,161 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import threading
+import time
+
+import adafruit_logging as logging
+
+from adafruit_azureiot import IoTHubDevice, IoTResponse
+from adafruit_azureiot.loopback import LoopbackBroker
+from adafruit_azureiot.method_executor import MethodExecutor, ThreadPoolMethodExecutor
+
+
+def _countdown(steps):
+    for _ in range(steps):
+        yield
+    return IoTResponse(200, "done")
+
+
+def test_inline_handler_completes_on_poll():
+    executor = MethodExecutor()
+
+    executor.submit("1", lambda: IoTResponse(200, "ok"))
+
+    assert executor.pending == 0
+    [(request_id, response)] = executor.poll()
+    assert request_id == "1"
+    assert response.response_code == 200
+    assert executor.poll() == []
+
+
+def test_raising_handler_is_collected():
+    executor = MethodExecutor()
+
+    executor.submit("1", lambda: 1 / 0)
+
+    [(request_id, error)] = executor.poll()
+    assert request_id == "1"
+    assert isinstance(error, ZeroDivisionError)
+
+
+def test_task_is_stepped_once_per_poll():
+    executor = MethodExecutor()
+    executor.submit("1", lambda: _countdown(2))
+
+    assert executor.pending == 1
+    assert executor.poll() == []
+    assert executor.poll() == []
+    [(request_id, response)] = executor.poll()
+
+    assert request_id == "1"
+    assert response.response_message == "done"
+    assert executor.pending == 0
+
+
+def test_cancelled_task_is_closed():
+    executor = MethodExecutor()
+    closed = []
+
+    def task():
+        try:
+            while True:
+                yield
+        finally:
+            closed.append(True)
+
+    executor.submit("1", task)
+    executor.poll()
+    executor.cancel("1")
+
+    assert closed == [True]
+    assert executor.pending == 0
+    assert executor.poll() == []
+
+
+def test_thread_pool_runs_handlers_off_the_caller():
+    executor = ThreadPoolMethodExecutor(max_workers=2)
+    release = threading.Event()
+    threads = []
+
+    def handler():
+        threads.append(threading.current_thread())
+        release.wait(5)
+        return IoTResponse(200, "ok")
+
+    try:
+        executor.submit("1", handler)
+        assert executor.poll() == []
+        assert executor.pending == 1
+
+        release.set()
+        completed = []
+        deadline = time.monotonic() + 5
+        while not completed and time.monotonic() < deadline:
+            completed = executor.poll()
+    finally:
+        executor.shutdown()
+
+    assert [request_id for request_id, _ in completed] == ["1"]
+    assert threads[0] is not threading.current_thread()
+
+
+def _connect(broker, **kwargs):
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    device = IoTHubDevice(
+        None,
+        None,
+        "HostName=loopback.azure-devices.net;DeviceId=device;SharedAccessKey=bG9vcGJhY2s=",
+        logger=logger,
+        transport=broker.transport,
+        **kwargs,
+    )
+    device.connect()
+    return device
+
+
+def test_device_responds_when_the_task_returns():
+    broker = LoopbackBroker()
+    device = _connect(broker)
+    device.on_direct_method_invoked = lambda method_name, payload: _countdown(3)
+
+    request_id = broker.invoke_direct_method("device", "calibrate")
+    loops = 0
+    while request_id not in broker.method_responses:
+        device.loop()
+        loops += 1
+
+    assert loops > 1
+    assert broker.method_responses[request_id] == (200, '{"Value": "done"}')
+
+
+def test_device_sends_504_when_the_task_times_out():
+    broker = LoopbackBroker()
+    device = _connect(broker, method_timeout=0)
+    device.on_direct_method_invoked = lambda method_name, payload: _countdown(100)
+
+    request_id = broker.invoke_direct_method("device", "calibrate")
+    device.loop()
+
+    assert broker.method_responses[request_id][0] == 504
+    # The task was closed, so it never sends a second response
+    del broker.method_responses[request_id]
+    device.loop()
+    assert broker.method_responses == {}
+
+
+def test_device_sends_500_when_the_handler_raises():
+    broker = LoopbackBroker()
+    device = _connect(broker)
+
+    def handler(method_name, payload):
+        raise RuntimeError("broken")
+
+    device.on_direct_method_invoked = handler
+
+    request_id = broker.invoke_direct_method("device", "calibrate")
+    device.loop()
+
+    assert broker.method_responses[request_id][0] == 500
@@ -0,0 +1,35 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+from adafruit_azureiot.property_acks import COMPONENT_MARKER
+from adafruit_azureiot.reported_writer import ReportedPropertyWriter
+from adafruit_azureiot.twin_cache import minimal_patch
+
+
+def test_minimal_patch_keeps_component_marker():
+    state = {"thermostat1": {COMPONENT_MARKER: "c", "targetTemp": 20}}
+    patch = {"thermostat1": {COMPONENT_MARKER: "c", "targetTemp": 21}}
+
+    assert minimal_patch(state, patch) == patch
+
+
+def test_minimal_patch_drops_unchanged_component():
+    state = {"thermostat1": {COMPONENT_MARKER: "c", "targetTemp": 20}}
+
+    assert minimal_patch(state, {"thermostat1": {COMPONENT_MARKER: "c", "targetTemp": 20}}) == {}
+
+
+def test_repeated_component_writes_keep_marker():
+    sent = []
+    writer = ReportedPropertyWriter(sent.append, debounce=0)
+
+    for target in (20, 21):
+        writer.update({"thermostat1": {COMPONENT_MARKER: "c", "targetTemp": target}})
+        writer.flush()
+        writer.acknowledged(sent[-1])
+
+    assert sent == [
+        {"thermostat1": {COMPONENT_MARKER: "c", "targetTemp": 20}},
+        {"thermostat1": {COMPONENT_MARKER: "c", "targetTemp": 21}},
+    ]
@@ -0,0 +1,103 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import adafruit_logging as logging
+
+from adafruit_azureiot import IoTHubDevice
+from adafruit_azureiot.loopback import LoopbackBroker
+from adafruit_azureiot.request_correlator import RequestCorrelator
+
+
+def test_request_ids_increase():
+    requests = RequestCorrelator()
+
+    ids = [requests.start("twin_get").request_id for _ in range(3)]
+
+    assert ids == ["1", "2", "3"]
+    assert len(requests) == 3
+
+
+def test_response_completes_its_request():
+    requests = RequestCorrelator()
+    first = requests.start("twin_get")
+    second = requests.start("twin_patch")
+    completed = []
+    second.add_done_callback(completed.append)
+
+    assert requests.complete(second.request_id, 204, version=5) is second
+
+    assert completed == [second]
+    assert second.done and second.succeeded
+    assert (second.status, second.version) == (204, 5)
+    assert second.latency >= 0
+    assert not first.done
+    assert requests.get(second.request_id) is None
+    assert requests.get(first.request_id) is first
+
+
+def test_unknown_response_is_ignored():
+    requests = RequestCorrelator()
+    requests.start("twin_get")
+
+    assert requests.complete("99", 200) is None
+    assert requests.complete(None, 200) is None
+    assert len(requests) == 1
+
+
+def test_callback_added_after_completion_is_called():
+    requests = RequestCorrelator()
+    request = requests.start("twin_get")
+    requests.complete(request.request_id, 500, error="Failed with status 500")
+    completed = []
+
+    request.add_done_callback(completed.append)
+
+    assert completed == [request]
+    assert not request.succeeded
+
+
+def test_requests_expire_at_their_deadline():
+    requests = RequestCorrelator(timeout=10)
+    short = requests.start("twin_patch", timeout=1)
+    default = requests.start("twin_get")
+
+    assert requests.expire(short.sent_at + 0.5) == []
+    assert requests.expire(short.sent_at + 1) == [short]
+    assert short.done and short.status is None and short.error is not None
+    assert requests.expire(default.sent_at + 10) == [default]
+    assert len(requests) == 0
+
+
+def test_cancelled_request_does_not_complete():
+    requests = RequestCorrelator()
+    request = requests.start("twin_get")
+
+    requests.cancel(request.request_id)
+
+    assert requests.complete(request.request_id, 200) is None
+    assert not request.done
+
+
+def test_concurrent_twin_requests_complete_separately():
+    broker = LoopbackBroker()
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    device = IoTHubDevice(
+        None,
+        None,
+        "HostName=loopback.azure-devices.net;DeviceId=device;SharedAccessKey=bG9vcGJhY2s=",
+        logger=logger,
+        transport=broker.transport,
+    )
+    device.connect()
+    broker.update_desired_properties("device", {"rate": 5})
+
+    first = device.request_twin()
+    second = device.request_twin()
+    while not (first.done and second.done):
+        device.loop()
+
+    assert first.request_id != second.request_id
+    assert first.succeeded and second.succeeded
+    assert first.result["desired"]["rate"] == second.result["desired"]["rate"] == 5
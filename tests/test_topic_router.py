@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import adafruit_logging as logging
+import pytest
+
+from adafruit_azureiot import IoTHubDevice
+from adafruit_azureiot.loopback import LoopbackBroker
+from adafruit_azureiot.topic_router import (
+    ROUTE_DPS_RESPONSE,
+    ROUTE_TWIN_DESIRED,
+    ROUTE_TWIN_RESPONSE,
+    ROUTE_UNKNOWN,
+    TopicRouter,
+)
+
+
+def test_twin_response_is_routed():
+    route = TopicRouter("device").route("$iothub/twin/res/204/?$rid=7&$version=3")
+
+    assert (route.kind, route.request_id, route.status, route.version) == (
+        ROUTE_TWIN_RESPONSE,
+        "7",
+        204,
+        3,
+    )
+
+
+def test_desired_patch_is_routed():
+    route = TopicRouter("device").route("$iothub/twin/PATCH/properties/desired/?$version=12")
+
+    assert (route.kind, route.version) == (ROUTE_TWIN_DESIRED, 12)
+
+
+def test_dps_response_is_routed():
+    route = TopicRouter("device").route("$dps/registrations/res/202/?$rid=1&retry-after=3")
+
+    assert (route.kind, route.status, route.properties) == (
+        ROUTE_DPS_RESPONSE,
+        202,
+        "$rid=1&retry-after=3",
+    )
+
+
+@pytest.mark.parametrize(
+    "topic",
+    [
+        "$iothub/twin/res/abc/?$rid=1",
+        "$iothub/twin/res/200/?$rid=1&$version=x",
+        "$iothub/twin/PATCH/properties/desired/?$version=",
+        "$dps/registrations/res/ok/?$rid=1",
+    ],
+)
+def test_malformed_numbers_are_unknown(topic):
+    assert TopicRouter("device").route(topic).kind == ROUTE_UNKNOWN
+
+
+def test_malformed_twin_response_is_dropped():
+    broker = LoopbackBroker()
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    clients = []
+
+    def transport(**kwargs):
+        clients.append(broker.transport(**kwargs))
+        return clients[-1]
+
+    device = IoTHubDevice(
+        None,
+        None,
+        "HostName=loopback.azure-devices.net;DeviceId=device;SharedAccessKey=bG9vcGJhY2s=",
+        logger=logger,
+        transport=transport,
+    )
+    # Subscribes to twin responses
+    device.on_device_twin_desired_updated = lambda name, value, version: None
+    device.connect()
+
+    assert clients[-1]._deliver("$iothub/twin/res/abc/?$rid=1", "{}")
+    device.loop()
+    assert device.is_connected()
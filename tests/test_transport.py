@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import socket
+import threading
+
+import pytest
+
+from adafruit_azureiot.transport import minimqtt_transport
+
+
+class LocalBroker:
+    """Accepts MQTT connections on localhost and answers each CONNECT with a CONNACK that has
+    the given session present flag"""
+
+    def __init__(self, session_present: int):
+        self.session_present = session_present
+        self._server = socket.socket()
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def transport(self, **kwargs):
+        kwargs.update(
+            broker="127.0.0.1", port=self.port, is_ssl=False, socket_pool=socket, ssl_context=None
+        )
+        return minimqtt_transport(**kwargs)
+
+    def close(self):
+        self._server.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        try:
+            while True:
+                header = client.recv(1)
+                if not header or header[0] & 0xF0 == 0xE0:
+                    break
+                length, multiplier = 0, 1
+                while True:
+                    byte = client.recv(1)[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                while length:
+                    length -= len(client.recv(length))
+                if header[0] & 0xF0 == 0x10:
+                    client.sendall(bytes([0x20, 2, self.session_present, 0]))
+        except (IndexError, OSError):
+            pass
+        client.close()
+
+
+@pytest.mark.parametrize("session_present", [0, 1])
+def test_session_present_flag_is_reported(session_present):
+    broker = LocalBroker(session_present)
+    client = broker.transport(client_id="device", socket_timeout=0.01)
+    flags = []
+    client.on_connect = lambda client, userdata, connect_flags, rc: flags.append(connect_flags)
+
+    try:
+        result = client.connect(clean_session=False, session_id="device")
+        # Reads use the short socket timeout once connected
+        assert client._sock.gettimeout() == pytest.approx(0.01)
+        client.disconnect()
+    finally:
+        broker.close()
+
+    assert flags[0] & 1 == session_present
+    assert result & 1 == session_present
@@ -0,0 +1,157 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import adafruit_logging as logging
+
+from adafruit_azureiot import IoTHubDevice
+from adafruit_azureiot.loopback import LoopbackBroker
+from adafruit_azureiot.twin_cache import (
+    PATCH_APPLIED,
+    PATCH_GAP,
+    PATCH_STALE,
+    TwinCache,
+    combine_patches,
+    merge_patch,
+    minimal_patch,
+)
+
+
+def test_merge_patch_removes_none_and_merges_objects():
+    target = {"a": 1, "b": {"c": 2, "d": 3}, "e": 4}
+
+    merge_patch(target, {"a": None, "b": {"c": None, "f": 5}, "e": {"g": 6}})
+
+    assert target == {"b": {"d": 3, "f": 5}, "e": {"g": 6}}
+
+
+def test_merge_patch_copies_objects():
+    patch = {"b": {"c": 1}}
+    target = {}
+
+    merge_patch(target, patch)
+    patch["b"]["c"] = 2
+
+    assert target == {"b": {"c": 1}}
+
+
+def test_combine_patches_keeps_removals():
+    first = {"a": 1, "b": {"c": 2}}
+
+    combine_patches(first, {"a": None, "b": {"d": 3}})
+
+    assert first == {"a": None, "b": {"c": 2, "d": 3}}
+
+
+def test_combined_patch_has_the_same_effect():
+    first = {"a": {"b": 1}, "c": 2}
+    second = {"a": {"b": None, "d": 3}, "c": {"e": 4}}
+    in_turn = {"a": {"b": 0, "f": 5}, "c": 1}
+    merge_patch(in_turn, first)
+    merge_patch(in_turn, second)
+
+    combined = {"a": {"b": 1}, "c": 2}
+    combine_patches(combined, second)
+    at_once = {"a": {"b": 0, "f": 5}, "c": 1}
+    merge_patch(at_once, combined)
+
+    assert at_once == in_turn
+
+
+def test_minimal_patch_drops_unchanged_values():
+    state = {"a": 1, "b": {"c": 2, "d": 3}}
+
+    assert minimal_patch(state, {"a": 1, "b": {"c": 2, "d": 4}}) == {"b": {"d": 4}}
+    assert minimal_patch(state, {"a": 1, "b": {"c": 2}}) == {}
+
+
+def test_minimal_patch_compares_json_types():
+    state = {"a": 1, "b": True}
+
+    assert minimal_patch(state, {"a": 1.0, "b": 1}) == {"a": 1.0, "b": 1}
+
+
+def test_minimal_patch_keeps_removals_when_incomplete():
+    assert minimal_patch({}, {"a": None}) == {}
+    assert minimal_patch({}, {"a": None}, complete=False) == {"a": None}
+
+
+def test_patches_apply_in_version_order():
+    cache = TwinCache()
+    assert cache.apply_desired_patch({"a": 1}, 2) == PATCH_GAP
+
+    cache.load({"desired": {"$version": 3, "a": 1}, "reported": {"$version": 1}})
+    assert cache.apply_desired_patch({"a": 2}, 3) == PATCH_STALE
+    assert cache.apply_desired_patch({"a": 2}, 4) == PATCH_APPLIED
+    assert cache.apply_desired_patch({"a": 3}, 6) == PATCH_GAP
+
+    assert cache.get_desired("a") == 2
+    assert cache.desired_version == 4
+    assert (cache.stale_patches, cache.gaps) == (1, 2)
+
+
+def test_lookup_by_path():
+    cache = TwinCache()
+    cache.load({"desired": {"$version": 1, "config": {"rate": 5}}, "reported": {"$version": 1}})
+
+    assert cache.get_desired("config.rate") == 5
+    assert cache.get_desired("config.missing", "default") == "default"
+    assert cache.get_desired("config.rate.deeper") is None
+    assert cache.get_twin()["desired"] == {"$version": 1, "config": {"rate": 5}}
+
+
+def _connect(broker):
+    logger = logging.getLogger("test")
+    logger.setLevel(logging.CRITICAL)
+    clients = []
+
+    def transport(**kwargs):
+        clients.append(broker.transport(**kwargs))
+        return clients[-1]
+
+    device = IoTHubDevice(
+        None,
+        None,
+        "HostName=loopback.azure-devices.net;DeviceId=device;SharedAccessKey=bG9vcGJhY2s=",
+        logger=logger,
+        transport=transport,
+        twin_cache=TwinCache(),
+    )
+    device.connect()
+    device.loop()
+    return device, clients[-1]
+
+
+def test_redelivered_patch_is_ignored():
+    broker = LoopbackBroker()
+    device, client = _connect(broker)
+    patched = []
+    device.on_device_twin_desired_patched = lambda patch, version: patched.append(version)
+
+    broker.update_desired_properties("device", {"rate": 5})
+    redelivered = list(client._inbox)
+    device.loop()
+    client._inbox.extend(redelivered)
+    device.loop()
+
+    assert patched == [2]
+    assert device.twin_cache.stale_patches == 1
+    assert device.twin_cache.get_desired("rate") == 5
+
+
+def test_missed_patch_fetches_the_twin():
+    broker = LoopbackBroker()
+    device, client = _connect(broker)
+    twin_gets = broker.twin_get_count
+
+    broker.update_desired_properties("device", {"rate": 5})
+    # The notification is lost
+    client._inbox.clear()
+    broker.update_desired_properties("device", {"mode": "fast"})
+    device.loop()
+    device.loop()
+
+    assert broker.twin_get_count == twin_gets + 1
+    assert device.twin_cache.gaps == 1
+    assert device.twin_cache.desired_version == 3
+    assert device.twin_cache.get_desired() == {"rate": 5, "mode": "fast"}
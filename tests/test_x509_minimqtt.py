@@ -0,0 +1,186 @@
+# SPDX-FileCopyrightText: 2026 Adafruit Industries
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import socket
+import struct
+import threading
+
+import adafruit_logging as logging
+import pytest
+
+from adafruit_azureiot import IoTCentralDevice, IoTHubDevice
+from adafruit_azureiot.transport import minimqtt_transport
+
+
+def _string(value: str) -> bytes:
+    value = value.encode("utf-8")
+    return struct.pack(">H", len(value)) + value
+
+
+def _remaining_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+class LocalBroker:
+    """A minimal MQTT 3.1.1 broker on localhost that answers DPS registrations, so real
+    MiniMQTT clients can connect without TLS"""
+
+    def __init__(self):
+        self.connects = []
+        """The ``(client_id, username, password)`` of each connection"""
+        self._server = socket.socket()
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen(8)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def transport(self, **kwargs):
+        kwargs.update(
+            broker="127.0.0.1", port=self.port, is_ssl=False, socket_pool=socket, ssl_context=None
+        )
+        return minimqtt_transport(**kwargs)
+
+    def close(self):
+        self._server.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    @staticmethod
+    def _read(client, size):
+        data = b""
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def _read_packet(self, client):
+        header = self._read(client, 1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self._read(client, 1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                return header, self._read(client, length)
+
+    @staticmethod
+    def _publish(client, topic, payload):
+        body = _string(topic) + payload.encode("utf-8")
+        client.sendall(b"\x30" + _remaining_length(len(body)) + body)
+
+    def _on_connect(self, client, body):
+        flags, offset = body[7], 10
+        fields = []
+        for present in (True, flags & 0x80, flags & 0x40):
+            if not present:
+                fields.append(None)
+                continue
+            length = struct.unpack(">H", body[offset : offset + 2])[0]
+            fields.append(body[offset + 2 : offset + 2 + length].decode("utf-8"))
+            offset += 2 + length
+        self.connects.append(tuple(fields))
+        client.sendall(bytes([0x20, 2, 0, 0]))
+
+    def _on_publish(self, client, header, body):
+        length = struct.unpack(">H", body[:2])[0]
+        topic = body[2 : 2 + length].decode("utf-8")
+        if header & 0x06:
+            client.sendall(bytes([0x40, 2]) + body[2 + length : 4 + length])
+
+        request_id = topic.split("$rid=")[-1].split("&")[0]
+        if topic.startswith("$dps/registrations/PUT/"):
+            self._publish(
+                client,
+                f"$dps/registrations/res/202/?$rid={request_id}&retry-after=0",
+                json.dumps({"operationId": "operation", "status": "assigning"}),
+            )
+        elif topic.startswith("$dps/registrations/GET/"):
+            state = {"status": "assigned", "assignedHub": "hub.example.net"}
+            self._publish(
+                client,
+                f"$dps/registrations/res/200/?$rid={request_id}",
+                json.dumps({"status": "assigned", "registrationState": state}),
+            )
+
+    def _serve(self, client):
+        try:
+            while True:
+                header, body = self._read_packet(client)
+                packet_type = header & 0xF0
+                if packet_type == 0x10:
+                    self._on_connect(client, body)
+                elif packet_type == 0x80:
+                    client.sendall(bytes([0x90, 3]) + body[:2] + body[-1:])
+                elif packet_type == 0x30:
+                    self._on_publish(client, header, body)
+                elif packet_type == 0xC0:
+                    client.sendall(bytes([0xD0, 0]))
+                elif packet_type == 0xE0:
+                    break
+        except (EOFError, OSError):
+            pass
+        client.close()
+
+
+@pytest.fixture
+def broker():
+    local_broker = LocalBroker()
+    yield local_broker
+    local_broker.close()
+
+
+@pytest.fixture
+def logger():
+    test_logger = logging.getLogger("test")
+    test_logger.setLevel(logging.CRITICAL)
+    return test_logger
+
+
+def test_hub_x509_connects_with_minimqtt(broker, logger):
+    device = IoTHubDevice(
+        socket,
+        None,
+        "HostName=hub.example.net;DeviceId=x509-device;x509=true",
+        transport=broker.transport,
+        logger=logger,
+    )
+
+    device.connect()
+    assert device.is_connected()
+    device.disconnect()
+
+    connection = broker.connects[-1]
+    assert connection[0] == "x509-device"
+    assert connection[1].startswith("hub.example.net/x509-device/")
+    # An empty password, rather than none, as the username is set
+    assert connection[2:] == ("",)
+
+
+def test_central_x509_registers_and_connects_with_minimqtt(broker, logger):
+    device = IoTCentralDevice(
+        socket, None, "0ne00000000", "x509-device", None, transport=broker.transport, logger=logger
+    )
+
+    device.connect()
+    assert device.is_connected()
+    device.disconnect()
+
+    dps, hub = broker.connects[-2:]
+    assert dps[1].startswith("0ne00000000/registrations/x509-device/")
+    assert hub[1].startswith("hub.example.net/x509-device/")
+    assert (dps[2], hub[2]) == ("", "")